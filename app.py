@@ -1,12 +1,15 @@
+import argparse
+import os
 from flask import Flask, render_template
-from routes import api  # CHANGE: We no longer need build_network_graph
-from realtime import socketio
-from config import SERVER_PORT
+from routes import api, install_reload_signal
+from realtime import socketio, server_options
+from telemetry import metrics_response
+from config import SERVER_PORT, PROD_WORKERS, PROD_ASYNC_MODE, MESSAGE_QUEUE
 
 # --- Application Setup ---
 
-# The data loading is now handled automatically when routes.py is imported.
-# We no longer need to call build_network_graph() here.
+# The network is loaded lazily by routes.get_network() on first use, from the
+# compiled artifact that database.py writes (or from SQLite if there is none).
 
 # 1. Create the main Flask application instance.
 app = Flask(__name__)
@@ -16,7 +19,8 @@ app.config['SECRET_KEY'] = 'e75893054b24a8027e6c37e689e23fede6da697c6b1713331f6e
 app.register_blueprint(api, url_prefix='/api')
 
 # 3. Initialize the Socket.IO server with the Flask app.
-socketio.init_app(app)
+# In production workers, server_options() adds the async mode and message queue.
+socketio.init_app(app, **server_options())
 
 
 # --- Route Definitions ---
@@ -26,11 +30,39 @@ def index():
     """Serves the main HTML file for the single-page application kiosk."""
     return render_template('index.html')
 
+@app.route('/metrics')
+def metrics():
+    """
+    Prometheus metrics of this process (see telemetry.py). In production mode
+    each worker also serves its own on METRICS_PORT_BASE + worker index.
+    """
+    return metrics_response()
+
 
 # --- Main Execution ---
 
 if __name__ == '__main__':
-    # Use socketio.run() to start a server that supports both standard HTTP and WebSockets.
-    # The port is managed in the central config.py file.
-    print(f"--- Starting Flask-SocketIO server on http://127.0.0.1:{SERVER_PORT} ---")
-    socketio.run(app, host="0.0.0.0", port=SERVER_PORT, debug=True, allow_unsafe_werkzeug=True)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Runs the metro tracking server.")
+    parser.add_argument('--mode', choices=['dev', 'prod'], default='dev',
+                        help="dev: single Werkzeug process with debug; prod: async workers sharing a message queue.")
+    parser.add_argument('--workers', type=int, default=PROD_WORKERS, help="prod only: number of worker processes.")
+    parser.add_argument('--async-mode', choices=['eventlet', 'gevent'], default=PROD_ASYNC_MODE,
+                        help="prod only: async worker type.")
+    parser.add_argument('--message-queue', default=MESSAGE_QUEUE,
+                        help="prod only: 'local' (built-in broker), redis://... or a kombu URL.")
+    args = parser.parse_args()
+
+    if args.mode == 'prod':
+        import server
+        server.run(args.workers, args.async_mode, args.message_queue, port=SERVER_PORT)
+    else:
+        # Use socketio.run() to start a server that supports both standard HTTP and WebSockets.
+        # The port is managed in the central config.py file.
+        print(f"--- Starting Flask-SocketIO server on http://127.0.0.1:{SERVER_PORT} ---")
+        # `kill -HUP <pid>` reloads the dataset without a restart (see routes.reload_network).
+        # Debug mode runs this script twice: the reloader process, and the child
+        # (WERKZEUG_RUN_MAIN) that serves requests. Only the child reloads.
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            install_reload_signal()
+            print(f"--- Send SIGHUP to pid {os.getpid()} to reload the dataset ---")
+        socketio.run(app, host="0.0.0.0", port=SERVER_PORT, debug=True, allow_unsafe_werkzeug=True)
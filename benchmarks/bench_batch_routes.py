@@ -0,0 +1,52 @@
+# benchmarks/bench_batch_routes.py
+"""
+Compares the throughput of POST /api/routes/batch with N individual
+GET /api/route calls, using Flask's in-process test client (no network).
+
+Run from the project root after `python database.py`:
+    python benchmarks/bench_batch_routes.py [N]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+import routes  # noqa: E402
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = random.Random(42)
+    pairs = [rng.sample(routes.get_network().station_names, 2) for _ in range(n)]
+    client = app.test_client()
+
+    # --- N individual /api/route calls ---
+    start = time.perf_counter()
+    for origin, destination in pairs:
+        client.get('/api/route', query_string={'from': origin, 'to': destination})
+    single_s = time.perf_counter() - start
+
+    # --- One batch call (JSON body and NDJSON stream back) ---
+    start = time.perf_counter()
+    response = client.post('/api/routes/batch', json=pairs)
+    lines = response.get_data().count(b'\n')
+    batch_s = time.perf_counter() - start
+    assert lines == n, f"expected {n} result lines, got {lines}"
+
+    # --- Batch call without paths (totals only) ---
+    start = time.perf_counter()
+    client.post('/api/routes/batch?paths=0', json=pairs)
+    totals_s = time.perf_counter() - start
+
+    print(f"\n--- {n} origin/destination pairs ---")
+    print(f"individual /api/route : {single_s:8.3f} s  ({n / single_s:10.0f} pairs/s)")
+    print(f"/api/routes/batch     : {batch_s:8.3f} s  ({n / batch_s:10.0f} pairs/s)")
+    print(f"batch, ?paths=0       : {totals_s:8.3f} s  ({n / totals_s:10.0f} pairs/s)")
+    print(f"speed-up (with paths) : {single_s / batch_s:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
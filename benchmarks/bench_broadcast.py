@@ -0,0 +1,86 @@
+# benchmarks/bench_broadcast.py
+"""
+Frames and bytes per second that one viewer receives, before and after
+coalescing train updates into per-tick delta frames.
+
+"before": one 'new_train_position' JSON message per train update (old realtime.py).
+"after":  one 'train_frame' per tick and room (realtime.take_frames), as JSON
+          and msgpack for a whole-network viewer, and as JSON for viewers
+          subscribed to one line or to a city-centre bounding box.
+
+Sizes are the exact Socket.IO packets python-socketio would put on the wire.
+Run from the project root after `python database.py`:
+    python benchmarks/bench_broadcast.py [TRAINS] [SECONDS]
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from socketio import packet  # noqa: E402
+from config import KAJANG_LINE, KELANA_JAYA_LINE  # noqa: E402
+from fleet import FleetSimulator, load_network  # noqa: E402
+import realtime  # noqa: E402
+
+
+def packet_bytes(event, data):
+    encoded = packet.Packet(packet.EVENT, data=[event, data]).encode()
+    if isinstance(encoded, list):  # binary packets: header + attachments
+        return sum(len(part) for part in encoded), len(encoded)
+    return len(encoded), 1
+
+
+def main():
+    trains = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 240
+    rng = random.Random(3)
+    fleet = FleetSimulator(*load_network())
+    for _ in range(trains):
+        line = rng.choice([KAJANG_LINE, KELANA_JAYA_LINE])
+        fleet.add_train(line if rng.random() < 0.5 else line[::-1], rng.uniform(0, 30))
+
+    # One fake viewer per subscription; only the bookkeeping is needed here.
+    viewers = {
+        'after, all, JSON': ('json', {realtime.ALL_ROOM}),
+        'after, all, msgpack': ('msgpack', {realtime.ALL_ROOM}),
+        'after, one line, JSON': ('json', realtime.resolve_subscription({'line': 'Kajang Line'})),
+        'after, bbox, JSON': ('json', realtime.resolve_subscription({'bbox': [3.13, 101.68, 3.17, 101.72]})),
+    }
+    if realtime.msgpack is None:
+        del viewers['after, all, msgpack']
+    for label, (fmt, keys) in viewers.items():
+        realtime.set_subscription(label, fmt, keys)
+
+    stats = {label: {'frames': 0, 'bytes': 0} for label in ['before (per update)'] + list(viewers)}
+    for t in range(seconds):
+        arrivals, finished = fleet.tick(float(t))
+        for slot, station_id in zip(arrivals.tolist(), fleet.current_station(arrivals).tolist()):
+            train_id, station = fleet.train_id(slot), fleet.names[station_id]
+            size, _ = packet_bytes('new_train_position', {'train_id': train_id, 'current_station': station})
+            stats['before (per update)']['frames'] += 1
+            stats['before (per update)']['bytes'] += size
+            realtime.record_update(train_id, station)
+        for slot in finished.tolist():
+            realtime.record_finished(fleet.train_id(slot))
+
+        frames = realtime.take_frames()
+        for label, (fmt, keys) in viewers.items():
+            for key in keys & frames.keys():
+                if fmt == 'msgpack':
+                    size, parts = packet_bytes('train_frame_bin', realtime.msgpack.packb(frames[key]))
+                else:
+                    size, parts = packet_bytes('train_frame', frames[key])
+                stats[label]['frames'] += parts
+                stats[label]['bytes'] += size
+
+    print(f"\n--- Per viewer, {trains} trains over {seconds} s ---")
+    print(f"{'mode':<24}{'frames/s':>12}{'bytes/s':>14}")
+    for label, totals in stats.items():
+        print(f"{label:<24}{totals['frames'] / seconds:>12.1f}{totals['bytes'] / seconds:>14.0f}")
+    if realtime.msgpack is None:
+        print("(msgpack is not installed; binary frames were not measured)")
+
+
+if __name__ == '__main__':
+    main()
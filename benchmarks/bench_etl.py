@@ -0,0 +1,92 @@
+# benchmarks/bench_etl.py
+"""
+database.py build times on a synthetic N-station network (default 1,000, so
+two 1,000 x 1,000 CSV matrices with about a million cells each):
+
+- full:                 drop every table and load both matrices.
+- incremental, no-op:   the sources did not change (hash check only).
+- incremental, 1%:      1% of the fare and time cells changed (undone again by the +20 run).
+- incremental, +20:     20 new stations added as extra rows and columns.
+
+The network artifact is not compiled here; only the SQLite load is timed.
+Run from the project root:
+    python benchmarks/bench_etl.py [N]
+"""
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+def write_matrices(directory, names, changed_fraction=0.0, seed=1):
+    """
+    Writes Fare.csv and Time.csv. Base values depend only on the station pair,
+    so adding stations leaves the existing cells unchanged.
+    """
+    for filename, label in (('Fare.csv', 'Fare'), ('Time.csv', 'Time')):
+        noise = random.Random(seed)
+        with open(os.path.join(directory, filename), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow([label] + names)
+            for i, origin in enumerate(names):
+                row = []
+                for j in range(len(names)):
+                    step = (i * 7919 + j * 104729) % 88
+                    cell = 0 if i == j else (round(0.8 + step / 10, 2) if label == 'Fare' else 2 + step)
+                    if changed_fraction and noise.random() < changed_fraction:
+                        cell = cell + 1
+                    row.append(cell)
+                writer.writerow([origin] + row)
+
+
+def timed(label, db_file, directory, full=False):
+    start = time.perf_counter()
+    summary = database.initialize_database(
+        db_file, os.path.join(directory, 'Fare.csv'), os.path.join(directory, 'Time.csv'),
+        full=full, compile_network=False)
+    elapsed = time.perf_counter() - start
+    return label, elapsed, summary
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    names = [f"Station {i:04d}" for i in range(n)]
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        db_file = os.path.join(directory, 'bench.sqlite')
+
+        write_matrices(directory, names)
+        results.append(timed('full', db_file, directory, full=True))
+        results.append(timed('incremental, no-op', db_file, directory))
+
+        write_matrices(directory, names, changed_fraction=0.01)
+        results.append(timed('incremental, 1% changed', db_file, directory))
+
+        extra = names + [f"New Line {i:02d}" for i in range(20)]
+        write_matrices(directory, extra)
+        results.append(timed('incremental, +20 stations', db_file, directory))
+
+        write_matrices(directory, names)
+        results.append(timed('full (again)', db_file, directory, full=True))
+
+    print(f"\n--- database.py on {n} stations ({n * n:,} cells per matrix) ---")
+    print(f"{'build':<28}{'seconds':>10}   rows written (fares / times)")
+    for label, elapsed, summary in results:
+        changes = summary["changes"]
+        if summary["mode"] == "incremental":
+            written = f"{sum(changes['fares']):,} / {sum(changes['times']):,}"
+        elif summary["mode"] == "full":
+            written = f"{changes['fares']:,} / {changes['times']:,}"
+        else:
+            written = "0 / 0"
+        print(f"{label:<28}{elapsed:>10.2f}   {written}")
+
+
+if __name__ == '__main__':
+    main()
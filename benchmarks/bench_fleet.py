@@ -0,0 +1,53 @@
+# benchmarks/bench_fleet.py
+"""
+Measures how much of a 1 Hz tick budget the fleet simulation uses with
+thousands of concurrent trains (no sockets involved).
+
+Run from the project root after `python database.py`:
+    python benchmarks/bench_fleet.py [TRAINS] [TICKS]
+"""
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import KAJANG_LINE, KELANA_JAYA_LINE  # noqa: E402
+from fleet import FleetSimulator, load_network  # noqa: E402
+
+
+def main():
+    trains = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 120
+    rng = random.Random(7)
+    fleet = FleetSimulator(*load_network())
+
+    # Random sub-journeys along both lines and directions, departing over the first minute.
+    for _ in range(trains):
+        line = rng.choice([KAJANG_LINE, KELANA_JAYA_LINE])
+        a, b = sorted(rng.sample(range(len(line)), 2))
+        path = line[a:b + 1] if rng.random() < 0.5 else line[a:b + 1][::-1]
+        fleet.add_train(path, rng.uniform(0, 60))
+
+    tick_ms, arrivals_total = [], 0
+    for t in range(ticks):
+        start = time.perf_counter()
+        arrivals, _ = fleet.tick(float(t))
+        fleet.current_station(arrivals)
+        fleet.positions(float(t))
+        tick_ms.append((time.perf_counter() - start) * 1000)
+        arrivals_total += len(arrivals)
+
+    tick_ms = np.array(tick_ms[1:])  # the first tick also admits every queued train
+    print(f"\n--- {trains} trains, {ticks} simulated 1 s ticks ---")
+    print(f"tick cost   : mean {tick_ms.mean():.2f} ms, p99 {np.percentile(tick_ms, 99):.2f} ms, max {tick_ms.max():.2f} ms")
+    print(f"budget used : {tick_ms.mean() / 10:.2f}% of a 1 Hz tick on one core")
+    print(f"arrivals    : {arrivals_total} ({arrivals_total / ticks:.0f} per tick)")
+    print(f"still active: {fleet.active_count()}")
+
+
+if __name__ == '__main__':
+    main()
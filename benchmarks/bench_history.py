@@ -0,0 +1,101 @@
+# benchmarks/bench_history.py
+"""
+Train position history under a 10,000 updates/s load: the cost of one
+realtime.record_update() with and without the history append, memory after
+the ring buffer has wrapped several times over a fleet that keeps changing,
+and /api/trains/history query times on a full buffer.
+
+Run from the project root after `python database.py`:
+    python benchmarks/bench_history.py [EVENTS]
+"""
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from config import TRAIN_HISTORY_MAX_EVENTS  # noqa: E402
+from history import PositionHistory  # noqa: E402
+import realtime  # noqa: E402
+
+UPDATES_PER_SECOND = 10000
+FLEET = 2000
+
+
+def feed(first, count, names, start_time):
+    """Appends updates number first..first+count-1 at UPDATES_PER_SECOND, replacing trains as they finish."""
+    history = realtime.train_history
+    for i in range(first, first + count):
+        train = i % FLEET + (i // (FLEET * 50)) * FLEET   # every train retires after 50 updates
+        history.append(train, f"Train-{train}", i % len(names), start_time + i / UPDATES_PER_SECOND)
+
+
+def main():
+    events = max(int(sys.argv[1]) if len(sys.argv) > 1 else 4 * TRAIN_HISTORY_MAX_EVENTS, TRAIN_HISTORY_MAX_EVENTS)
+    net = realtime.state_network()
+    names = net.station_names
+    updates = [[f"Train-{i % FLEET}", names[i % len(names)]] for i in range(100000)]
+
+    # --- Cost per update ---
+    rows = []
+    for label, capacity in (('record_update, no history', 1), ('record_update + history', TRAIN_HISTORY_MAX_EVENTS)):
+        realtime.train_history = PositionHistory(capacity)
+        if capacity == 1:
+            realtime.train_history.append = lambda *args: None
+        start = time.perf_counter()
+        for train_id, station in updates:
+            realtime.record_update(train_id, station)
+        rows.append((label, (time.perf_counter() - start) * 1e9 / len(updates)))
+        realtime.take_frames()
+
+    # --- Append cost, and memory once the buffer has wrapped ---
+    start_time = time.time() - events / UPDATES_PER_SECOND
+    realtime.train_history = PositionHistory(TRAIN_HISTORY_MAX_EVENTS)
+    started = time.perf_counter()
+    feed(0, events, names, start_time)
+    append_ns = (time.perf_counter() - started) * 1e9 / events
+
+    realtime.train_history = history = PositionHistory(TRAIN_HISTORY_MAX_EVENTS)
+    tracemalloc.start()   # counts what appending allocates; the arrays themselves already exist
+    feed(0, TRAIN_HISTORY_MAX_EVENTS, names, start_time)
+    full = tracemalloc.get_traced_memory()[0]
+    feed(TRAIN_HISTORY_MAX_EVENTS, events - TRAIN_HISTORY_MAX_EVENTS, names, start_time)
+    wrapped = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    buffer_mb = (history.times.nbytes + history.trains.nbytes + history.stations.nbytes) / 1e6
+
+    # --- Queries on the full buffer ---
+    client = app.test_client()
+    now = history.times[(history.written - 1) % history.capacity]
+    some_train = history.names[next(iter(history.names))]
+    queries = [
+        ('last 1 s, all trains', {'since': now - 1}),
+        ('last 10 s, limit 1000', {'since': now - 10, 'limit': 1000}),
+        ('one train, whole buffer', {'train_id': some_train}),
+    ]
+
+    print(f"\n--- {UPDATES_PER_SECOND:,} updates/s, ring buffer of {TRAIN_HISTORY_MAX_EVENTS:,} events ---")
+    for label, ns in rows:
+        print(f"{label:<34}{ns:>10.0f} ns/update")
+    print(f"{'history append alone':<34}{append_ns:>10.0f} ns/update")
+    print(f"{'ring buffer arrays':<34}{buffer_mb:>10.1f} MB")
+    print(f"{'other memory when first full':<34}{full / 1e6:>10.1f} MB")
+    print(f"{'... after ' + format(history.written, ',') + ' events':<34}{wrapped / 1e6:>10.1f} MB"
+          f"  (names of the {len(history.names):,} trains still in the buffer)")
+    print(f"\n{'query':<28}{'events':>8}{'mean ms':>10}{'p99 ms':>10}")
+    for label, params in queries:
+        timings = []
+        for _ in range(20):
+            start = time.perf_counter()
+            response = client.get('/api/trains/history', query_string=params)
+            timings.append((time.perf_counter() - start) * 1000)
+        count = len(response.get_json()['events'])
+        p99 = statistics.quantiles(timings, n=100)[-1]
+        print(f"{label:<28}{count:>8,}{statistics.mean(timings):>10.2f}{p99:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
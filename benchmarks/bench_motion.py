@@ -0,0 +1,96 @@
+# benchmarks/bench_motion.py
+"""
+Cost of the two smooth-movement feeds for N trains (default 1,000, 10,000
+and 100,000) on the real network:
+
+- positions: motion.MotionTable.positions(), the vectorized interpolation
+  behind the 2 Hz 'train_positions' stream, against a per-train Python loop.
+- bytes per train and minute that a client receives (compact JSON) from
+  segment records ("m" in the frames), from the quantized position stream,
+  and from sending raw float coordinates for every train at the same rate.
+
+Run from the project root (after database.py):
+    python benchmarks/bench_motion.py [N ...]
+"""
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DWELL_SECONDS, POSITION_STREAM_HZ, POSITION_STREAM_SCALE, SIMULATION_SPEEDUP  # noqa: E402
+from motion import MotionTable  # noqa: E402
+from routes import get_network  # noqa: E402
+
+REPEATS = 20
+SEGMENT_SECONDS = 2.5 * 60 / SIMULATION_SPEEDUP   # a typical Time.csv hop, sped up like the simulator
+
+
+def fill(table, trains, stations, now, rng):
+    """Puts every train on a random segment that is under way at `now`."""
+    for short_id in range(trains):
+        origin, destination = rng.integers(0, stations, 2)
+        depart = now - rng.uniform(0, SEGMENT_SECONDS)
+        table.travel(short_id, origin, destination, depart, depart + SEGMENT_SECONDS)
+
+
+def python_positions(table, now, lats, lons):
+    result = []
+    for slot in np.flatnonzero(table.active).tolist():
+        a, b = table.origin[slot], table.destination[slot]
+        frac = min(1.0, max(0.0, (now - table.depart[slot]) / (table.arrive[slot] - table.depart[slot])))
+        result.append((int(table.short_ids[slot]), round((lats[a] + frac * (lats[b] - lats[a])) * POSITION_STREAM_SCALE),
+                       round((lons[a] + frac * (lons[b] - lons[a])) * POSITION_STREAM_SCALE)))
+    return result
+
+
+def timed_ms(fn):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def compact_size(payload):
+    return len(json.dumps(payload, separators=(',', ':')))
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    net = get_network()
+    lats, lons = np.nan_to_num(net.lats, nan=3.1), np.nan_to_num(net.lons, nan=101.7)
+    rng = np.random.default_rng(1)
+    now = time.time()
+
+    print(f"{'trains':>9}{'positions()':>14}{'python loop':>14}{'segments':>14}{'2 Hz stream':>14}{'2 Hz floats':>14}")
+    for trains in sizes:
+        table = MotionTable()
+        fill(table, trains, len(net.station_names), now, rng)
+        vectorized = timed_ms(lambda: table.positions(now, lats, lons, POSITION_STREAM_SCALE))
+        looped = timed_ms(lambda: python_positions(table, now, lats, lons)) if trains <= 10000 else float('nan')
+
+        ids, lat, lon = table.positions(now, lats, lons, POSITION_STREAM_SCALE)
+        stream = compact_size({"t": round(now, 2), "ids": ids.tolist(), "lat": lat.tolist(), "lon": lon.tolist()})
+        floats = compact_size({"t": round(now, 2), "ids": ids.tolist(),
+                               "lat": (lat / POSITION_STREAM_SCALE).tolist(),
+                               "lon": (lon / POSITION_STREAM_SCALE).tolist()})
+        # One "m" record per segment, plus the "t" arrival that ends it.
+        segments = (table.segment(short_id) for short_id in range(min(trains, 1000)))
+        records = [[short_id] + segment for short_id, segment in enumerate(segments) if segment]
+        per_segment = (compact_size({"m": records}) + compact_size({"t": [[r[0], r[2]] for r in records]})) / len(records)
+        segments_per_minute = 60 / (SEGMENT_SECONDS + DWELL_SECONDS / SIMULATION_SPEEDUP)
+        per_minute = 60 * POSITION_STREAM_HZ / trains
+        print(f"{trains:>9,}{vectorized:>11.2f} ms{looped:>11.2f} ms"
+              f"{per_segment * segments_per_minute:>11.0f} B/min{stream * per_minute:>9.0f} B/min"
+              f"{floats * per_minute:>9.0f} B/min")
+    print("\nBytes are per train and minute of movement, as received by one client.")
+
+
+if __name__ == '__main__':
+    main()
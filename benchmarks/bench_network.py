@@ -0,0 +1,124 @@
+# benchmarks/bench_network.py
+"""
+Loading and routing on synthetic networks of growing size (see
+harness.synthetic_network), in process:
+
+- load_from_sqlite: the SQLite/pandas loader plus the all-pairs route table
+  compile (what database.py and a ?source=sqlite reload run).
+- load_artifact: the memory-mapped startup path of the server.
+- routing engine: building routing.RoutingEngine over the loaded network.
+- /api/route (get_route) through Flask's test client, for random station pairs,
+  with the route cache cleared before every request, and once as a cache hit.
+
+Run from the project root:
+    python benchmarks/bench_network.py [--sizes 100,300,1000] [--output results.json]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from harness import percentiles, synthetic_database, write_results  # noqa: E402
+from network import artifact_dir, load_artifact, load_from_sqlite  # noqa: E402
+from routing import RoutingEngine  # noqa: E402
+from config import TRANSFER_PENALTIES  # noqa: E402
+
+ROUTE_QUERIES = {
+    'hops (table)': {'optimize': 'hops'},
+    'time (search)': {'optimize': 'time'},
+    'fare (search)': {'optimize': 'fare'},
+    'time, k=3': {'optimize': 'time', 'k': 3},
+}
+
+
+def timed_ms(fn, repeats):
+    """Median wall time of fn() in milliseconds, and its last result."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+
+def bench_size(stations, queries, repeats, seed=1):
+    with tempfile.TemporaryDirectory(prefix='metro-bench-') as directory:
+        return bench_database(*synthetic_database(stations, directory, seed), queries, repeats, seed)
+
+
+def bench_database(db_file, network, build, queries, repeats, seed):
+    from app import app
+    import routes
+
+    stations = len(network["names"])
+    result = {"stations": stations, "lines": len(network["lines"]), "connections": len(network["connections"]),
+              "write_database_s": round(build["write_database_s"], 3)}
+    result["load_from_sqlite_ms"], _ = timed_ms(lambda: load_from_sqlite(db_file), repeats)
+    result["load_artifact_ms"], net = timed_ms(lambda: load_artifact(artifact_dir(db_file)), repeats)
+    result["routing_engine_ms"], _ = timed_ms(lambda: RoutingEngine(net, TRANSFER_PENALTIES), repeats)
+
+    # Point the API at the synthetic database.
+    routes.DATABASE_NAME = db_file
+    routes.reload_network()
+    client = app.test_client()
+    rng = random.Random(seed)
+    names = network["names"]
+    pairs = [tuple(rng.sample(names, 2)) for _ in range(queries)]
+    result["route"] = {}
+    for label, params in ROUTE_QUERIES.items():
+        timings = []
+        for origin, destination in pairs:
+            routes.route_cache.clear()
+            start = time.perf_counter()
+            response = client.get('/api/route', query_string={'from': origin, 'to': destination, **params})
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, (response.status_code, response.get_data(as_text=True))
+        result["route"][label] = percentiles(timings)
+    timings = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        client.get('/api/route', query_string={'from': pairs[0][0], 'to': pairs[0][1], 'optimize': 'time'})
+        timings.append((time.perf_counter() - start) * 1000)
+    result["route"]["cache hit"] = percentiles(timings)
+    for key in ("load_from_sqlite_ms", "load_artifact_ms", "routing_engine_ms"):
+        result[key] = round(result[key], 3)
+    return result
+
+
+def run(sizes=(100, 300, 1000), queries=200, repeats=3):
+    """Benchmarks every network size. Returns the list of per-size results."""
+    return [bench_size(stations, queries, repeats) for stations in sizes]
+
+
+def print_results(results):
+    print(f"\n{'stations':>9}{'lines':>7}{'sqlite load':>14}{'artifact load':>15}{'engine':>10}")
+    for r in results:
+        print(f"{r['stations']:>9,}{r['lines']:>7}{r['load_from_sqlite_ms']:>11.1f} ms"
+              f"{r['load_artifact_ms']:>12.2f} ms{r['routing_engine_ms']:>7.1f} ms")
+    print(f"\n{'/api/route':<16}" + ''.join(f"{r['stations']:>10,} st p50/p99 ms" for r in results))
+    for label in list(ROUTE_QUERIES) + ['cache hit']:
+        cells = ''.join(f"{r['route'][label]['p50_ms']:>13.2f} /{r['route'][label]['p99_ms']:>7.2f}" for r in results)
+        print(f"{label:<16}{cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,300,1000', help="comma-separated station counts.")
+    parser.add_argument('--queries', type=int, default=200, help="route requests per query type and size.")
+    parser.add_argument('--repeats', type=int, default=3, help="runs per load timing (the median is kept).")
+    parser.add_argument('--output', help="write the results to this JSON file.")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = run(sizes, args.queries, args.repeats)
+    print_results(results)
+    write_results(args.output, 'network', {"sizes": sizes, "queries": args.queries, "repeats": args.repeats},
+                  results)
+
+
+if __name__ == '__main__':
+    main()
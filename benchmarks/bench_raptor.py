@@ -0,0 +1,114 @@
+# benchmarks/bench_raptor.py
+"""
+GTFS import and RAPTOR query times on a synthetic feed: a G x G grid of
+stations (default 20 x 20) with one east-west line per row and one
+north-south line per column. Every line runs both ways every 5 minutes from
+05:00 to midnight, giving about 365,000 stop_times by default. Each line has
+its own platform at a station, so changing lines walks between platforms
+(parent station footpaths, with a longer change listed in transfers.txt for
+every fifth station).
+
+Run from the project root:
+    python benchmarks/bench_raptor.py [G] [QUERIES]
+"""
+import csv
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gtfs  # noqa: E402
+from raptor import RaptorEngine  # noqa: E402
+from config import MAX_TIMETABLE_TRANSFERS  # noqa: E402
+
+HEADWAY_S, RUN_S, DWELL_S = 300, 120, 30
+FIRST_S, LAST_S = 5 * 3600, 24 * 3600
+
+
+def write_feed(directory, g):
+    """Writes stops, routes, trips, stop_times and transfers.txt. Returns the number of stop_times."""
+    def rows(filename, header, body):
+        with open(os.path.join(directory, filename), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(body)
+
+    lines = [(f"H{r}", [(r, c) for c in range(g)]) for r in range(g)] + \
+            [(f"V{c}", [(r, c) for r in range(g)]) for c in range(g)]
+    stops = [(f"S{r}-{c}", f"Station {r}-{c}", 3.0 + r * 0.01, 101.0 + c * 0.01, 1, '')
+             for r in range(g) for c in range(g)]
+    stops += [(f"S{r}-{c}-{line}", f"Station {r}-{c} ({line})", 3.0 + r * 0.01, 101.0 + c * 0.01, 0, f"S{r}-{c}")
+              for line, cells in lines for r, c in cells]
+    rows('stops.txt', ['stop_id', 'stop_name', 'stop_lat', 'stop_lon', 'location_type', 'parent_station'], stops)
+    rows('routes.txt', ['route_id', 'route_short_name', 'route_type'], [(line, line, 1) for line, _ in lines])
+
+    trips, stop_times = [], []
+    for line, cells in lines:
+        for direction, sequence in ((0, cells), (1, cells[::-1])):
+            for start in range(FIRST_S, LAST_S, HEADWAY_S):
+                trip_id = f"{line}-{direction}-{start}"
+                trips.append((line, 'daily', trip_id, direction))
+                for seq, (r, c) in enumerate(sequence):
+                    arrive = start + seq * (RUN_S + DWELL_S)
+                    depart = arrive + (DWELL_S if 0 < seq < len(sequence) - 1 else 0)
+                    stop_times.append((trip_id, gtfs_time(arrive), gtfs_time(depart), f"S{r}-{c}-{line}", seq + 1))
+    rows('trips.txt', ['route_id', 'service_id', 'trip_id', 'direction_id'], trips)
+    rows('stop_times.txt', ['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence'], stop_times)
+    rows('transfers.txt', ['from_stop_id', 'to_stop_id', 'transfer_type', 'min_transfer_time'],
+         [(f"S{r}-{c}-H{r}", f"S{r}-{c}-V{c}", 2, 180) for r in range(0, g, 5) for c in range(g)])
+    return len(stop_times)
+
+
+def gtfs_time(seconds):
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def main():
+    g = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    with tempfile.TemporaryDirectory() as directory:
+        feed = os.path.join(directory, 'feed')
+        os.makedirs(feed)
+        n_stop_times = write_feed(feed, g)
+
+        start = time.perf_counter()
+        gtfs.import_feed(feed, os.path.join(directory, 'db.timetable'))
+        import_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        timetable = gtfs.load_timetable(os.path.join(directory, 'db.timetable'))
+        engine = RaptorEngine(timetable)
+        load_ms = (time.perf_counter() - start) * 1000
+
+        rng = random.Random(7)
+        stations = sorted(timetable.stops_by_station)
+        cases = [(rng.sample(stations, 2), rng.randrange(6 * 3600, 22 * 3600)) for _ in range(queries)]
+        results = {}
+        for label, max_transfers in (('direct only (0 transfers)', 0),
+                                     (f'pareto (<= {MAX_TIMETABLE_TRANSFERS} transfers)', MAX_TIMETABLE_TRANSFERS)):
+            timings, options, found = [], 0, 0
+            for (origin, destination), depart_at in cases:
+                start = time.perf_counter()
+                journeys = engine.journeys(timetable.stops_for(origin), timetable.stops_for(destination),
+                                           depart_at, max_transfers)
+                timings.append((time.perf_counter() - start) * 1000)
+                options += len(journeys)
+                found += bool(journeys)
+            results[label] = (timings, options / queries, found)
+
+    print(f"\n--- RAPTOR on a {g} x {g} grid: {len(timetable)} stops, {len(timetable.pattern_route)} patterns, "
+          f"{len(timetable.trip_ids):,} trips, {n_stop_times:,} stop_times ---")
+    print(f"GTFS import: {import_s:.2f} s   timetable load (mmap) + engine: {load_ms:.1f} ms")
+    print(f"{'query':<28}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'found':>8}{'options':>9}")
+    for label, (timings, avg_options, found) in results.items():
+        p95 = statistics.quantiles(timings, n=20)[-1]
+        print(f"{label:<28}{statistics.mean(timings):>10.2f}{statistics.median(timings):>10.2f}"
+              f"{p95:>10.2f}{found:>8}{avg_options:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# benchmarks/bench_reachable.py
+"""
+"Where can I get to from here?" for every origin station: one
+shortest_path_tree() pass versus one shortest_path() search per destination,
+and one /api/reachable call versus N-1 /api/route calls through Flask's
+in-process test client. The route cache is cleared before every origin.
+
+Run from the project root after `python database.py`:
+    python benchmarks/bench_reachable.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+import routes  # noqa: E402
+
+
+def main():
+    net, engine, _ = routes.get_loaded()
+    n = len(net)
+    client = app.test_client()
+    timings = {}
+
+    def timed(label, fn):
+        start = time.perf_counter()
+        for origin in range(n):
+            routes.route_cache.clear()
+            fn(origin)
+        timings[label] = (time.perf_counter() - start) * 1000 / n
+
+    timed('engine: N-1 shortest_path()', lambda o: [engine.shortest_path(o, d, 'time') for d in range(n) if d != o])
+    timed('engine: shortest_path_tree()', lambda o: engine.shortest_path_tree(o, 'time'))
+    timed('HTTP: N-1 /api/route', lambda o: [
+        client.get('/api/route', query_string={'from': net.station_names[o], 'to': net.station_names[d],
+                                               'optimize': 'time'})
+        for d in range(n) if d != o])
+    timed('HTTP: /api/reachable', lambda o: client.get('/api/reachable', query_string={'from': net.station_names[o]}))
+    timed('HTTP: /api/reachable?table=1', lambda o: client.get(
+        '/api/reachable', query_string={'from': net.station_names[o], 'table': '1'}))
+
+    print(f"\n--- One origin to all {n - 1} other stations (mean over {n} origins) ---")
+    for label, ms in timings.items():
+        print(f"{label:<32}{ms:>10.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/bench_spatial.py
+"""
+Nearest-station and bounding-box lookups on a synthetic set of N stops
+(default 50,000) spread over the Klang Valley, half of them clustered around
+a few centres like a dense city network. Compares spatial.StationIndex with
+a vectorized scan of every stop, and checks that both give the same answers.
+
+Run from the project root:
+    python benchmarks/bench_spatial.py [N] [QUERIES]
+"""
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spatial import StationIndex, haversine_km  # noqa: E402
+
+SOUTH, WEST, NORTH, EAST = 2.80, 101.30, 3.40, 101.90
+
+
+def synthetic_stops(n, rng):
+    spread = n - n // 2
+    lats = list(rng.uniform(SOUTH, NORTH, spread))
+    lons = list(rng.uniform(WEST, EAST, spread))
+    centres = rng.uniform((SOUTH, WEST), (NORTH, EAST), size=(8, 2))
+    for lat, lon in centres[rng.integers(0, len(centres), n // 2)]:
+        lats.append(lat + rng.normal(0, 0.01))
+        lons.append(lon + rng.normal(0, 0.01))
+    return np.array(lats), np.array(lons)
+
+
+def brute_nearest(lats, lons, lat, lon, k):
+    km = haversine_km(lat, lon, lats, lons)
+    best = np.argpartition(km, k - 1)[:k]
+    return best[np.argsort(km[best])], np.sort(km[best])
+
+
+def brute_within(lats, lons, south, west, north, east):
+    return np.flatnonzero((lats >= south) & (lats <= north) & (lons >= west) & (lons <= east))
+
+
+def timed(fn, cases):
+    timings = []
+    for case in cases:
+        start = time.perf_counter()
+        fn(*case)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return timings
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    rng = np.random.default_rng(3)
+    lats, lons = synthetic_stops(n, rng)
+
+    start = time.perf_counter()
+    index = StationIndex(lats, lons)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    points = rng.uniform((SOUTH, WEST), (NORTH, EAST), size=(queries, 2)).tolist()
+    nearest_cases = [(lat, lon, 5) for lat, lon in points]
+    sizes = rng.uniform(0.005, 0.05, size=queries).tolist()   # ~0.5 to 5 km wide viewports
+    bbox_cases = [(lat, lon, lat + size, lon + size) for (lat, lon), size in zip(points, sizes)]
+
+    # --- Same answers as a full scan ---
+    for lat, lon, k in nearest_cases[:500]:
+        _, km = index.nearest(lat, lon, k)
+        _, expected = brute_nearest(lats, lons, lat, lon, k)
+        assert np.allclose(km, expected), (lat, lon)
+    for bbox in bbox_cases[:500]:
+        assert np.array_equal(index.within(*bbox), brute_within(lats, lons, *bbox)), bbox
+
+    rows = [
+        ('nearest k=5: index', timed(index.nearest, nearest_cases)),
+        ('nearest k=5: full scan', timed(lambda lat, lon, k: brute_nearest(lats, lons, lat, lon, k), nearest_cases)),
+        ('bbox: index', timed(index.within, bbox_cases)),
+        ('bbox: full scan', timed(lambda *bbox: brute_within(lats, lons, *bbox), bbox_cases)),
+    ]
+    print(f"\n--- {n:,} stops in {len(index.cells):,} grid cells (index built in {build_ms:.1f} ms) ---")
+    print(f"{'lookup':<26}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'queries/s':>12}")
+    for label, timings in rows:
+        p99 = statistics.quantiles(timings, n=100)[-1]
+        mean = statistics.mean(timings)
+        print(f"{label:<26}{mean:>10.1f}{statistics.median(timings):>10.1f}{p99:>10.1f}{1e6 / mean:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
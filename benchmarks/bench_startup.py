@@ -0,0 +1,75 @@
+# benchmarks/bench_startup.py
+"""
+Cold start of the API, loading the network from SQLite with Pandas (the old
+loader) versus memory-mapping the compiled artifact written by database.py.
+
+Each run is a fresh Python process that imports the app and serves one
+/api/route request through the Flask test client. It reports the time from
+interpreter start to the first response, and the process's memory after it:
+RSS, and PSS (RSS with shared pages divided among the processes sharing them).
+Run from the project root after `python database.py`:
+    python benchmarks/bench_startup.py [RUNS]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child process. argv[1] is 'sqlite' or 'artifact'.
+CHILD = r'''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[2])
+import network
+if sys.argv[1] == 'sqlite':
+    network.load_artifact = lambda directory: None  # force the old loader
+from app import app
+import routes
+client = app.test_client()
+names = routes.get_network().station_names
+response = client.get('/api/route', query_string={'from': names[0], 'to': names[-1]})
+assert response.status_code == 200, response.status_code
+elapsed_ms = (time.perf_counter() - start) * 1000
+
+def read_kb(path, field):
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+print(json.dumps({
+    'first_request_ms': elapsed_ms,
+    'rss_kb': read_kb('/proc/self/status', 'VmRSS'),
+    'pss_kb': read_kb('/proc/self/smaps_rollup', 'Pss'),
+    'pandas_loaded': 'pandas' in sys.modules,
+}))
+'''
+
+
+def run_once(mode):
+    output = subprocess.run([sys.executable, '-c', CHILD, mode, ROOT], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"\n--- Cold start to first /api/route response, median of {runs} runs ---")
+    print(f"{'loader':<10}{'first request ms':>18}{'RSS MiB':>10}{'PSS MiB':>10}{'pandas':>8}")
+    for mode in ('sqlite', 'artifact'):
+        results = [run_once(mode) for _ in range(runs)]
+        ms = statistics.median(r['first_request_ms'] for r in results)
+        rss = statistics.median(r['rss_kb'] or 0 for r in results) / 1024
+        pss = statistics.median(r['pss_kb'] or 0 for r in results) / 1024
+        pandas_loaded = 'yes' if results[0]['pandas_loaded'] else 'no'
+        print(f"{mode:<10}{ms:>18.1f}{rss:>10.1f}{pss:>10.1f}{pandas_loaded:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+# benchmarks/harness.py
+"""
+Shared pieces of the benchmark suite (bench_network.py, load_http.py,
+load_realtime.py and run_suite.py):
+
+- synthetic_network(): an N-station network on any number of lines, far
+  beyond the two lines in config.py, written as a real database + artifact.
+- Server: the app started on such a database in a child process, in dev
+  (Werkzeug) or production (server.py workers) mode.
+- percentiles() and write_results(): latency summaries, and JSON result files
+  tagged with the git commit and machine, so releases can be compared.
+"""
+import hashlib
+import json
+import math
+import os
+import platform
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+from network import artifact_dir, load_from_sqlite, save_artifact  # noqa: E402
+
+SOUTH, WEST, NORTH, EAST = 2.90, 101.45, 3.30, 101.85   # the Klang Valley
+STATIONS_PER_LINE = 30
+INTERCHANGE_KM = 0.5
+
+
+# --- Synthetic Network ---
+
+def synthetic_network(stations, lines=None, seed=1):
+    """
+    A network of `stations` stations on `lines` lines (default: one per
+    STATIONS_PER_LINE stations, like the real lines). Each line runs straight
+    across the region at its own angle and offset. Lines are joined by
+    interchange walkways between stations less than INTERCHANGE_KM apart, and
+    each line to the next at their closest stations, so everything is connected.
+    Fares and minutes are given for every pair, like data/Fare.csv and Time.csv.
+
+    Returns a dict: names, lats, lons, fares and minutes (N x N, by position
+    in names), connections (name pairs) and lines {line name: station names}.
+    """
+    rng = np.random.default_rng(seed)
+    lines = lines or max(2, round(stations / STATIONS_PER_LINE))
+    if stations < 2 * lines:
+        raise ValueError("every line needs at least two stations")
+    sizes = [stations // lines + (1 if i < stations % lines else 0) for i in range(lines)]
+    centre_lat, centre_lon = (SOUTH + NORTH) / 2, (WEST + EAST) / 2
+    reach = min(NORTH - SOUTH, EAST - WEST) / 2
+
+    names, lats, lons, line_stations, ranges = [], [], [], {}, []
+    for line, size in enumerate(sizes):
+        angle = math.pi * line / lines + rng.uniform(-0.1, 0.1)
+        offset_lat, offset_lon = rng.uniform(-reach / 4, reach / 4, 2)
+        steps = np.linspace(-1, 1, size)
+        first = len(names)
+        names += [f"L{line + 1:02d} Station {k + 1:03d}" for k in range(size)]
+        lats += (centre_lat + offset_lat + steps * reach * math.sin(angle)).tolist()
+        lons += (centre_lon + offset_lon + steps * reach * math.cos(angle)).tolist()
+        line_stations[f"Line {line + 1}"] = names[first:]
+        ranges.append(range(first, len(names)))
+    lats, lons = np.array(lats), np.array(lons)
+
+    km_per_degree = 111.195
+    dlat = (lats[:, None] - lats[None, :]) * km_per_degree
+    dlon = (lons[:, None] - lons[None, :]) * km_per_degree * math.cos(math.radians(centre_lat))
+    km = np.hypot(dlat, dlon)
+
+    pairs = set()
+    for ids in ranges:
+        pairs.update((ids[k], ids[k + 1]) for k in range(len(ids) - 1))
+    for a in range(lines):
+        for b in range(a + 1, lines):
+            block = km[ranges[a].start:ranges[a].stop, ranges[b].start:ranges[b].stop]
+            close = np.argwhere(block < INTERCHANGE_KM)
+            if b == a + 1 and not len(close):
+                close = [np.unravel_index(np.argmin(block), block.shape)]
+            pairs.update((ranges[a].start + int(i), ranges[b].start + int(j)) for i, j in close)
+
+    return {
+        "names": names,
+        "lats": lats,
+        "lons": lons,
+        "fares": np.round(1.2 + 0.15 * km, 1),
+        "minutes": np.maximum(1, np.round(1.5 + 1.6 * km)).astype(int),
+        "connections": sorted((names[a], names[b]) for a, b in pairs),
+        "lines": line_stations,
+    }
+
+
+def write_database(db_file, network, compile_artifact=True):
+    """
+    Writes a synthetic network with database.py's schema (replacing any
+    existing file) and, by default, compiles its artifact the way database.py
+    does. Returns the seconds spent on each step.
+    """
+    for path in (db_file, db_file + '-wal', db_file + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+    names, n = network["names"], len(network["names"])
+    fares, minutes = network["fares"].tolist(), network["minutes"].tolist()
+    version = hashlib.sha256(json.dumps([names, network["connections"]]).encode()).hexdigest()[:16]
+
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_file)
+    for statement in database.SCHEMA:
+        conn.execute(statement)
+    conn.executemany('INSERT INTO stations VALUES (?, ?, ?)',
+                     zip(names, network["lats"].tolist(), network["lons"].tolist()))
+    conn.executemany('INSERT INTO fares VALUES (?, ?, ?)',
+                     ((names[i], names[j], fares[i][j]) for i in range(n) for j in range(n)))
+    conn.executemany('INSERT INTO times VALUES (?, ?, ?)',
+                     ((names[i], names[j], minutes[i][j]) for i in range(n) for j in range(n)))
+    conn.executemany('INSERT INTO connections VALUES (?, ?)', network["connections"])
+    conn.executemany('INSERT INTO dataset_meta VALUES (?, ?)', [
+        ('schema_version', str(database.SCHEMA_VERSION)),
+        ('dataset_version', version),
+        ('built_at', str(int(time.time()))),
+    ])
+    conn.commit()
+    conn.close()
+    timings = {"write_database_s": time.perf_counter() - start}
+
+    if compile_artifact:
+        start = time.perf_counter()
+        save_artifact(load_from_sqlite(db_file), artifact_dir(db_file))
+        timings["compile_artifact_s"] = time.perf_counter() - start
+    return timings
+
+
+def synthetic_database(stations, directory, seed=1):
+    """
+    Builds a synthetic network and its database + artifact in `directory`.
+    Returns (db file, network dict, build timings).
+    """
+    db_file = os.path.join(directory, f'synthetic-{stations}.sqlite')
+    network = synthetic_network(stations, seed=seed)
+    return db_file, network, write_database(db_file, network)
+
+
+# --- Server Under Test ---
+
+# Child process of Server in dev mode: the Werkzeug server without the
+# debugger and reloader that `python app.py` enables.
+DEV_CHILD = r'''
+import sys
+sys.path.insert(0, sys.argv[1])
+from app import app
+from realtime import socketio
+socketio.run(app, host='127.0.0.1', port=int(sys.argv[2]), allow_unsafe_werkzeug=True)
+'''
+
+PROD_CHILD = r'''
+import sys
+sys.path.insert(0, sys.argv[1])
+import server
+server.run(int(sys.argv[3]), sys.argv[4], 'local', host='127.0.0.1', port=int(sys.argv[2]))
+'''
+
+
+class Server:
+    """
+    The app on a database, in a child process, for the load drivers. Use as a
+    context manager; `url` answers once __enter__ returns. The server's output
+    goes to `log_file`.
+
+    Args:
+        db_file (str): Database to serve (METRO_DATABASE); None for the default.
+        mode (str): 'dev' (one Werkzeug process, threads) or 'prod' (server.py workers).
+        workers (int), async_mode (str): prod only.
+        port (int): Port to listen on, on 127.0.0.1.
+    """
+
+    def __init__(self, db_file=None, mode='dev', workers=2, async_mode='eventlet', port=5055):
+        self.db_file, self.mode, self.workers, self.async_mode, self.port = db_file, mode, workers, async_mode, port
+        self.url = f"http://127.0.0.1:{port}"
+        self.log_file = os.path.join(tempfile.mkdtemp(prefix='metro-server-'), 'server.log')
+        self.process = None
+
+    def __enter__(self):
+        import requests
+
+        env = dict(os.environ)
+        if self.db_file:
+            env['METRO_DATABASE'] = os.path.abspath(self.db_file)
+        if self.mode == 'prod':
+            command = [sys.executable, '-c', PROD_CHILD, ROOT, str(self.port), str(self.workers), self.async_mode]
+        else:
+            command = [sys.executable, '-c', DEV_CHILD, ROOT, str(self.port)]
+        with open(self.log_file, 'w') as log:
+            self.process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"server exited with code {self.process.returncode}; see {self.log_file}")
+            try:
+                if requests.get(self.url + '/api/lines', timeout=1).status_code == 200:
+                    return self
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        self.__exit__(None, None, None)
+        raise RuntimeError(f"server did not answer within 60 s; see {self.log_file}")
+
+    def __exit__(self, *exc):
+        if self.process is None or self.process.poll() is not None:
+            return
+        # server.run() stops its workers on KeyboardInterrupt.
+        self.process.send_signal(signal.SIGINT)
+        try:
+            self.process.wait(15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def memory_mb(self):
+        """Resident memory of the server and its worker processes, in MB (None off Linux)."""
+        total, pending = 0, [self.process.pid]
+        while pending:
+            pid = pending.pop()
+            try:
+                with open(f'/proc/{pid}/status') as f:
+                    total += next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+                with open(f'/proc/{pid}/task/{pid}/children') as f:
+                    pending += [int(child) for child in f.read().split()]
+            except (OSError, StopIteration):
+                if pid == self.process.pid:
+                    return None
+        return round(total / 1024, 1)
+
+
+# --- Results ---
+
+def percentiles(samples_ms):
+    """Count, mean and p50/p90/p99/max of latency samples in milliseconds."""
+    if not len(samples_ms):
+        return {"count": 0}
+    values = np.asarray(samples_ms, dtype=float)
+    p50, p90, p99 = np.percentile(values, (50, 90, 99))
+    return {"count": int(len(values)), "mean_ms": round(float(values.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p90_ms": round(float(p90), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(values.max()), 3)}
+
+
+def environment():
+    """What the results were measured on: commit, Python, OS and CPUs."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_results(path, benchmark, params, results):
+    """Writes {"benchmark", "environment", "params", "results"} as JSON to path (if given)."""
+    document = {"benchmark": benchmark, "environment": environment(), "params": params, "results": results}
+    if path:
+        with open(path, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"[SUCCESS] Results written to {path}")
+    return document
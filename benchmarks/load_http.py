@@ -0,0 +1,162 @@
+# benchmarks/load_http.py
+"""
+HTTP load driver for /api/route, /api/stations and /api/lines.
+
+For each concurrency level, that many clients (threads with keep-alive
+sessions, spread over processes so the driver is not limited by one GIL)
+send requests back to back for --duration seconds. ROUTE_SHARE of them are
+/api/route for random station pairs (half optimize=hops, half
+optimize=time), the rest split between /api/stations and /api/lines.
+Reports throughput, errors and latency percentiles per endpoint, and the
+server's memory.
+
+The server is started here on a synthetic network of --stations stations
+(see harness.py), on the real db.sqlite with --stations 0, or not at all
+with --url. Run from the project root:
+    python benchmarks/load_http.py [--stations 300] [--concurrency 1,8,32] [--mode dev|prod] [--output results.json]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from harness import Server, percentiles, synthetic_database, write_results  # noqa: E402
+
+ROUTE_SHARE = 0.8
+THREADS_PER_PROCESS = 16
+
+
+def pick_request(rng, names):
+    """One (endpoint, path, params) from the request mix."""
+    roll = rng.random()
+    if roll < ROUTE_SHARE:
+        origin, destination = rng.sample(names, 2)
+        optimize = 'hops' if roll < ROUTE_SHARE / 2 else 'time'
+        return 'route', '/api/route', {'from': origin, 'to': destination, 'optimize': optimize}
+    if roll < (1 + ROUTE_SHARE) / 2:
+        return 'stations', '/api/stations', None
+    return 'lines', '/api/lines', None
+
+
+def drive(url, names, threads, seconds, seed, results):
+    """Worker process: `threads` clients sending requests until the time is up."""
+    deadline = time.monotonic() + seconds
+    samples, errors, lock = defaultdict(list), defaultdict(int), threading.Lock()
+
+    def client(index):
+        rng = random.Random(seed * 1000 + index)
+        session = requests.Session()
+        local, failed = defaultdict(list), defaultdict(int)
+        while time.monotonic() < deadline:
+            endpoint, path, params = pick_request(rng, names)
+            start = time.perf_counter()
+            try:
+                ok = session.get(url + path, params=params, timeout=30).status_code == 200
+            except requests.RequestException:
+                ok = False
+            if ok:
+                local[endpoint].append((time.perf_counter() - start) * 1000)
+            else:
+                failed[endpoint] += 1
+        with lock:
+            for endpoint, values in local.items():
+                samples[endpoint].extend(values)
+            for endpoint, count in failed.items():
+                errors[endpoint] += count
+
+    workers = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put((dict(samples), dict(errors)))
+
+
+def run_level(url, names, concurrency, seconds, seed=1):
+    """Runs one concurrency level and summarizes it."""
+    processes = -(-concurrency // THREADS_PER_PROCESS)
+    results = multiprocessing.Queue()
+    workers = []
+    for p in range(processes):
+        threads = concurrency // processes + (1 if p < concurrency % processes else 0)
+        workers.append(multiprocessing.Process(target=drive, args=(url, names, threads, seconds, seed + p, results)))
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    samples, errors = defaultdict(list), defaultdict(int)
+    for _ in workers:
+        part_samples, part_errors = results.get()
+        for endpoint, values in part_samples.items():
+            samples[endpoint].extend(values)
+        for endpoint, count in part_errors.items():
+            errors[endpoint] += count
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(values) for values in samples.values())
+    return {
+        "concurrency": concurrency,
+        "requests_per_s": round(total / elapsed, 1),
+        "errors": sum(errors.values()),
+        "latency": percentiles([value for values in samples.values() for value in values]),
+        "endpoints": {endpoint: {**percentiles(values), "errors": errors.get(endpoint, 0)}
+                      for endpoint, values in sorted(samples.items())},
+    }
+
+
+def run(url, concurrency=(1, 8, 32), seconds=10, server=None):
+    """Drives every concurrency level against a running server. Returns the per-level results."""
+    names = [station["name"] for station in requests.get(url + '/api/stations', timeout=10).json()]
+    levels = []
+    for level in concurrency:
+        result = run_level(url, names, level, seconds)
+        if server is not None:
+            result["server_memory_mb"] = server.memory_mb()
+        levels.append(result)
+        print(f"[INFO] {level:>4} clients: {result['requests_per_s']:>8.1f} req/s, "
+              f"p50 {result['latency'].get('p50_ms', 0):.2f} ms, p99 {result['latency'].get('p99_ms', 0):.2f} ms, "
+              f"{result['errors']} errors")
+    return {"stations": len(names), "levels": levels}
+
+
+def run_with_server(stations=300, concurrency=(1, 8, 32), seconds=10, mode='dev', workers=2, port=5055):
+    """Starts a server on a synthetic network (or db.sqlite if stations is 0) and drives it."""
+    with tempfile.TemporaryDirectory(prefix='metro-bench-') as directory:
+        db_file = synthetic_database(stations, directory)[0] if stations else None
+        with Server(db_file, mode=mode, workers=workers, port=port) as server:
+            return run(server.url, concurrency, seconds, server)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="drive an already running server instead of starting one.")
+    parser.add_argument('--stations', type=int, default=300, help="synthetic network size (0: serve db.sqlite).")
+    parser.add_argument('--concurrency', default='1,8,32', help="comma-separated numbers of concurrent clients.")
+    parser.add_argument('--duration', type=float, default=10, help="seconds per concurrency level.")
+    parser.add_argument('--mode', choices=['dev', 'prod'], default='dev', help="how to start the server.")
+    parser.add_argument('--workers', type=int, default=2, help="prod mode: worker processes.")
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--output', help="write the results to this JSON file.")
+    args = parser.parse_args()
+    concurrency = [int(level) for level in args.concurrency.split(',')]
+
+    if args.url:
+        results = run(args.url, concurrency, args.duration)
+    else:
+        results = run_with_server(args.stations, concurrency, args.duration, args.mode, args.workers, args.port)
+    params = {key: value for key, value in vars(args).items() if key != 'output'}
+    write_results(args.output, 'http', {**params, "concurrency": concurrency}, results)
+
+
+if __name__ == '__main__':
+    main()
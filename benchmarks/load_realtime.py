@@ -0,0 +1,318 @@
+# benchmarks/load_realtime.py
+"""
+Socket.IO fan-out under load: end-to-end latency of train updates from
+data_generator-style publishers to a growing swarm of headless viewers, and
+the most viewers the server sustains.
+
+Publishers connect like data_generator.py (auth role 'generator') and send
+one 'train_updates' batch per --tick that moves each of their trains one
+station along its line. Viewers are socketio.Client instances, spread over
+processes of VIEWERS_PER_PROCESS so the clients' own GIL does not skew the
+numbers. PROBES_PER_PROCESS viewers in each process timestamp every train
+position they receive; latency is that time minus the time a publisher sent
+the position (the two clocks are the same machine's). Every viewer checks the
+per-room "seq" of its frames for gaps.
+
+The viewer count doubles each step, from --start up to --max-viewers. A step
+is sustained if every viewer connected and stayed connected, no frame was
+lost and the p99 latency stayed under --max-p99-ms. The ramp stops at the
+first step that is not; the largest sustained step is reported. Frames are
+coalesced once per BROADCAST_INTERVAL_SECONDS, so latency includes up to one
+interval of buffering by design. The default --tick does not divide that
+interval, so sends land at every phase of it and the percentiles do not depend
+on how the two loops happen to line up.
+
+The server is started here on a synthetic network of --stations stations
+(see harness.py), on the real db.sqlite with --stations 0, or not at all
+with --url. Run from the project root:
+    python benchmarks/load_realtime.py [--trains 500] [--max-viewers 400] [--mode dev|prod] [--output results.json]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from bisect import bisect_right
+from collections import defaultdict
+
+import requests
+import socketio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from harness import Server, percentiles, synthetic_database, write_results  # noqa: E402
+from config import BROADCAST_INTERVAL_SECONDS  # noqa: E402
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+VIEWERS_PER_PROCESS = 50
+PROBES_PER_PROCESS = 2
+WARMUP_SECONDS = 2 * BROADCAST_INTERVAL_SECONDS
+
+
+# --- Viewers (one process per VIEWERS_PER_PROCESS) ---
+
+def viewer_process(url, count, fmt, conn):
+    """
+    Connects `count` viewers, then answers each command from the main process
+    ('report' or 'stop') with the records gathered since the last one:
+    {"frames", "gaps", "disconnects", "probes": [(receive time, train, station id)]}.
+    """
+    lock = threading.Lock()
+    records = {"frames": 0, "gaps": 0, "disconnects": 0, "probes": []}
+    clients = []
+
+    def add_viewer(probe):
+        sio = socketio.Client(reconnection=False)
+        names, last_seq = {}, {}
+
+        def on_frame(frame, snapshot=False):
+            now = time.time()
+            if isinstance(frame, bytes):
+                frame = msgpack.unpackb(frame, strict_map_key=False)
+            names.update(frame.get("names") or {})
+            room, seq = frame["room"], frame["seq"]
+            with lock:
+                if not snapshot:
+                    records["frames"] += 1
+                    if room in last_seq and seq > last_seq[room] + 1:
+                        records["gaps"] += seq - last_seq[room] - 1
+                    if probe:
+                        records["probes"] += [(now, names.get(str(tid)), sid) for tid, sid in frame["t"]]
+            last_seq[room] = seq
+
+        sio.on('train_frame', on_frame)
+        sio.on('train_frame_bin', on_frame)
+        sio.on('train_snapshot', lambda frame: on_frame(frame, snapshot=True))
+        sio.on('train_snapshot_bin', lambda frame: on_frame(frame, snapshot=True))
+
+        def on_disconnect(*args):
+            with lock:
+                records["disconnects"] += 1
+        sio.on('disconnect', on_disconnect)
+
+        sio.connect(url, auth={'format': fmt}, transports=['websocket'], wait_timeout=10)
+        clients.append(sio)
+
+    failed = 0
+    for index in range(count):
+        try:
+            add_viewer(index < PROBES_PER_PROCESS)
+        except socketio.exceptions.ConnectionError:
+            failed += 1
+    conn.send(failed)
+
+    while True:
+        command = conn.recv()
+        with lock:
+            batch = dict(records)
+            records.update(frames=0, gaps=0, disconnects=0, probes=[])
+        conn.send(batch)
+        if command == 'stop':
+            break
+    for sio in clients:
+        try:
+            sio.disconnect()
+        except Exception:
+            pass
+
+
+# --- Publishers ---
+
+class Publishers:
+    """
+    data_generator-style clients moving `trains` trains along the given lines,
+    one station per tick, and remembering when each position was sent.
+    """
+
+    def __init__(self, url, lines, trains, publishers, tick_seconds, seed=1):
+        rng = random.Random(seed)
+        line_paths = [path for path in lines.values() if len(path) > 1]
+        self.trains = []   # [publisher index, train id, path, position]
+        for k in range(trains):
+            path = line_paths[k % len(line_paths)]
+            path = path if (k // len(line_paths)) % 2 == 0 else list(reversed(path))
+            self.trains.append([k % publishers, f"Bench-{k}", path, rng.randrange(len(path))])
+        self.tick_seconds = tick_seconds
+        self.sent = defaultdict(list)   # (train id, station name) -> send times
+        self.updates_sent = 0
+        self.clients = []
+        for _ in range(publishers):
+            sio = socketio.Client(reconnection=False)
+            sio.connect(url, auth={'role': 'generator'}, transports=['websocket'], wait_timeout=10)
+            self.clients.append(sio)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _loop(self):
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            batches = defaultdict(list)
+            for train in self.trains:
+                publisher, train_id, path, position = train
+                train[3] = (position + 1) % len(path)
+                batches[publisher].append([train_id, path[train[3]]])
+            for publisher, updates in batches.items():
+                now = time.time()
+                for train_id, station in updates:
+                    self.sent[(train_id, station)].append(now)
+                self.clients[publisher].emit('train_updates', {'updates': updates})
+                self.updates_sent += len(updates)
+            next_tick += self.tick_seconds
+            self._stop.wait(max(0.0, next_tick - time.monotonic()))
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        for sio in self.clients:
+            sio.disconnect()
+
+    def latencies_ms(self, probes, station_names):
+        """Receive time minus the latest send of the same position before it, per probe record."""
+        latencies = []
+        for received, train_id, station_id in probes:
+            sends = self.sent.get((train_id, station_names.get(station_id)))
+            if sends:
+                index = bisect_right(sends, received) - 1
+                if index >= 0:
+                    latencies.append((received - sends[index]) * 1000)
+        return latencies
+
+
+# --- Ramp ---
+
+def run(url, lines=None, trains=500, publishers=1, tick_seconds=0.3, start=25, max_viewers=400,
+        step_seconds=10, max_p99_ms=None, fmt='json', server=None):
+    """Ramps the viewers up against a running server. Returns the per-step results and the sustained maximum."""
+    max_p99_ms = max_p99_ms or 2000 * BROADCAST_INTERVAL_SECONDS
+    stations = requests.get(url + '/api/stations', timeout=10).json()
+    station_names = {station["id"]: station["name"] for station in stations}
+    if lines is None:
+        lines = requests.get(url + '/api/lines', timeout=10).json()["lines"]
+
+    feed = Publishers(url, lines, trains, publishers, tick_seconds)
+    feed.start()
+    swarm = []   # (process, pipe)
+    steps, sustained, viewers = [], 0, 0
+    try:
+        target = start
+        while target <= max_viewers:
+            failed, added = 0, target - viewers
+            pipes = []
+            for first in range(0, added, VIEWERS_PER_PROCESS):
+                parent, child = multiprocessing.Pipe()
+                count = min(VIEWERS_PER_PROCESS, added - first)
+                process = multiprocessing.Process(target=viewer_process, args=(url, count, fmt, child), daemon=True)
+                process.start()
+                swarm.append((process, parent))
+                pipes.append(parent)
+            for parent in pipes:
+                failed += parent.recv()
+            viewers = target
+
+            time.sleep(WARMUP_SECONDS)
+            for _, parent in swarm:
+                parent.send('report')
+                parent.recv()
+            sent_before, started = feed.updates_sent, time.time()
+            time.sleep(step_seconds)
+            totals = {"frames": 0, "gaps": 0, "disconnects": 0, "probes": []}
+            for _, parent in swarm:
+                parent.send('report')
+                batch = parent.recv()
+                for key in totals:
+                    totals[key] += batch[key]
+            elapsed = time.time() - started
+
+            latency = percentiles(feed.latencies_ms(totals["probes"], station_names))
+            connected = viewers - failed
+            step = {
+                "viewers": viewers,
+                "connect_failures": failed,
+                "disconnects": totals["disconnects"],
+                "updates_per_s": round((feed.updates_sent - sent_before) / elapsed, 1),
+                "frames_per_viewer_per_s": round(totals["frames"] / max(connected, 1) / elapsed, 3),
+                "lost_frames": totals["gaps"],
+                "latency": latency,
+            }
+            if server is not None:
+                step["server_memory_mb"] = server.memory_mb()
+            step["sustained"] = (not failed and not totals["disconnects"] and not totals["gaps"]
+                                 and latency["count"] > 0 and latency["p99_ms"] <= max_p99_ms)
+            steps.append(step)
+            print(f"[INFO] {viewers:>5} viewers: p50 {latency.get('p50_ms', 0):.0f} ms, "
+                  f"p99 {latency.get('p99_ms', 0):.0f} ms, {step['frames_per_viewer_per_s']:.2f} frames/s each, "
+                  f"{failed} failed, {totals['gaps']} lost -> {'ok' if step['sustained'] else 'NOT sustained'}")
+            if not step["sustained"]:
+                break
+            sustained = viewers
+            target *= 2
+    finally:
+        for process, parent in swarm:
+            try:
+                parent.send('stop')
+                parent.recv()
+            except (OSError, EOFError):
+                pass
+            process.join(10)
+            if process.is_alive():
+                process.terminate()
+        feed.stop()
+    return {"trains": trains, "tick_seconds": tick_seconds, "max_p99_ms": max_p99_ms,
+            "max_sustained_viewers": sustained, "steps": steps}
+
+
+def run_with_server(stations=300, mode='dev', workers=2, port=5056, **options):
+    """Starts a server on a synthetic network (or db.sqlite if stations is 0) and ramps viewers against it."""
+    with tempfile.TemporaryDirectory(prefix='metro-bench-') as directory:
+        lines = None
+        db_file = None
+        if stations:
+            db_file, network, _ = synthetic_database(stations, directory)
+            lines = network["lines"]
+        with Server(db_file, mode=mode, workers=workers, port=port) as server:
+            return run(server.url, lines, server=server, **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="test an already running server (trains follow its /api/lines).")
+    parser.add_argument('--stations', type=int, default=300, help="synthetic network size (0: serve db.sqlite).")
+    parser.add_argument('--trains', type=int, default=500, help="trains moved per tick, in total.")
+    parser.add_argument('--publishers', type=int, default=1, help="generator connections sharing the trains.")
+    parser.add_argument('--tick', type=float, default=0.3, help="seconds between update batches.")
+    parser.add_argument('--start', type=int, default=25, help="viewers in the first step.")
+    parser.add_argument('--max-viewers', type=int, default=400, help="stop doubling after this many viewers.")
+    parser.add_argument('--step-seconds', type=float, default=10, help="measurement time per step.")
+    parser.add_argument('--max-p99-ms', type=float, help="latency limit of a sustained step "
+                                                         "(default: two broadcast intervals).")
+    parser.add_argument('--format', choices=['json', 'msgpack'], default='json', help="viewer frame encoding.")
+    parser.add_argument('--mode', choices=['dev', 'prod'], default='dev', help="how to start the server.")
+    parser.add_argument('--workers', type=int, default=2, help="prod mode: worker processes.")
+    parser.add_argument('--port', type=int, default=5056)
+    parser.add_argument('--output', help="write the results to this JSON file.")
+    args = parser.parse_args()
+
+    options = dict(trains=args.trains, publishers=args.publishers, tick_seconds=args.tick, start=args.start,
+                   max_viewers=args.max_viewers, step_seconds=args.step_seconds, max_p99_ms=args.max_p99_ms,
+                   fmt=args.format)
+    if args.url:
+        results = run(args.url, **options)
+    else:
+        results = run_with_server(args.stations, args.mode, args.workers, args.port, **options)
+    print(f"[SUCCESS] Largest sustained step: {results['max_sustained_viewers']} viewers")
+    params = {key: value for key, value in vars(args).items() if key != 'output'}
+    write_results(args.output, 'realtime', params, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# benchmarks/run_suite.py
+"""
+Runs the whole suite (bench_network.py, load_http.py and load_realtime.py)
+with short defaults and writes one JSON file, so two releases can be compared:
+
+    python benchmarks/run_suite.py --output v1.json
+    python benchmarks/run_suite.py --output v2.json --baseline v1.json
+
+With --baseline, every number that moved by more than --threshold percent
+against the baseline file is listed. Latencies and timings going up, or
+throughput and sustained viewers going down, are marked as regressions.
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench_network  # noqa: E402
+import load_http  # noqa: E402
+import load_realtime  # noqa: E402
+from harness import write_results  # noqa: E402
+
+# Numbers where more is better; everything else measured (times, latencies, memory) is better lower.
+HIGHER_IS_BETTER = ('requests_per_s', 'max_sustained_viewers', 'frames_per_viewer_per_s', 'updates_per_s')
+MEASURED = ('_ms', '_s', '_mb') + HIGHER_IS_BETTER
+
+
+def flatten(value, prefix=''):
+    """{dotted path: number} for every numeric leaf; list items are keyed by their size field if they have one."""
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = []
+        for index, item in enumerate(value):
+            key = index
+            if isinstance(item, dict):
+                key = next((f"{field}={item[field]}" for field in ('stations', 'concurrency', 'viewers')
+                            if field in item), index)
+            items.append((key, item))
+    else:
+        return {prefix: value} if isinstance(value, (int, float)) and not isinstance(value, bool) else {}
+    leaves = {}
+    for key, item in items:
+        leaves.update(flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+    return leaves
+
+
+def compare(results, baseline, threshold):
+    """Prints every measured number that changed by more than threshold percent. Returns the regression count."""
+    old, new = flatten(baseline), flatten(results)
+    regressions = 0
+    for path in sorted(set(old) & set(new)):
+        if not path.endswith(MEASURED) or not old[path]:
+            continue
+        change = (new[path] - old[path]) / abs(old[path]) * 100
+        if abs(change) <= threshold:
+            continue
+        worse = change < 0 if path.endswith(HIGHER_IS_BETTER) else change > 0
+        regressions += worse
+        print(f"[{'WARNING' if worse else 'INFO'}] {path}: {old[path]} -> {new[path]} ({change:+.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,300,1000', help="bench_network station counts.")
+    parser.add_argument('--stations', type=int, default=300, help="network size for the load tests.")
+    parser.add_argument('--concurrency', default='1,8,32', help="load_http client counts.")
+    parser.add_argument('--duration', type=float, default=5, help="seconds per HTTP level and viewer step.")
+    parser.add_argument('--max-viewers', type=int, default=200, help="load_realtime ramp limit.")
+    parser.add_argument('--mode', choices=['dev', 'prod'], default='dev', help="how to start the servers.")
+    parser.add_argument('--workers', type=int, default=2, help="prod mode: worker processes.")
+    parser.add_argument('--output', required=True, help="write the results to this JSON file.")
+    parser.add_argument('--baseline', help="an earlier --output file to compare against.")
+    parser.add_argument('--threshold', type=float, default=10, help="percent change worth reporting.")
+    args = parser.parse_args()
+
+    print("--- Network loading and routing ---")
+    network = bench_network.run([int(size) for size in args.sizes.split(',')], queries=100)
+    bench_network.print_results(network)
+    print("\n--- HTTP load ---")
+    http = load_http.run_with_server(args.stations, [int(level) for level in args.concurrency.split(',')],
+                                     args.duration, args.mode, args.workers)
+    print("\n--- Socket.IO fan-out ---")
+    realtime = load_realtime.run_with_server(args.stations, args.mode, args.workers, max_viewers=args.max_viewers,
+                                             step_seconds=args.duration)
+
+    results = {"network": network, "http": http, "realtime": realtime}
+    params = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+    write_results(args.output, 'suite', params, results)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\n--- Compared with {args.baseline} (commit {baseline['environment'].get('commit')}) ---")
+        regressions = compare(results, baseline["results"], args.threshold)
+        print(f"[{'WARNING' if regressions else 'SUCCESS'}] {regressions} regression(s) beyond {args.threshold:g}%.")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,15 +5,122 @@ This file contains all the settings and constants used across the application,
 making it easy to manage and modify configurations from a single location.
 """
 
+import os
+
 # --- Database Configuration ---
-DATABASE_NAME = 'db.sqlite'
+# METRO_DATABASE points the server at another database, e.g. a synthetic one
+# written by the benchmark suite (benchmarks/harness.py).
+DATABASE_NAME = os.environ.get('METRO_DATABASE', 'db.sqlite')
 
 # --- Server Configuration ---
 SERVER_PORT = 5000
 
+# --- Production Run Mode (python app.py --mode prod) ---
+# Number of worker processes; roughly one per CPU core.
+PROD_WORKERS = os.cpu_count() or 1
+# Async worker type: 'eventlet' or 'gevent'.
+PROD_ASYNC_MODE = 'eventlet'
+# Message queue the workers share broadcasts through. 'local' starts a built-in
+# Unix-socket broker; use redis://host:6379/0 (or a kombu URL) across machines.
+MESSAGE_QUEUE = 'local'
+
 # --- Real-Time Simulation Configuration ---
-# The time in seconds that the data generator waits before sending a new update.
-SIMULATION_INTERVAL_SECONDS = 5
+# The time in seconds between two ticks of the fleet simulation in data_generator.py.
+SIMULATION_TICK_SECONDS = 1.0
+# How many times faster than real life the trains run (Time.csv minutes are divided by this).
+SIMULATION_SPEEDUP = 12.0
+# Real-life time a train stands at each station, before the speed-up is applied.
+DWELL_SECONDS = 30
+# Segment time used when Time.csv has no entry for a pair of adjacent stations.
+DEFAULT_SEGMENT_MINUTES = 2
+# How often the server sends one coalesced 'train_frame' to viewers (see realtime.py).
+BROADCAST_INTERVAL_SECONDS = 1.0
+# Size of the lat/lon grid cells that viewport subscriptions are routed through (~2 km).
+GRID_CELL_DEGREES = 0.02
+# Largest number of grid cells one bounding-box subscription may cover.
+MAX_SUBSCRIPTION_CELLS = 400
+# Headway between trains of the background line services (data_generator.py --headway).
+DEFAULT_HEADWAY_SECONDS = 300
+# Rate of the 'train_positions' stream for clients that do not interpolate
+# segments themselves (see realtime.py).
+POSITION_STREAM_HZ = 2
+# Its coordinates are integers in 1/POSITION_STREAM_SCALE degrees (about 1.1 m).
+POSITION_STREAM_SCALE = 100_000
+
+# --- Simulation Jobs (see scheduler.py) ---
+# Train requests ('start_simulation') a client may send at once, and how many
+# per minute it gets back after that.
+SIMULATION_REQUEST_BURST = 3
+SIMULATION_REQUESTS_PER_MINUTE = 6
+# Most simulation jobs queued or running across all data generators.
+MAX_SIMULATION_JOBS = 2000
+# A job is dropped this long after it was created, even if its generator never
+# reported the train finished (a simulated journey takes minutes).
+SIMULATION_JOB_TIMEOUT_SECONDS = 1800
+
+# --- Journey Planner Configuration ---
+# Cost mode used by /api/route when the request does not give ?optimize=.
+# 'hops' is answered straight from the precomputed all-pairs table.
+DEFAULT_ROUTE_OPTIMIZE = 'hops'
+# Upper bound on ?k= (number of alternative routes returned).
+MAX_ROUTE_ALTERNATIVES = 5
+# Extra cost added for every interchange walk between INTERCHANGE_STATIONS,
+# in the units of each optimize mode (minutes, RM, hops). With a 'hops'
+# penalty, hop-count routes are searched by the routing engine instead of
+# being read from the precomputed table (which counts every hop as 1).
+TRANSFER_PENALTIES = {
+    'time': 5,
+    'fare': 0.0,
+    'hops': 0,
+}
+# Number of origin/destination pairs /api/routes/batch resolves per vectorized pass.
+BATCH_ROUTE_CHUNK_SIZE = 10000
+
+# --- Timetable (GTFS) Journey Planning ---
+# Most transfers a /api/route?depart_at= journey may have (RAPTOR runs one more round than this).
+MAX_TIMETABLE_TRANSFERS = 4
+# Minimum time to change trains at the same stop, and to walk between the
+# platforms of one parent station, when transfers.txt does not say otherwise.
+MIN_CHANGE_SECONDS = 60
+
+# --- Station Geo Lookup ---
+# Stations returned by /api/nearest when the request does not give ?k=, and the most it may ask for.
+DEFAULT_NEAREST_STATIONS = 5
+MAX_NEAREST_STATIONS = 100
+
+# --- Static Response Caching ---
+# Cache-Control max-age (seconds) for /api/stations, /api/lines and /api/network.
+# After it expires, clients revalidate with the ETag and normally get a 304.
+STATIC_CACHE_MAX_AGE = 300
+# Ready-to-send /api/route responses kept in memory (LRU), and how long each stays valid.
+ROUTE_CACHE_MAX_ENTRIES = 4096
+ROUTE_CACHE_TTL_SECONDS = 3600
+
+# --- Admin Endpoints ---
+# Token expected in the X-Admin-Token header of /api/admin/* requests. When it
+# is not set, the admin endpoints are disabled, except for requests from
+# localhost to the development server (`python app.py`). Set it in production.
+ADMIN_TOKEN = os.environ.get('METRO_ADMIN_TOKEN')
+
+# --- Metrics and Logging ---
+# In production mode each worker also serves its own /metrics on
+# METRICS_PORT_BASE + worker index, so Prometheus can scrape every worker.
+METRICS_PORT_BASE = 9100
+# Port of the data_generator.py metrics listener (python data_generator.py --metrics-port).
+GENERATOR_METRICS_PORT = 9099
+# Log lines per second printed for each hot-path event (client connects, route
+# warnings, ...). The rest are dropped and counted in the next printed line.
+LOG_EVENTS_PER_SECOND = 5
+
+# --- Train Position History ---
+# Position events each server process keeps in memory (16 bytes each, so
+# 1,000,000 is about 16 MB: 100 s of history at 10,000 updates/s, hours at the
+# simulator's rate). When full, the oldest event is overwritten.
+TRAIN_HISTORY_MAX_EVENTS = 1_000_000
+# Most events one /api/trains/history response or Socket.IO replay returns.
+MAX_HISTORY_RESPONSE_EVENTS = 50_000
+# Fastest replay a client may ask for, as a multiple of real time.
+MAX_REPLAY_SPEED = 100
 
 # --- Manually Verified Coordinate Data ---
 VERIFIED_COORDINATES = {
@@ -107,6 +214,12 @@ KELANA_JAYA_LINE = [
     "Putra Heights (KJL)"
 ]
 
+# Line names as shown on the map and used by /api/lines and line subscriptions.
+LINES = {
+    "Kelana Jaya Line": KELANA_JAYA_LINE,
+    "Kajang Line": KAJANG_LINE,
+}
+
 INTERCHANGE_STATIONS = {
     "Pasar Seni (KJL)": "Pasar Seni (SBK)",
     "Muzium Negara": "KL Sentral (KJL)",
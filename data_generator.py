@@ -1,95 +1,225 @@
-# data_generator.py (FINAL - USER-DRIVEN SIMULATION)
-"""
-A standalone client script that simulates train movement based on instructions
-received from the main server.
-
-This script:
-1. Connects to the Flask-SocketIO server.
-2. Enters a passive state, waiting for a 'new_route_to_simulate' event.
-3. When it receives a route, it simulates a train moving along that specific path.
-4. After the simulation is complete, it returns to the waiting state.
-"""
-import time
-import random
-import socketio
-from config import SIMULATION_INTERVAL_SECONDS
-
-# This global variable will be updated by the WebSocket event handler
-# It holds the specific path that the server has instructed us to simulate.
-current_simulation_path = None
-
-# --- 1. WebSocket Client Setup ---
-sio = socketio.Client()
-
-# --- 2. Define Event Handlers for This Client ---
-@sio.event
-def connect():
-    """Handler for a successful connection to the server."""
-    print("Connection to server established. Waiting for a route to simulate...")
-
-@sio.event
-def disconnect():
-    """Handler for disconnection from the server."""
-    print("Disconnected from server.")
-
-@sio.on('new_route_to_simulate')
-def on_new_route(data):
-    """
-    Receives a new route from the server to start simulating.
-    This is the most important handler in this script.
-    """
-    global current_simulation_path
-    path = data.get('path')
-    if path and isinstance(path, list):
-        print(f"\n[RECEIVED INSTRUCTION] New route to simulate: {path}")
-        current_simulation_path = path
-    else:
-        print(f"[WARNING] Received invalid route data: {data}")
-
-# --- 3. Main Simulation Logic ---
-def run_simulation():
-    """
-    The main simulation loop. It continuously checks if there is a route
-    to simulate and executes the simulation when one is received.
-    """
-    global current_simulation_path
-    train_id_counter = 1000
-
-    while True:
-        if current_simulation_path:
-            # A new route has been received, start the simulation
-            train_id = f"Train-{train_id_counter}"
-            train_id_counter += 1
-            
-            print(f"--- Starting simulation for {train_id} on route: {current_simulation_path} ---")
-            
-            # Loop through the assigned route
-            for station in current_simulation_path:
-                update_data = {'train_id': train_id, 'current_station': station}
-                sio.emit('train_update', update_data)
-                print(f"  Sent update: {train_id} is now at {station}")
-                time.sleep(SIMULATION_INTERVAL_SECONDS)
-            
-            print(f"--- Simulation for {train_id} complete. Train has arrived. ---")
-            
-            # Reset the path to None and return to the waiting state
-            current_simulation_path = None
-            print("\nWaiting for a new route to simulate...")
-        else:
-            # If there's no route, just wait quietly for instructions.
-            time.sleep(1)
-
-# --- 4. Main Execution Block ---
-if __name__ == "__main__":
-    try:
-        # Attempt to establish the connection. The event handlers are already set up.
-        sio.connect('http://localhost:5000')
-        # Start the main loop
-        run_simulation()
-    except socketio.exceptions.ConnectionError:
-        print(f"[FATAL ERROR] Connection failed. Is the main Flask server (app.py) running?")
-    except KeyboardInterrupt:
-        print("\nSimulation stopped by user.")
-    finally:
-        if sio.connected:
-            sio.disconnect()
\ No newline at end of file
+# data_generator.py (FLEET SIMULATION)
+"""
+A standalone client script that simulates train movement based on instructions
+received from the main server.
+
+This script:
+1. Connects to the Flask-SocketIO server.
+2. Runs a tick-scheduled fleet simulation (see fleet.py) that can move any
+   number of trains at once.
+3. Every 'new_route_to_simulate' event adds one more train on that path;
+   trains already running are not interrupted. The server's job scheduler
+   sends each kiosk request to one generator only; when the train finishes,
+   its job id is reported back in 'jobs_done'.
+4. Optionally runs background services on every line with a fixed headway
+   (--headway), in both directions.
+5. Reports how far each tick drifts from its schedule, and serves its
+   metrics (tick drift, trains, updates sent) on --metrics-port.
+
+--processes N runs a pool of N generators, one per process (for several
+cores). The server spreads the jobs over them; the background services run
+in the first one only.
+"""
+import argparse
+import multiprocessing
+import time
+from collections import deque
+import socketio
+from config import (SIMULATION_TICK_SECONDS, DEFAULT_HEADWAY_SECONDS, SERVER_PORT,
+                    KAJANG_LINE, KELANA_JAYA_LINE, GENERATOR_METRICS_PORT)
+from fleet import FleetSimulator, DriftStats, load_network
+from telemetry import Callback, Counter, Histogram, log_event, serve_metrics
+
+# How often (in ticks) the drift summary is printed.
+DRIFT_REPORT_EVERY_TICKS = 30
+# Train numbers of pool process i start at 1000 + i * TRAIN_NUMBERS_PER_PROCESS.
+TRAIN_NUMBERS_PER_PROCESS = 1_000_000
+
+fleet = None
+jobs = {}               # train id -> id of the server's simulation job it runs
+rejected_jobs = deque() # job ids whose path could not be simulated, reported with the next tick
+held_finished = []      # trains that finished while disconnected, sent once reconnected
+held_jobs_done = []     # and the jobs they ended
+
+# --- Metrics (served by --metrics-port, see telemetry.py) ---
+TICK_DRIFT = Histogram('metro_simulation_tick_drift_seconds', "How late each simulation tick started.")
+TICK_DURATION = Histogram('metro_simulation_tick_duration_seconds', "Time to advance the fleet and send one tick.")
+MISSED_TICKS = Counter('metro_simulation_missed_ticks_total', "Ticks skipped because an earlier one overran.")
+UPDATES_SENT = Counter('metro_simulation_updates_sent_total', "Train arrivals sent to the server.")
+Callback('metro_simulation_active_trains', "Trains running in the simulation.",
+         lambda: fleet.active_count() if fleet is not None else 0)
+
+# --- 1. WebSocket Client Setup ---
+sio = socketio.Client()
+
+# --- 2. Define Event Handlers for This Client ---
+@sio.event
+def connect():
+    """Handler for a successful connection to the server."""
+    print("Connection to server established. Waiting for routes to simulate...")
+
+@sio.event
+def disconnect():
+    """
+    Handler for disconnection from the server. The server moves this
+    generator's jobs to the other generators (or queues them until one
+    connects), so their trains are stopped here instead of running twice
+    after a reconnect. The next tick reports them as finished.
+    """
+    print("Disconnected from server.")
+    fleet.remove_trains(list(jobs))
+    jobs.clear()
+    rejected_jobs.clear()
+
+@sio.on('new_route_to_simulate')
+def on_new_route(data):
+    """
+    Receives a new route from the server and adds a train for it to the fleet.
+    Runs on the Socket.IO client thread; the fleet picks it up on its next tick.
+    """
+    path = data.get('path')
+    job_id = data.get('job_id')
+    if path and isinstance(path, list):
+        train_id = fleet.add_train(path, time.monotonic())
+        if train_id:
+            if job_id:
+                jobs[train_id] = job_id
+            log_event('train_added', train=train_id, job=job_id, origin=path[0], destination=path[-1])
+            return
+    if job_id:
+        rejected_jobs.append(job_id)
+    log_event('invalid_route', level='WARNING', data=data)
+
+# --- 3. Main Simulation Logic ---
+def emit_arrivals(arrivals, finished):
+    """
+    Sends a single 'train_updates' message per tick with every train that
+    reached a new station, every segment a train started (from and to
+    station, unix departure and arrival time), every train that completed its
+    journey, and the server jobs those trains (or rejected routes) were for.
+    """
+    finished_ids = [fleet.train_id(slot) for slot in finished.tolist()]
+    # disconnect() may clear the jobs from the Socket.IO thread at any time.
+    jobs_done = [job_id for job_id in (jobs.pop(train_id, None) for train_id in finished_ids) if job_id]
+    while rejected_jobs:
+        jobs_done.append(rejected_jobs.popleft())
+    if not sio.connected:
+        # Arrivals and segments are stale by the time the client reconnects; only endings are kept.
+        held_finished.extend(finished_ids)
+        held_jobs_done.extend(jobs_done)
+        return
+    if held_finished or held_jobs_done:
+        finished_ids, jobs_done = held_finished + finished_ids, held_jobs_done + jobs_done
+        held_finished.clear()
+        held_jobs_done.clear()
+    departures = fleet.departures
+    if len(arrivals) == 0 and len(departures) == 0 and not finished_ids and not jobs_done:
+        return
+    station_ids = fleet.current_station(arrivals)
+    updates = [[fleet.train_id(slot), fleet.names[station_id]]
+               for slot, station_id in zip(arrivals.tolist(), station_ids.tolist())]
+    # Segment times move from the tick clock (monotonic) to unix time, which clients share.
+    offset = time.time() - time.monotonic()
+    here, there, start, end = fleet.segments(departures)
+    segments = [[fleet.train_id(slot), fleet.names[a], fleet.names[b], round(t0 + offset, 2), round(t1 + offset, 2)]
+                for slot, a, b, t0, t1 in zip(departures.tolist(), here.tolist(), there.tolist(),
+                                              start.tolist(), end.tolist())]
+    UPDATES_SENT.inc(len(updates))
+    message = {'updates': updates, 'finished': finished_ids}
+    if segments:
+        message['segments'] = segments
+    if jobs_done:
+        message['jobs_done'] = jobs_done
+    try:
+        sio.emit('train_updates', message)
+    except socketio.exceptions.BadNamespaceError:
+        # The connection dropped since the check above.
+        held_finished.extend(finished_ids)
+        held_jobs_done.extend(jobs_done)
+
+def run_simulation(tick_seconds=SIMULATION_TICK_SECONDS, on_tick=emit_arrivals):
+    """
+    The main simulation loop. Ticks are scheduled on a fixed grid
+    (start + n * tick_seconds), so a slow tick does not push every later tick back.
+    If a tick overruns a whole interval, the missed ticks are skipped and counted.
+    """
+    drift = DriftStats()
+    next_tick = time.monotonic()
+    tick_count = 0
+
+    while True:
+        now = time.monotonic()
+        drift.record(now - next_tick)
+        TICK_DRIFT.observe(max(0.0, now - next_tick))
+
+        arrivals, finished = fleet.tick(now)
+        on_tick(arrivals, finished)
+        TICK_DURATION.observe(time.monotonic() - now)
+
+        tick_count += 1
+        if tick_count % DRIFT_REPORT_EVERY_TICKS == 0:
+            stats = drift.summary()
+            print(f"[FLEET] {fleet.active_count()} trains | tick drift mean {stats['mean_ms']:.2f} ms, "
+                  f"p99 {stats['p99_ms']:.2f} ms, max {stats['max_ms']:.2f} ms, missed {stats['missed_ticks']}")
+
+        next_tick += tick_seconds
+        behind = time.monotonic() - next_tick
+        if behind > 0:
+            skipped = int(behind // tick_seconds) + 1
+            drift.missed_ticks += skipped - 1
+            MISSED_TICKS.inc(skipped - 1)
+            next_tick += (skipped - 1) * tick_seconds
+        time.sleep(max(0.0, next_tick - time.monotonic()))
+
+def start_line_services(headway_seconds):
+    """Runs a train every headway_seconds on each line, in both directions."""
+    now = time.monotonic()
+    for line in (KAJANG_LINE, KELANA_JAYA_LINE):
+        fleet.add_service(line, headway_seconds, now)
+        fleet.add_service(list(reversed(line)), headway_seconds, now)
+    print(f"[INFO] Line services started with a {headway_seconds}s headway.")
+
+# --- 4. Main Execution Block ---
+def run_generator(url, index=0, headway=None, metrics_port=None):
+    """Runs one generator of the pool until interrupted (index 0 alone runs the line services)."""
+    global fleet
+    fleet = FleetSimulator(*load_network(), first_number=1000 + index * TRAIN_NUMBERS_PER_PROCESS)
+    if metrics_port:
+        serve_metrics(metrics_port + index)
+    try:
+        # Attempt to establish the connection. The event handlers are already set up.
+        sio.connect(url, auth={'role': 'generator'}, transports=['websocket'])
+        if headway and index == 0:
+            start_line_services(headway)
+        # Start the main loop
+        run_simulation()
+    except socketio.exceptions.ConnectionError:
+        print(f"[FATAL ERROR] Connection failed. Is the main Flask server (app.py) running?")
+    except KeyboardInterrupt:
+        if index == 0:
+            print("\nSimulation stopped by user.")
+    finally:
+        if sio.connected:
+            sio.disconnect()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulates trains and streams their positions to the server.")
+    parser.add_argument('--url', default=f'http://localhost:{SERVER_PORT}', help="Socket.IO server URL.")
+    parser.add_argument('--headway', type=float, nargs='?', const=DEFAULT_HEADWAY_SECONDS, default=None,
+                        help="Also run background services on every line with this headway in seconds.")
+    parser.add_argument('--metrics-port', type=int, nargs='?', const=GENERATOR_METRICS_PORT, default=None,
+                        help="Serve Prometheus metrics on this port (default port if no value is given); "
+                             "pool process i uses this port + i.")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="Run a pool of this many generator processes; the server spreads jobs over them.")
+    args = parser.parse_args()
+
+    pool = [multiprocessing.Process(target=run_generator, args=(args.url, index, args.headway, args.metrics_port))
+            for index in range(1, args.processes)]
+    for process in pool:
+        process.start()
+    try:
+        run_generator(args.url, 0, args.headway, args.metrics_port)
+    finally:
+        for process in pool:
+            process.join()
@@ -1,72 +1,294 @@
-# database.py (DEFINITIVE FINAL - This is the one-time setup script)
-import csv
-import sqlite3
-import os
-import pandas as pd
-from config import DATABASE_NAME, VERIFIED_COORDINATES, STATIONS_TO_EXCLUDE, KAJANG_LINE, KELANA_JAYA_LINE, INTERCHANGE_STATIONS
-
-DB_FILE = DATABASE_NAME
-FARE_CSV_PATH = os.path.join(os.path.dirname(__file__), 'data', 'Fare.csv')
-TIME_CSV_PATH = os.path.join(os.path.dirname(__file__), 'data', 'Time.csv')
-
-def initialize_database():
-    """Performs a one-time ETL process to create a clean SQLite database."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    print("[INFO] Creating database schema...")
-    cursor.execute('DROP TABLE IF EXISTS fares')
-    cursor.execute('DROP TABLE IF EXISTS times')
-    cursor.execute('DROP TABLE IF EXISTS connections') # Added routes table drop for older versions
-    cursor.execute('DROP TABLE IF EXISTS stations')
-    cursor.execute('CREATE TABLE stations (name TEXT PRIMARY KEY, latitude REAL, longitude REAL)')
-    cursor.execute('CREATE TABLE fares (origin TEXT, destination TEXT, price REAL)')
-    cursor.execute('CREATE TABLE times (origin TEXT, destination TEXT, minutes INT)')
-    cursor.execute('CREATE TABLE connections (origin_name TEXT, destination_name TEXT)')
-
-    print("\n--- Step 1: Transforming and Loading Data ---")
-    
-    fare_df = pd.read_csv(FARE_CSV_PATH, index_col=0)
-    time_df = pd.read_csv(TIME_CSV_PATH, index_col=0)
-
-    for df in [fare_df, time_df]:
-        df.columns = df.columns.str.strip()
-        df.index = df.index.str.strip()
-        df.drop(index=STATIONS_TO_EXCLUDE, errors='ignore', inplace=True)
-        df.drop(columns=STATIONS_TO_EXCLUDE, errors='ignore', inplace=True)
-    
-    station_names = sorted(list(fare_df.index))
-    
-    stations_to_insert = []
-    for name in station_names:
-        coords = VERIFIED_COORDINATES.get(name, {"lat": None, "lon": None})
-        stations_to_insert.append((name, coords["lat"], coords["lon"]))
-    cursor.executemany('INSERT INTO stations (name, latitude, longitude) VALUES (?, ?, ?)', stations_to_insert)
-    print(f"[SUCCESS] Loaded {len(stations_to_insert)} stations into database.")
-    
-    fares_to_load = fare_df.stack().reset_index()
-    fares_to_load.columns = ['origin', 'destination', 'price']
-    fares_to_load.to_sql('fares', conn, if_exists='append', index=False)
-    
-    times_to_load = time_df.stack().reset_index()
-    times_to_load.columns = ['origin', 'destination', 'minutes']
-    times_to_load.to_sql('times', conn, if_exists='append', index=False)
-    
-    # --- THIS IS THE MISSING LOGIC ---
-    print("\n--- Step 2: Ingesting direct connections ---")
-    connections_to_add = set()
-    all_lines = [KELANA_JAYA_LINE, KAJANG_LINE]
-    for line in all_lines:
-        for i in range(len(line) - 1):
-            connections_to_add.add(tuple(sorted((line[i], line[i+1]))))
-    for station1, station2 in INTERCHANGE_STATIONS.items():
-        connections_to_add.add(tuple(sorted((station1, station2))))
-    cursor.executemany('INSERT INTO connections (origin_name, destination_name) VALUES (?, ?)', list(connections_to_add))
-    print(f"[SUCCESS] Ingested {cursor.rowcount} unique direct connection entries.")
-
-    conn.commit()
-    conn.close()
-    print("\n--- Database Initialization Complete ---")
-
-if __name__ == "__main__":
-    initialize_database()
\ No newline at end of file
+# database.py (DEFINITIVE FINAL - This is the one-time setup script)
+"""
+ETL from data/Fare.csv and data/Time.csv into db.sqlite, followed by the
+compiled network artifact (see network.py).
+
+    python database.py            # incremental: only changed rows are written
+    python database.py --full     # drop every table and rebuild from scratch
+    python database.py --gtfs feed.zip   # also import a GTFS timetable (see gtfs.py)
+
+Both CSVs are streamed row by row, so memory use does not grow with the size
+of the N x N matrices. The whole load runs in one transaction in WAL mode:
+the server can keep reading the old data until the commit.
+
+An incremental run compares each CSV row with the stored row (one primary
+key range scan per origin) and writes only the differences: changed or new
+cells are upserted and vanished ones deleted. If the sources are unchanged since the last run, nothing is written
+at all. The dataset version (a hash of the sources) is stored in the
+dataset_meta table; the server compares it with the compiled artifact to
+detect a stale one.
+
+A GTFS feed is compiled into db.timetable/ for timetable journey planning
+(/api/route?depart_at=); it is independent of the fare and time matrices.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import sqlite3
+import os
+import time
+from network import load_from_sqlite, save_artifact, artifact_dir, load_artifact
+from gtfs import import_feed, timetable_dir
+from config import DATABASE_NAME, VERIFIED_COORDINATES, STATIONS_TO_EXCLUDE, KAJANG_LINE, KELANA_JAYA_LINE, INTERCHANGE_STATIONS
+
+DB_FILE = DATABASE_NAME
+FARE_CSV_PATH = os.path.join(os.path.dirname(__file__), 'data', 'Fare.csv')
+TIME_CSV_PATH = os.path.join(os.path.dirname(__file__), 'data', 'Time.csv')
+
+# Bump when the table layout below changes; an older database gets a full rebuild.
+SCHEMA_VERSION = 2
+
+# Fares and times are keyed by (origin, destination). As WITHOUT ROWID tables
+# the primary key *is* the table, so it is a covering index for point lookups.
+SCHEMA = [
+    'CREATE TABLE stations (name TEXT PRIMARY KEY, latitude REAL, longitude REAL)',
+    'CREATE TABLE fares (origin TEXT, destination TEXT, price REAL, '
+    'PRIMARY KEY (origin, destination)) WITHOUT ROWID',
+    'CREATE TABLE times (origin TEXT, destination TEXT, minutes INT, '
+    'PRIMARY KEY (origin, destination)) WITHOUT ROWID',
+    'CREATE TABLE connections (origin_name TEXT, destination_name TEXT, '
+    'PRIMARY KEY (origin_name, destination_name)) WITHOUT ROWID',
+    'CREATE INDEX connections_by_destination ON connections (destination_name, origin_name)',
+    'CREATE TABLE dataset_meta (key TEXT PRIMARY KEY, value TEXT)',
+]
+TABLES = ['fares', 'times', 'connections', 'stations', 'dataset_meta']
+
+# --- Extract ---
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def parse_number(text):
+    """'3' -> 3, '2.5' -> 2.5, '' or junk -> None (a missing cell)."""
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    if value != value:  # NaN
+        return None
+    return int(value) if value.is_integer() else value
+
+def stream_matrix_rows(path):
+    """
+    Reads an N x N CSV matrix (first row: destinations, first column: origin)
+    one row at a time and yields (origin, {destination: value}) with the
+    non-empty cells of each row. Names are stripped; STATIONS_TO_EXCLUDE rows
+    and columns are skipped.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader)[1:]]
+        keep = [i for i, name in enumerate(header) if name not in STATIONS_TO_EXCLUDE]
+        for row in reader:
+            if not row:
+                continue
+            origin = row[0].strip()
+            if origin in STATIONS_TO_EXCLUDE:
+                continue
+            cells = row[1:]
+            values = {}
+            for i in keep:
+                if i < len(cells):
+                    value = parse_number(cells[i].strip())
+                    if value is not None:
+                        values[header[i]] = value
+            yield origin, values
+
+def stream_matrix(path):
+    """Yields (origin, destination, value) for every non-empty cell of a CSV matrix."""
+    for origin, values in stream_matrix_rows(path):
+        for destination, value in values.items():
+            yield origin, destination, value
+
+def matrix_origins(path):
+    """The station names in the first column of a CSV matrix, minus exclusions."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        next(reader)
+        names = {row[0].strip() for row in reader if row}
+    return sorted(names - STATIONS_TO_EXCLUDE)
+
+def station_rows(fare_csv):
+    for name in matrix_origins(fare_csv):
+        coords = VERIFIED_COORDINATES.get(name, {"lat": None, "lon": None})
+        yield name, coords["lat"], coords["lon"]
+
+def connection_rows():
+    connections_to_add = set()
+    all_lines = [KELANA_JAYA_LINE, KAJANG_LINE]
+    for line in all_lines:
+        for i in range(len(line) - 1):
+            connections_to_add.add(tuple(sorted((line[i], line[i+1]))))
+    for station1, station2 in INTERCHANGE_STATIONS.items():
+        connections_to_add.add(tuple(sorted((station1, station2))))
+    return sorted(connections_to_add)
+
+def dataset_version(fare_csv, time_csv):
+    """Hash of everything the database is built from: both CSVs and the network config."""
+    config_part = json.dumps([VERIFIED_COORDINATES, sorted(STATIONS_TO_EXCLUDE), KAJANG_LINE,
+                              KELANA_JAYA_LINE, INTERCHANGE_STATIONS], sort_keys=True)
+    digest = hashlib.sha256()
+    for part in (file_sha256(fare_csv), file_sha256(time_csv), config_part, str(SCHEMA_VERSION)):
+        digest.update(part.encode())
+    return digest.hexdigest()[:16]
+
+# --- Load ---
+
+def read_meta(conn):
+    try:
+        return dict(conn.execute('SELECT key, value FROM dataset_meta'))
+    except sqlite3.OperationalError:  # no dataset_meta yet: a database from before SCHEMA_VERSION 2
+        return {}
+
+def create_schema(conn):
+    for table in TABLES:
+        conn.execute(f'DROP TABLE IF EXISTS {table}')
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+def apply_matrix_changes(conn, table, value_column, path):
+    """
+    Makes a fares/times table match a CSV matrix, writing only what changed.
+    Each origin's existing row is read with one primary-key range scan and
+    compared with the CSV row in memory, so at most one row of the matrix is
+    held at a time. Returns (upserted, deleted).
+    """
+    upserted = deleted = 0
+    origins = []
+    select = f'SELECT destination, {value_column} FROM {table} WHERE origin = ?'
+    for origin, values in stream_matrix_rows(path):
+        origins.append(origin)
+        existing = dict(conn.execute(select, (origin,)))
+        changed = [(origin, destination, value) for destination, value in values.items()
+                   if existing.get(destination) != value]
+        gone = [(origin, destination) for destination in existing if destination not in values]
+        if changed:
+            conn.executemany(f'INSERT OR REPLACE INTO {table} VALUES (?, ?, ?)', changed)
+        if gone:
+            conn.executemany(f'DELETE FROM {table} WHERE origin = ? AND destination = ?', gone)
+        upserted += len(changed)
+        deleted += len(gone)
+
+    # Origins that are no longer in the CSV at all.
+    existing_origins = {origin for (origin,) in conn.execute(f'SELECT DISTINCT origin FROM {table}')}
+    for origin in existing_origins - set(origins):
+        deleted += conn.execute(f'DELETE FROM {table} WHERE origin = ?', (origin,)).rowcount
+    return upserted, deleted
+
+def apply_changes(conn, table, key_columns, value_columns, rows):
+    """
+    Makes a small table (stations, connections) hold exactly `rows`, writing
+    only the rows that differ. Returns (upserted, deleted).
+    """
+    columns = key_columns + value_columns
+    width = len(key_columns)
+    existing = {row[:width]: row[width:] for row in conn.execute(f'SELECT {", ".join(columns)} FROM {table}')}
+    wanted = {tuple(row[:width]): tuple(row[width:]) for row in rows}
+    changed = [key + values for key, values in wanted.items() if existing.get(key) != values]
+    gone = [key for key in existing if key not in wanted]
+    placeholders = ', '.join('?' * len(columns))
+    conn.executemany(f'INSERT OR REPLACE INTO {table} VALUES ({placeholders})', changed)
+    conn.executemany(f'DELETE FROM {table} WHERE {" AND ".join(f"{c} = ?" for c in key_columns)}', gone)
+    return len(changed), len(gone)
+
+def initialize_database(db_file=DB_FILE, fare_csv=FARE_CSV_PATH, time_csv=TIME_CSV_PATH, full=False, compile_network=True):
+    """
+    Runs the ETL and then compiles the network artifact. Incremental unless
+    `full` is set or the existing database has an older schema.
+    Returns a summary dict (mode, version, per-table changes, seconds).
+    """
+    start = time.perf_counter()
+    version = dataset_version(fare_csv, time_csv)
+
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    meta = read_meta(conn)
+    if meta.get('schema_version') != str(SCHEMA_VERSION):
+        full = True
+    summary = {"mode": "full" if full else "incremental", "version": version, "changes": {}}
+
+    if not full and meta.get('dataset_version') == version:
+        conn.close()
+        print(f"[INFO] Sources unchanged (dataset {version}); nothing to load.")
+        summary["mode"] = "unchanged"
+    else:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if full:
+                print("[INFO] Creating database schema...")
+                create_schema(conn)
+                print("\n--- Step 1: Transforming and Loading Data ---")
+                conn.executemany('INSERT INTO stations VALUES (?, ?, ?)', station_rows(fare_csv))
+                conn.executemany('INSERT OR REPLACE INTO fares VALUES (?, ?, ?)', stream_matrix(fare_csv))
+                conn.executemany('INSERT OR REPLACE INTO times VALUES (?, ?, ?)', stream_matrix(time_csv))
+                print("\n--- Step 2: Ingesting direct connections ---")
+                conn.executemany('INSERT INTO connections VALUES (?, ?)', connection_rows())
+                for table in ('stations', 'fares', 'times', 'connections'):
+                    summary["changes"][table] = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            else:
+                print("\n--- Applying changes from the source files ---")
+                summary["changes"]["stations"] = apply_changes(
+                    conn, 'stations', ['name'], ['latitude', 'longitude'], station_rows(fare_csv))
+                summary["changes"]["fares"] = apply_matrix_changes(conn, 'fares', 'price', fare_csv)
+                summary["changes"]["times"] = apply_matrix_changes(conn, 'times', 'minutes', time_csv)
+                summary["changes"]["connections"] = apply_changes(
+                    conn, 'connections', ['origin_name', 'destination_name'], [], connection_rows())
+            conn.executemany('INSERT OR REPLACE INTO dataset_meta VALUES (?, ?)', [
+                ('schema_version', str(SCHEMA_VERSION)),
+                ('dataset_version', version),
+                ('built_at', str(int(time.time()))),
+            ])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        for table, changes in summary["changes"].items():
+            if full:
+                print(f"[SUCCESS] Loaded {changes} rows into {table}.")
+            else:
+                print(f"[SUCCESS] {table}: {changes[0]} rows inserted/updated, {changes[1]} deleted.")
+    summary["seconds"] = time.perf_counter() - start
+
+    if compile_network:
+        directory = artifact_dir(db_file)
+        existing = load_artifact(directory)
+        if summary["mode"] == "unchanged" and existing is not None and existing.source_version == version:
+            print(f"[INFO] Network artifact {directory}/ is up to date.")
+        else:
+            print("\n--- Step 3: Compiling the network artifact ---")
+            network = load_from_sqlite(db_file)
+            save_artifact(network, directory)
+            print(f"[SUCCESS] Wrote network {network.version} to {directory}/ for fast server startup.")
+    print("\n--- Database Initialization Complete ---")
+    return summary
+
+def import_gtfs(feed, db_file=DB_FILE):
+    """Compiles a GTFS feed (directory or .zip) into the timetable next to the database."""
+    print(f"\n--- Importing GTFS feed {feed} ---")
+    start = time.perf_counter()
+    directory = timetable_dir(db_file)
+    timetable = import_feed(feed, directory)
+    print(f"[SUCCESS] Wrote timetable {timetable.version} to {directory}/: {len(timetable)} stops, "
+          f"{len(timetable.pattern_route)} patterns, {len(timetable.trip_ids)} trips, "
+          f"{len(timetable.arrivals)} stop times in {time.perf_counter() - start:.2f} s.")
+    return timetable
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Loads data/Fare.csv and data/Time.csv into the SQLite database.")
+    parser.add_argument('--full', action='store_true', help="drop all tables and rebuild instead of applying changes.")
+    parser.add_argument('--db', default=DB_FILE)
+    parser.add_argument('--fare-csv', default=FARE_CSV_PATH)
+    parser.add_argument('--time-csv', default=TIME_CSV_PATH)
+    parser.add_argument('--gtfs', metavar='FEED', help="also import a GTFS feed (directory or .zip) for timetable routing.")
+    args = parser.parse_args()
+    initialize_database(args.db, args.fare_csv, args.time_csv, full=args.full)
+    if args.gtfs:
+        import_gtfs(args.gtfs, args.db)
@@ -0,0 +1,321 @@
+# fleet.py
+"""
+Tick-scheduled simulation of many concurrent trains.
+
+All per-train state lives in NumPy arrays so that a tick advances the whole
+fleet with a handful of vectorized operations, regardless of fleet size.
+
+Each train follows a path of station ids and cycles through three phases:
+- SCHEDULED: created but not departed yet (headway services start staggered).
+- DWELL:     standing at path[leg].
+- TRAVEL:    running from path[leg] to path[leg + 1].
+
+Segment times come from the `times` table (Time.csv), dwell times from config,
+and both are compressed by SIMULATION_SPEEDUP so a journey plays out quickly.
+"""
+import sqlite3
+import threading
+import numpy as np
+from config import DATABASE_NAME, SIMULATION_SPEEDUP, DWELL_SECONDS, DEFAULT_SEGMENT_MINUTES
+
+SCHEDULED, DWELL, TRAVEL = 0, 1, 2
+
+
+def load_network(db_file=DATABASE_NAME):
+    """
+    Reads station coordinates and the travel-time matrix straight from SQLite.
+    Returns (names, lats, lons, minutes) where minutes[u, v] is the segment time.
+    """
+    conn = sqlite3.connect(db_file)
+    stations = conn.execute("SELECT name, latitude, longitude FROM stations ORDER BY name").fetchall()
+    times = conn.execute("SELECT origin, destination, minutes FROM times").fetchall()
+    conn.close()
+
+    names = [row[0] for row in stations]
+    ids = {name: i for i, name in enumerate(names)}
+    lats = np.array([row[1] if row[1] is not None else np.nan for row in stations], dtype=float)
+    lons = np.array([row[2] if row[2] is not None else np.nan for row in stations], dtype=float)
+    minutes = np.full((len(names), len(names)), np.nan)
+    for origin, destination, value in times:
+        if origin in ids and destination in ids and value is not None:
+            minutes[ids[origin], ids[destination]] = value
+    return names, lats, lons, minutes
+
+
+class FleetSimulator:
+    """
+    Simulates any number of trains at once.
+
+    add_train() may be called from other threads (e.g. Socket.IO handlers);
+    new trains are queued and picked up at the start of the next tick().
+    """
+
+    def __init__(self, names, lats, lons, minutes, speedup=SIMULATION_SPEEDUP, dwell_seconds=DWELL_SECONDS,
+                 first_number=1000):
+        self.names = names
+        self.ids = {name: i for i, name in enumerate(names)}
+        self.lats = lats
+        self.lons = lons
+        self.speedup = speedup
+        self.segment_seconds = np.nan_to_num(minutes, nan=DEFAULT_SEGMENT_MINUTES) * 60.0 / speedup
+        self.dwell = dwell_seconds / speedup
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._removals = set()   # train ids to stop on the next tick
+        self.departures = np.zeros(0, dtype=np.int64)   # slots that started a segment in the last tick
+        self._services = []
+        self._next_number = first_number   # simulators sharing a server use disjoint train numbers
+
+        # --- Per-train state (index = slot) ---
+        self.size = 0
+        capacity = 64
+        self.numbers = np.zeros(capacity, dtype=np.int64)   # train number shown as "Train-<n>"
+        self.active = np.zeros(capacity, dtype=bool)
+        self.phase = np.zeros(capacity, dtype=np.int8)
+        self.leg = np.zeros(capacity, dtype=np.int64)
+        self.path_start = np.zeros(capacity, dtype=np.int64)  # offset into self.stops
+        self.path_len = np.zeros(capacity, dtype=np.int64)
+        self.phase_start = np.zeros(capacity)
+        self.phase_end = np.zeros(capacity)
+
+        # All train paths, concatenated.
+        self.stops = np.zeros(256, dtype=np.int64)
+        self.stops_used = 0
+
+    # --- Adding trains ---
+
+    def add_train(self, path, depart_at):
+        """
+        Queues one train on a path of station names, departing at depart_at
+        (same clock as tick()). Returns the train id, or None for an unusable path.
+        """
+        ids = [self.ids[name] for name in path if name in self.ids]
+        if len(ids) != len(path) or not ids:
+            return None
+        with self._lock:
+            number = self._next_number
+            self._next_number += 1
+            self._pending.append((number, ids, depart_at))
+        return f"Train-{number}"
+
+    def add_service(self, line, headway_seconds, start_at):
+        """
+        Registers a recurring service: a new train departs along `line` every
+        headway_seconds (compressed by the speed-up like everything else).
+        """
+        spacing = headway_seconds / self.speedup
+        with self._lock:
+            self._services.append([list(line), spacing, start_at])
+
+    def remove_trains(self, train_ids):
+        """
+        Stops trains by id; may be called from other threads. They end on the
+        next tick() and are reported among its finished slots.
+        """
+        with self._lock:
+            self._removals.update(train_ids)
+
+    def _spawn_services(self, now):
+        with self._lock:
+            services = [service for service in self._services if service[2] <= now]
+        for service in services:
+            line, spacing, next_departure = service
+            while next_departure <= now:
+                self.add_train(line, next_departure)
+                next_departure += spacing
+            service[2] = next_departure
+
+    def _grow(self, needed):
+        capacity = len(self.active)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        for name in ('numbers', 'active', 'phase', 'leg', 'path_start', 'path_len', 'phase_start', 'phase_end'):
+            old = getattr(self, name)
+            grown = np.zeros(new_capacity, dtype=old.dtype)
+            grown[:capacity] = old
+            setattr(self, name, grown)
+
+    def _admit_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        # Reuse finished slots first, then append.
+        free = np.flatnonzero(~self.active[:self.size]).tolist()
+        extra = max(0, len(pending) - len(free))
+        self._grow(self.size + extra)
+        slots = free[:len(pending)] + list(range(self.size, self.size + extra))
+        self.size += extra
+
+        total_stops = sum(len(ids) for _, ids, _ in pending)
+        if self.stops_used + total_stops > len(self.stops):
+            grown = np.zeros(max(self.stops_used + total_stops, len(self.stops) * 2), dtype=np.int64)
+            grown[:self.stops_used] = self.stops[:self.stops_used]
+            self.stops = grown
+
+        for slot, (number, ids, depart_at) in zip(slots, pending):
+            self.stops[self.stops_used:self.stops_used + len(ids)] = ids
+            self.numbers[slot] = number
+            self.path_start[slot] = self.stops_used
+            self.path_len[slot] = len(ids)
+            self.stops_used += len(ids)
+            self.active[slot] = True
+            self.phase[slot] = SCHEDULED
+            self.leg[slot] = 0
+            self.phase_start[slot] = depart_at
+            self.phase_end[slot] = depart_at
+
+    def _take_removals(self):
+        """Deactivates the trains passed to remove_trains(). Returns their slots."""
+        with self._lock:
+            removals, self._removals = self._removals, set()
+        if not removals:
+            return np.zeros(0, dtype=np.int64)
+        numbers = [int(train_id.rsplit('-', 1)[-1]) for train_id in removals]
+        slots = np.flatnonzero(self.active[:self.size] & np.isin(self.numbers[:self.size], numbers))
+        self.active[slots] = False
+        return slots
+
+    def _compact_stops(self):
+        """Drops the paths of finished trains once they take up most of the stop buffer."""
+        live = np.flatnonzero(self.active[:self.size])
+        live_stops = int(self.path_len[live].sum())
+        if self.stops_used < 1024 or live_stops * 2 > self.stops_used:
+            return
+        new_stops = np.zeros(max(256, live_stops * 2), dtype=np.int64)
+        offset = 0
+        for slot in live.tolist():
+            start, length = self.path_start[slot], self.path_len[slot]
+            new_stops[offset:offset + length] = self.stops[start:start + length]
+            self.path_start[slot] = offset
+            offset += length
+        self.stops, self.stops_used = new_stops, offset
+
+    # --- Advancing the simulation ---
+
+    def tick(self, now):
+        """
+        Advances every train to time `now`.
+        Returns (arrivals, finished): arrays of slots that reached a new station
+        during this tick, and of slots whose journey ended (or that were
+        removed with remove_trains()). Finished slots stay
+        readable until the next tick, which may reuse them. The slots that
+        started a segment are left in self.departures (see segments()).
+        """
+        self._compact_stops()
+        self._spawn_services(now)
+        self._admit_pending()
+        removed = self._take_removals()
+        n = self.size
+        arrived = np.zeros(n, dtype=bool)
+        finished = np.zeros(n, dtype=bool)
+        finished[removed] = True
+        departed = np.zeros(n, dtype=bool)
+        active, phase, leg = self.active[:n], self.phase[:n], self.leg[:n]
+        start, end = self.phase_start[:n], self.phase_end[:n]
+
+        # A long tick can carry a train through several phases; loop until settled.
+        while True:
+            due = active & (end <= now)
+            if not due.any():
+                break
+
+            # Scheduled -> dwelling at the first station.
+            departing = due & (phase == SCHEDULED)
+            phase[departing] = DWELL
+            start[departing] = end[departing]
+            end[departing] += self.dwell
+            arrived |= departing
+
+            # Dwell over: finish at the last station or start the next segment.
+            dwelling = due & (phase == DWELL) & ~departing
+            at_last = dwelling & (leg >= self.path_len[:n] - 1)
+            active[at_last] = False
+            finished |= at_last
+            leaving = dwelling & ~at_last
+            if leaving.any():
+                here = self.stops[self.path_start[:n][leaving] + leg[leaving]]
+                there = self.stops[self.path_start[:n][leaving] + leg[leaving] + 1]
+                phase[leaving] = TRAVEL
+                start[leaving] = end[leaving]
+                end[leaving] += self.segment_seconds[here, there]
+                departed |= leaving
+
+            # Travel over: arrive at the next station and start dwelling.
+            arriving = due & (phase == TRAVEL) & ~leaving
+            leg[arriving] += 1
+            phase[arriving] = DWELL
+            start[arriving] = end[arriving]
+            end[arriving] += self.dwell
+            arrived |= arriving
+
+        # A train that also arrived later in this tick is standing at a station again.
+        self.departures = np.flatnonzero(departed & (phase == TRAVEL))
+        return np.flatnonzero(arrived), np.flatnonzero(finished)
+
+    # --- Reading state ---
+
+    def train_id(self, slot):
+        return f"Train-{int(self.numbers[slot])}"
+
+    def current_station(self, slots):
+        """Station ids the given trains are at (or last departed from)."""
+        slots = np.asarray(slots, dtype=np.int64)
+        return self.stops[self.path_start[slots] + self.leg[slots]]
+
+    def segments(self, slots):
+        """
+        (from station ids, to station ids, start, end) of the segments the
+        given travelling trains are on; times are on the tick() clock.
+        """
+        slots = np.asarray(slots, dtype=np.int64)
+        here = self.stops[self.path_start[slots] + self.leg[slots]]
+        there = self.stops[self.path_start[slots] + self.leg[slots] + 1]
+        return here, there, self.phase_start[slots], self.phase_end[slots]
+
+    def positions(self, now):
+        """
+        Interpolated (slots, lat, lon) for every active train. Travelling trains
+        are placed on the straight line between their two stations.
+        """
+        slots = np.flatnonzero(self.active[:self.size] & (self.phase[:self.size] != SCHEDULED))
+        here = self.stops[self.path_start[slots] + self.leg[slots]]
+        travelling = self.phase[slots] == TRAVEL
+        there = np.where(travelling, self.stops[self.path_start[slots] + np.minimum(self.leg[slots] + 1, self.path_len[slots] - 1)], here)
+        span = np.maximum(self.phase_end[slots] - self.phase_start[slots], 1e-9)
+        frac = np.where(travelling, np.clip((now - self.phase_start[slots]) / span, 0.0, 1.0), 0.0)
+        lat = self.lats[here] + frac * (self.lats[there] - self.lats[here])
+        lon = self.lons[here] + frac * (self.lons[there] - self.lons[here])
+        return slots, lat, lon
+
+    def active_count(self):
+        return int(self.active[:self.size].sum())
+
+
+class DriftStats:
+    """Collects how late each tick started relative to its schedule."""
+
+    def __init__(self):
+        self.samples = []
+        self.missed_ticks = 0
+
+    def record(self, drift_seconds):
+        self.samples.append(drift_seconds)
+
+    def summary(self):
+        """Returns mean/p99/max drift in milliseconds and resets the window."""
+        if not self.samples:
+            return None
+        drift_ms = np.array(self.samples) * 1000
+        result = {
+            'ticks': len(drift_ms),
+            'mean_ms': float(drift_ms.mean()),
+            'p99_ms': float(np.percentile(drift_ms, 99)),
+            'max_ms': float(drift_ms.max()),
+            'missed_ticks': self.missed_ticks,
+        }
+        self.samples, self.missed_ticks = [], 0
+        return result
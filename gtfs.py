@@ -0,0 +1,318 @@
+# gtfs.py
+"""
+Imports a GTFS feed into a compact, array-backed timetable for RAPTOR
+journey planning (see raptor.py).
+
+    python database.py --gtfs path/to/feed(.zip)
+
+Reads stops.txt, routes.txt, trips.txt, stop_times.txt and (optionally)
+transfers.txt. Trips are grouped into patterns: trips that visit the same
+sequence of stops, in departure order, without overtaking each other. All
+times are seconds after midnight of the service day (they may exceed 24 h).
+calendar.txt is not imported; every trip is treated as running on the day
+being planned.
+
+The timetable is saved next to the database as db.timetable/ (versioned like
+db.network/, one .npy file per array plus meta.json) and memory-mapped by the
+server:
+
+    stop_ids, stop_names        str      GTFS stop_id and station name per stop
+    lats, lons                  float64  stop coordinates
+    pattern_stop_ptr            int32    CSR: pattern -> its stops
+    pattern_stops               int32
+    pattern_trip_ptr            int32    CSR: pattern -> its trips (global trip index)
+    pattern_time_ptr            int64    offset of each pattern's times in arrivals/departures
+    pattern_route               int32    route index of each pattern (route_names)
+    arrivals, departures        int32    per pattern, stop-major: [stop position][trip]
+    trip_ids                    str      GTFS trip_id per global trip index
+    stop_pattern_ptr            int32    CSR: stop -> (pattern, position) pairs
+    stop_patterns, stop_pattern_pos int32
+    foot_ptr                    int32    CSR: stop -> walking transfers
+    foot_to, foot_seconds       int32
+    change_seconds              int32    minimum time to change trains at each stop
+
+Station names are the parent station's name when the stop has one, so a
+query for "KL Sentral" covers every platform of that station.
+"""
+import csv
+import hashlib
+import io
+import os
+import zipfile
+from collections import defaultdict
+import numpy as np
+from config import DATABASE_NAME, MIN_CHANGE_SECONDS
+from network import load_current_version, write_array_dir, read_array_dir, read_artifact_meta
+
+TIMETABLE_FORMAT_VERSION = 1
+
+_ARRAYS = ('stop_ids', 'stop_names', 'lats', 'lons',
+           'pattern_stop_ptr', 'pattern_stops', 'pattern_trip_ptr', 'pattern_time_ptr', 'pattern_route',
+           'arrivals', 'departures', 'trip_ids',
+           'stop_pattern_ptr', 'stop_patterns', 'stop_pattern_pos',
+           'foot_ptr', 'foot_to', 'foot_seconds', 'change_seconds')
+
+
+class Timetable:
+    """One imported GTFS feed. See the module docstring for the arrays."""
+
+    def __init__(self, arrays, route_names, version):
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.route_names = route_names
+        self.version = version
+        self.stops_by_station = defaultdict(list)
+        for stop, name in enumerate(self.stop_names.tolist()):
+            self.stops_by_station[name].append(stop)
+
+    def __len__(self):
+        return len(self.stop_ids)
+
+    def stops_for(self, station_name):
+        """Stop indices of a station name (case-insensitive fallback), or []."""
+        stops = self.stops_by_station.get(station_name)
+        if stops is None:
+            wanted = station_name.casefold()
+            stops = [s for name, group in self.stops_by_station.items() if name.casefold() == wanted for s in group]
+        return stops
+
+
+# --- Reading the feed ---
+
+def open_feed_file(feed, filename):
+    """Opens one file of a feed directory or .zip as text, or returns None if it is missing."""
+    if os.path.isdir(feed):
+        path = os.path.join(feed, filename)
+        return open(path, newline='', encoding='utf-8-sig') if os.path.exists(path) else None
+    archive = zipfile.ZipFile(feed)
+    names = {os.path.basename(name): name for name in archive.namelist()}
+    if filename not in names:
+        return None
+    return io.TextIOWrapper(archive.open(names[filename]), newline='', encoding='utf-8-sig')
+
+def read_rows(feed, filename, required=True):
+    """Streams the rows of a feed file as dicts with stripped values."""
+    f = open_feed_file(feed, filename)
+    if f is None:
+        if required:
+            raise FileNotFoundError(f"GTFS feed {feed} has no {filename}")
+        return
+    with f:
+        for row in csv.DictReader(f):
+            yield {key.strip(): (value or '').strip() for key, value in row.items() if key}
+
+def parse_time(text):
+    """
+    '8:05:00' (or '8:05') -> 29100 seconds; blank -> -1 (interpolated later).
+    Hours may go past 24 for trips that run after midnight. Raises ValueError
+    for anything else.
+    """
+    if not text:
+        return -1
+    parts = text.split(':')
+    if len(parts) not in (2, 3) or not all(part.isascii() and part.isdigit() for part in parts):
+        raise ValueError(f"Invalid GTFS time {text!r}")
+    hours, minutes, seconds = (int(part) for part in parts + ['0'] * (3 - len(parts)))
+    if minutes >= 60 or seconds >= 60:
+        raise ValueError(f"Invalid GTFS time {text!r}")
+    return hours * 3600 + minutes * 60 + seconds
+
+def feed_hash(feed):
+    digest = hashlib.sha256()
+    paths = [os.path.join(feed, name) for name in sorted(os.listdir(feed))] if os.path.isdir(feed) else [feed]
+    for path in paths:
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+    return digest.hexdigest()[:16]
+
+def fill_missing_times(times):
+    """Linearly interpolates -1 entries (non-timepoint stops) within one trip."""
+    missing = times < 0
+    if missing.any() and not missing.all():
+        known = np.flatnonzero(~missing)
+        times[missing] = np.round(np.interp(np.flatnonzero(missing), known, times[known]))
+    return times
+
+
+# --- Compiling ---
+
+def compile_feed(feed):
+    """Reads a GTFS feed and returns the Timetable arrays (see the module docstring)."""
+    # --- Stops and stations ---
+    stop_rows = list(read_rows(feed, 'stops.txt'))
+    names_by_id = {row['stop_id']: row.get('stop_name', '') for row in stop_rows}
+    stop_index, stop_ids, stop_names, lats, lons, parents = {}, [], [], [], [], []
+    for row in stop_rows:
+        if row.get('location_type', '') not in ('', '0'):
+            continue  # stations, entrances and nodes have no departures
+        parent = row.get('parent_station', '')
+        stop_index[row['stop_id']] = len(stop_ids)
+        stop_ids.append(row['stop_id'])
+        stop_names.append((parent and names_by_id.get(parent)) or row.get('stop_name', ''))
+        lats.append(float(row['stop_lat']) if row.get('stop_lat') else np.nan)
+        lons.append(float(row['stop_lon']) if row.get('stop_lon') else np.nan)
+        parents.append(parent)
+    n_stops = len(stop_ids)
+
+    # --- Routes and trips ---
+    route_index, route_names = {}, []
+    for row in read_rows(feed, 'routes.txt'):
+        route_index[row['route_id']] = len(route_names)
+        route_names.append(row.get('route_short_name') or row.get('route_long_name') or row['route_id'])
+    trip_index, trip_ids, trip_route = {}, [], []
+    for row in read_rows(feed, 'trips.txt'):
+        trip_index[row['trip_id']] = len(trip_ids)
+        trip_ids.append(row['trip_id'])
+        trip_route.append(route_index.get(row.get('route_id'), -1))
+
+    # --- stop_times, streamed into flat columns ---
+    columns = {name: [] for name in ('trip', 'seq', 'stop', 'arr', 'dep')}
+    for row in read_rows(feed, 'stop_times.txt'):
+        trip, stop = trip_index.get(row['trip_id']), stop_index.get(row['stop_id'])
+        if trip is None or stop is None:
+            continue
+        arr, dep = parse_time(row.get('arrival_time')), parse_time(row.get('departure_time'))
+        columns['trip'].append(trip)
+        columns['seq'].append(int(row['stop_sequence']))
+        columns['stop'].append(stop)
+        columns['arr'].append(arr if arr >= 0 else dep)
+        columns['dep'].append(dep if dep >= 0 else arr)
+    trip_col = np.array(columns['trip'], dtype=np.int32)
+    order = np.lexsort((np.array(columns['seq'], dtype=np.int64), trip_col))
+    trip_col = trip_col[order]
+    stop_col = np.array(columns['stop'], dtype=np.int32)[order]
+    arr_col = np.array(columns['arr'], dtype=np.int32)[order]
+    dep_col = np.array(columns['dep'], dtype=np.int32)[order]
+    del columns
+    bounds = np.flatnonzero(np.diff(trip_col)) + 1
+    starts = np.concatenate(([0], bounds)) if len(trip_col) else np.zeros(0, dtype=np.int64)
+    ends = np.concatenate((bounds, [len(trip_col)])) if len(trip_col) else np.zeros(0, dtype=np.int64)
+
+    # --- Patterns: same stop sequence, no overtaking ---
+    # pattern key -> list of sub-patterns, each a list of (trip, arr, dep) in departure order
+    groups = defaultdict(list)
+    trips = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        if end - start < 2:
+            continue
+        arr = fill_missing_times(arr_col[start:end].copy())
+        dep = fill_missing_times(dep_col[start:end].copy())
+        stops = stop_col[start:end]
+        trips.append((int(dep[0]), trip_route[trip_col[start]], stops.tobytes(), int(trip_col[start]), arr, dep))
+    trips.sort(key=lambda t: t[0])
+    for _, route, key, trip, arr, dep in trips:
+        subpatterns = groups[(route, key)]
+        for sub in subpatterns:
+            _, last_arr, last_dep = sub[-1]
+            if (arr >= last_arr).all() and (dep >= last_dep).all():
+                sub.append((trip, arr, dep))
+                break
+        else:
+            subpatterns.append([(trip, arr, dep)])
+
+    pattern_stop_ptr, pattern_stops = [0], []
+    pattern_trip_ptr, pattern_time_ptr, pattern_route = [0], [0], []
+    ordered_trips, arrivals, departures = [], [], []
+    for (route, key), subpatterns in groups.items():
+        stops = np.frombuffer(key, dtype=np.int32)
+        for sub in subpatterns:
+            pattern_stops.extend(stops.tolist())
+            pattern_stop_ptr.append(len(pattern_stops))
+            pattern_route.append(route)
+            ordered_trips.extend(trip for trip, _, _ in sub)
+            pattern_trip_ptr.append(len(ordered_trips))
+            # Stop-major, so the departures of all trips at one stop are contiguous and sorted.
+            arrivals.append(np.stack([a for _, a, _ in sub], axis=1).ravel())
+            departures.append(np.stack([d for _, _, d in sub], axis=1).ravel())
+            pattern_time_ptr.append(pattern_time_ptr[-1] + len(stops) * len(sub))
+
+    # --- Stop -> patterns through it ---
+    through = [[] for _ in range(n_stops)]
+    for p in range(len(pattern_route)):
+        for pos, stop in enumerate(pattern_stops[pattern_stop_ptr[p]:pattern_stop_ptr[p + 1]]):
+            through[stop].append((p, pos))
+    stop_pattern_ptr = np.zeros(n_stops + 1, dtype=np.int32)
+    stop_pattern_ptr[1:] = np.cumsum([len(entries) for entries in through])
+
+    # --- Transfers: walking between stops, and change times at a stop ---
+    change_seconds = np.full(n_stops, MIN_CHANGE_SECONDS, dtype=np.int32)
+    footpaths = {}
+    by_parent = defaultdict(list)
+    for stop, parent in enumerate(parents):
+        if parent:
+            by_parent[parent].append(stop)
+    for platforms in by_parent.values():
+        for a in platforms:
+            for b in platforms:
+                if a != b:
+                    footpaths[(a, b)] = MIN_CHANGE_SECONDS
+    for row in read_rows(feed, 'transfers.txt', required=False):
+        a, b = stop_index.get(row.get('from_stop_id')), stop_index.get(row.get('to_stop_id'))
+        if a is None or b is None:
+            continue
+        if row.get('transfer_type') == '3':  # transfer not possible
+            footpaths.pop((a, b), None)
+            continue
+        seconds = int(row['min_transfer_time']) if row.get('min_transfer_time') else 0
+        if a == b:
+            change_seconds[a] = seconds
+        else:
+            footpaths[(a, b)] = seconds
+    walks = [[] for _ in range(n_stops)]
+    for (a, b), seconds in sorted(footpaths.items()):
+        walks[a].append((b, seconds))
+    foot_ptr = np.zeros(n_stops + 1, dtype=np.int32)
+    foot_ptr[1:] = np.cumsum([len(entries) for entries in walks])
+
+    arrays = {
+        'stop_ids': np.array(stop_ids, dtype=str),
+        'stop_names': np.array(stop_names, dtype=str),
+        'lats': np.array(lats, dtype=float),
+        'lons': np.array(lons, dtype=float),
+        'pattern_stop_ptr': np.array(pattern_stop_ptr, dtype=np.int32),
+        'pattern_stops': np.array(pattern_stops, dtype=np.int32),
+        'pattern_trip_ptr': np.array(pattern_trip_ptr, dtype=np.int32),
+        'pattern_time_ptr': np.array(pattern_time_ptr, dtype=np.int64),
+        'pattern_route': np.array(pattern_route, dtype=np.int32),
+        'arrivals': np.concatenate(arrivals).astype(np.int32) if arrivals else np.zeros(0, dtype=np.int32),
+        'departures': np.concatenate(departures).astype(np.int32) if departures else np.zeros(0, dtype=np.int32),
+        'trip_ids': np.array([trip_ids[t] for t in ordered_trips], dtype=str),
+        'stop_pattern_ptr': stop_pattern_ptr,
+        'stop_patterns': np.array([p for entries in through for p, _ in entries], dtype=np.int32),
+        'stop_pattern_pos': np.array([pos for entries in through for _, pos in entries], dtype=np.int32),
+        'foot_ptr': foot_ptr,
+        'foot_to': np.array([b for entries in walks for b, _ in entries], dtype=np.int32),
+        'foot_seconds': np.array([s for entries in walks for _, s in entries], dtype=np.int32),
+        'change_seconds': change_seconds,
+    }
+    return arrays, route_names
+
+
+# --- Saving and loading ---
+
+def timetable_dir(db_file=DATABASE_NAME):
+    """The timetable lives next to the database: db.sqlite -> db.timetable/"""
+    return os.path.splitext(db_file)[0] + '.timetable'
+
+def import_feed(feed, directory):
+    """Compiles a GTFS feed and writes it as a timetable directory. Returns the Timetable."""
+    arrays, route_names = compile_feed(feed)
+    version = feed_hash(feed)
+    write_array_dir(directory, arrays, {
+        'format_version': TIMETABLE_FORMAT_VERSION,
+        'feed_version': version,
+        'route_names': route_names,
+    })
+    return Timetable(arrays, route_names, version)
+
+def load_timetable(directory):
+    """Memory-maps a timetable directory, or returns None if there is no usable one."""
+    return load_current_version(directory, _load_timetable_version)
+
+def _load_timetable_version(version_dir):
+    meta = read_artifact_meta(version_dir)
+    if meta.get('format_version') != TIMETABLE_FORMAT_VERSION:
+        return None
+    return Timetable(read_array_dir(version_dir, _ARRAYS), meta['route_names'], meta['feed_version'])
@@ -0,0 +1,146 @@
+# history.py
+"""
+Fixed-memory history of train position events.
+
+PositionHistory is a ring buffer over three NumPy arrays: event time (unix
+seconds), train short id and station id (FINISHED when the train completed
+its journey). Appending is O(1) and never grows the arrays, so memory stays
+at 16 bytes per event slot however fast updates arrive; once the buffer is
+full, each new event overwrites the oldest one. Event times never decrease,
+so a time range is found by binary search.
+
+realtime.py appends every update it buffers for the broadcast frames, under
+its fleet-state lock. /api/trains/history and the Socket.IO 'replay' event
+read from it without a lock (see PositionHistory.query).
+"""
+import time
+import numpy as np
+
+FINISHED = -1       # station id of a train that completed its journey
+REMOVED = -2        # station id of a station that a dataset reload removed
+
+
+class PositionHistory:
+    """
+    Ring buffer of (time, train short id, station id) events. Event number k
+    (counting from 0) lives in slot k % capacity.
+
+    Writers (append, remap_stations) must not run concurrently; readers may
+    run alongside them.
+
+    Args:
+        capacity (int): Number of events kept; older events are overwritten.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.trains = np.zeros(capacity, dtype=np.int32)
+        self.stations = np.zeros(capacity, dtype=np.int32)
+        # Item assignment through memoryviews is cheaper than through the arrays.
+        self._times, self._trains, self._stations = (memoryview(a) for a in (self.times, self.trains, self.stations))
+        self.written = 0            # events appended so far
+        self._writing = 0           # events appended or being appended; overwrites happen below this
+        self.names = {}             # short id -> train name, for trains with events still in the buffer
+        self._short_ids = {}        # train name -> short id, the reverse of names
+        self._latest = {}           # short id -> number of its most recent event
+        self._last_time = 0.0
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def append(self, short_id, train_name, station_id, timestamp=None):
+        """Records one event. Times are clamped so they never go backwards."""
+        now = time.time() if timestamp is None else timestamp
+        if now < self._last_time:
+            now = self._last_time
+        self._last_time = now
+        number = self.written
+        self._writing = number + 1
+        slot = number % self.capacity
+        self._times[slot] = now
+        self._trains[slot] = short_id
+        self._stations[slot] = station_id
+        if short_id not in self.names:
+            self.names[short_id] = train_name
+            self._short_ids[train_name] = short_id
+        self._latest[short_id] = number
+        self.written = number + 1   # published last, so readers never see a half-written event
+        if slot == self.capacity - 1:
+            self._forget_overwritten()
+
+    def _forget_overwritten(self):
+        """Drops the names of trains whose events have all been overwritten."""
+        oldest = self.written - self.capacity
+        for short_id in [sid for sid, latest in self._latest.items() if latest < oldest]:
+            del self._latest[short_id]
+            name = self.names.pop(short_id)
+            if self._short_ids.get(name) == short_id:   # the name may belong to a newer train by now
+                del self._short_ids[name]
+
+    def query(self, since=None, until=None, short_id=None, limit=None):
+        """
+        Events with since <= time <= until (either may be None), oldest first,
+        optionally of one train. Returns (times, short ids, station ids,
+        truncated); at most `limit` events are returned, and truncated says
+        whether more matched.
+
+        Only the matching events are copied. Events that a concurrent append
+        overwrote while they were being copied are dropped afterwards: by then
+        they have left the buffer anyway.
+        """
+        end = self.written
+        start = max(0, end - self.capacity)
+        wrap = (start // self.capacity + 1) * self.capacity   # first event number stored back in slot 0
+        parts = []
+        for first, last in ((start, min(end, wrap)), (wrap, end)):
+            if first >= last:
+                continue
+            offset = first - first % self.capacity              # event number of slot 0 in this part
+            times = self.times[first - offset:last - offset]
+            lo = np.searchsorted(times, since, 'left') if since is not None else 0
+            hi = np.searchsorted(times, until, 'right') if until is not None else len(times)
+            if lo >= hi:
+                continue
+            selected = slice(first - offset + lo, first - offset + hi)
+            keep = self.stations[selected] != REMOVED
+            if short_id is not None:
+                keep &= self.trains[selected] == short_id
+            slots = np.flatnonzero(keep) + selected.start
+            parts.append((slots + offset, self.times[slots], self.trains[slots], self.stations[slots]))
+        if not parts:
+            return np.zeros(0), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), False
+        numbers, times, trains, stations = (np.concatenate(column) for column in zip(*parts))
+        # Appending event number k overwrites event k - capacity.
+        valid = numbers >= self._writing - self.capacity
+        if since is not None:
+            valid &= times >= since
+        if until is not None:
+            valid &= times <= until
+        if not valid.all():
+            times, trains, stations = times[valid], trains[valid], stations[valid]
+        truncated = limit is not None and len(times) > limit
+        if truncated:
+            times, trains, stations = times[:limit], trains[:limit], stations[:limit]
+        return times, trains, stations, truncated
+
+    def remap_stations(self, mapping):
+        """
+        Rewrites station ids after a dataset reload. mapping[old id] is the new
+        id, or REMOVED; events at removed stations are no longer returned.
+        """
+        mapping = np.asarray(mapping, dtype=np.int32)
+        used = self.stations[:len(self)]
+        valid = used >= 0
+        used[valid] = mapping[used[valid]]
+
+    def short_id_of(self, train_name):
+        """The short id of a train with events in the buffer, or None."""
+        return self._short_ids.get(train_name)
+
+    def oldest_time(self):
+        """Time of the oldest event still in the buffer, or None if it is empty."""
+        written = self.written
+        if not written:
+            return None
+        return float(self.times[written % self.capacity if written > self.capacity else 0])
@@ -0,0 +1,119 @@
+# http_cache.py
+"""
+Response caching helpers.
+
+- PreparedResponse: pre-serialized JSON for endpoints whose payload only
+  changes when the dataset is rebuilt (/api/stations, /api/lines,
+  /api/network). The payload is encoded once into JSON bytes plus gzip (and
+  brotli, if the `brotli` package is installed) bytes. Each encoding gets its
+  own strong ETag, derived from the content, so a client revalidating with
+  If-None-Match gets a 304 without anything being serialized again.
+- ResponseCache: a thread-safe LRU cache with a TTL for ready-to-send
+  response bodies of computed endpoints (/api/route).
+"""
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from flask import Response, request
+from config import STATIC_CACHE_MAX_AGE
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Preferred first when the client accepts several with the same quality.
+ENCODINGS = ('br', 'gzip', 'identity')
+
+
+class PreparedResponse:
+    """One JSON payload, serialized and compressed once."""
+
+    def __init__(self, payload):
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        self.bodies = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etags = {encoding: digest if encoding == 'identity' else f"{digest}-{encoding}"
+                      for encoding in self.bodies}
+
+    def respond(self):
+        """Builds the response for the current request: 304, or the best encoding the client accepts."""
+        available = [encoding for encoding in ENCODINGS if encoding in self.bodies]
+        encoding = request.accept_encodings.best_match(available, default='identity')
+        headers = {
+            'ETag': f'"{self.etags[encoding]}"',
+            'Cache-Control': f"public, max-age={STATIC_CACHE_MAX_AGE}",
+            'Vary': 'Accept-Encoding',
+        }
+        # Any of our representations is a valid cached copy of the same content.
+        if any(request.if_none_match.contains_weak(etag) for etag in self.etags.values()):
+            return Response(status=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(self.bodies[encoding], mimetype='application/json', headers=headers)
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache with a time-to-live, mapping a key to
+    (status code, JSON body bytes). Counts hits, misses, evictions and expirations.
+    """
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()   # key -> (expires_at, status, body)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key):
+        """Returns (status, body) or None, and refreshes the entry's recency."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key, status, body):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, status, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
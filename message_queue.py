@@ -0,0 +1,202 @@
+# message_queue.py
+"""
+Message queue backends that let several realtime worker processes share
+Socket.IO broadcasts (see server.py).
+
+- "local" / "unix:///path/to.sock": a tiny broker over a Unix socket, started by
+  server.py itself, so no external service is needed.
+- "redis://..." and "amqp://..." (or any other kombu URL): python-socketio's
+  own Redis/Kombu managers.
+
+Every backend also carries 'fleet_sync' messages. The data generator is
+connected to only one worker, so that worker republishes each batch of train
+updates and every other worker applies it to its own copy of the fleet state.
+Each worker then builds frames for its own viewers only.
+
+'jobs_sync' messages carry the simulation scheduler's events the same way, so
+every worker keeps a replica of the jobs and generators (see scheduler.py).
+
+The local broker trusts its peers (messages are pickled, as in python-socketio's
+own managers), so its socket is created with owner-only permissions.
+"""
+import os
+import pickle
+import socket
+import struct
+import threading
+import time
+import socketio
+from socketio.pubsub_manager import PubSubManager
+
+_HEADER = struct.Struct('!I')
+
+
+# --- Framing helpers (length-prefixed pickles) ---
+
+def _send_frame(sock, payload):
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("broker connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def _recv_frame(sock):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return _recv_exact(sock, size)
+
+
+# --- Local broker ---
+
+class LocalBroker:
+    """
+    Fans every message it receives out to all connected workers (including
+    the sender, which python-socketio recognises by host_id and skips).
+    Runs on plain threads inside the server.py supervisor process.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._clients = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        os.chmod(self.path, 0o600)
+        listener.listen()
+        threading.Thread(target=self._accept_loop, args=(listener,), daemon=True).start()
+        return self
+
+    def _accept_loop(self, listener):
+        while True:
+            conn, _ = listener.accept()
+            client = (conn, threading.Lock())
+            with self._lock:
+                self._clients.append(client)
+            threading.Thread(target=self._read_loop, args=(client,), daemon=True).start()
+
+    def _read_loop(self, client):
+        conn, _ = client
+        try:
+            while True:
+                payload = _recv_frame(conn)
+                with self._lock:
+                    clients = list(self._clients)
+                for other in clients:
+                    try:
+                        with other[1]:
+                            _send_frame(other[0], payload)
+                    except OSError:
+                        pass  # its own read loop will notice and drop it
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self._lock:
+                if client in self._clients:
+                    self._clients.remove(client)
+            conn.close()
+
+
+# --- Client managers ---
+
+class FleetSyncMixin:
+    """
+    Adds 'fleet_sync' and 'jobs_sync' channels to a python-socketio pub/sub
+    manager. realtime.py sets fleet_listener and jobs_listener, and calls
+    publish_fleet() and publish_jobs().
+    """
+    fleet_listener = None
+    jobs_listener = None
+
+    def publish_fleet(self, payload):
+        self._publish({'method': 'fleet_sync', 'data': payload, 'host_id': self.host_id})
+
+    def publish_jobs(self, events):
+        self._publish({'method': 'jobs_sync', 'data': events, 'host_id': self.host_id})
+
+    def _listen(self):
+        for message in super()._listen():
+            data = message
+            if isinstance(message, bytes):
+                try:
+                    data = pickle.loads(message)
+                except Exception:
+                    yield message
+                    continue
+            if isinstance(data, dict) and data.get('method') in ('fleet_sync', 'jobs_sync'):
+                listener = self.fleet_listener if data['method'] == 'fleet_sync' else self.jobs_listener
+                if data.get('host_id') != self.host_id and listener is not None:
+                    listener(data['data'])
+                continue
+            yield data
+
+
+class LocalBrokerPubSub(PubSubManager):
+    """python-socketio pub/sub manager that talks to a LocalBroker."""
+    name = 'local'
+
+    def __init__(self, url, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = url[len('unix://'):]
+        self._publisher = None
+        self._publish_lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        return sock
+
+    def _publish(self, data):
+        payload = pickle.dumps(data)
+        with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = self._connect()
+                    _send_frame(self._publisher, payload)
+                    return
+                except OSError:
+                    self._publisher = None
+                    if attempt:
+                        raise
+
+    def _listen(self):
+        while True:
+            try:
+                sock = self._connect()
+                while True:
+                    yield pickle.loads(_recv_frame(sock))
+            except (ConnectionError, OSError):
+                self._get_logger().error('Cannot reach the local message broker; retrying in 1 second')
+                time.sleep(1)
+
+
+class LocalBrokerManager(FleetSyncMixin, LocalBrokerPubSub):
+    pass
+
+
+class RedisFleetManager(FleetSyncMixin, socketio.RedisManager):
+    pass
+
+
+class KombuFleetManager(FleetSyncMixin, socketio.KombuManager):
+    pass
+
+
+def create_client_manager(url):
+    """Builds the client manager for a message queue URL (None for a single process)."""
+    if not url:
+        return None
+    if url.startswith('unix://'):
+        return LocalBrokerManager(url)
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisFleetManager(url)
+    return KombuFleetManager(url)
@@ -0,0 +1,120 @@
+# motion.py
+"""
+Where every train is between two arrivals.
+
+A data generator reports each segment a train starts ('segments' in its
+'train_updates'): from station, to station, departure and arrival time.
+MotionTable keeps the latest segment of every running train in NumPy arrays,
+one slot per train (looked up by its short id, see realtime.py), so the
+positions of all trains at any moment are one vectorized interpolation. A
+train that arrived and has not left again is stored as a zero-length segment
+at its station.
+
+realtime.py uses it for the segment records ("m") in its frames and
+snapshots, and for the fixed-rate 'train_positions' stream.
+"""
+import numpy as np
+
+
+class MotionTable:
+    """
+    Latest segment of each train, by short id. Writers must not run
+    concurrently with each other or with positions() (realtime.py holds its
+    fleet-state lock for all of them).
+
+    Short ids on the wire are never reused, so the arrays are indexed by a
+    slot of their own instead: remove() frees a train's slot for the next
+    new train, and the table only grows with the number of trains running
+    at the same time.
+    """
+
+    def __init__(self, capacity=1024):
+        self.origin = np.zeros(capacity, dtype=np.int32)        # station id the segment starts at
+        self.destination = np.zeros(capacity, dtype=np.int32)   # station id it ends at
+        self.depart = np.zeros(capacity)                        # unix time it starts
+        self.arrive = np.zeros(capacity)                        # unix time it ends
+        self.active = np.zeros(capacity, dtype=bool)
+        self.short_ids = np.zeros(capacity, dtype=np.int64)     # short id of the train in each slot
+        self._slots = {}        # short id -> slot
+        self._free = []         # slots given back by remove(), reused first
+        self.size = 0           # slots handed out so far
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _slot(self, short_id):
+        slot = self._slots.get(short_id)
+        if slot is not None:
+            return slot
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = self.size
+            self.size += 1
+            self._grow(self.size)
+        self._slots[short_id] = slot
+        self.short_ids[slot] = short_id
+        return slot
+
+    def _grow(self, needed):
+        capacity = len(self.active)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        for name in ('origin', 'destination', 'depart', 'arrive', 'active', 'short_ids'):
+            old = getattr(self, name)
+            grown = np.zeros(new_capacity, dtype=old.dtype)
+            grown[:capacity] = old
+            setattr(self, name, grown)
+
+    def stop(self, short_id, station_id):
+        """The train is standing at a station."""
+        self.travel(short_id, station_id, station_id, 0.0, 0.0)
+
+    def travel(self, short_id, origin, destination, depart, arrive):
+        """The train runs from origin to destination between two unix times."""
+        slot = self._slot(short_id)
+        self.origin[slot] = origin
+        self.destination[slot] = destination
+        self.depart[slot] = depart
+        self.arrive[slot] = arrive
+        self.active[slot] = True
+
+    def remove(self, short_id):
+        """Forgets a train that finished (or was dropped) and frees its slot."""
+        slot = self._slots.pop(short_id, None)
+        if slot is not None:
+            self.active[slot] = False
+            self._free.append(slot)
+
+    def segment(self, short_id):
+        """[origin, destination, depart, arrive] of a train between stations, else None."""
+        slot = self._slots.get(short_id)
+        if slot is None or not self.active[slot] or self.origin[slot] == self.destination[slot]:
+            return None
+        return [int(self.origin[slot]), int(self.destination[slot]),
+                round(float(self.depart[slot]), 2), round(float(self.arrive[slot]), 2)]
+
+    def remap_stations(self, mapping):
+        """Moves station ids to a new network; mapping[old id] is the new id, or None if it is gone."""
+        slots = np.flatnonzero(self.active)
+        lookup = np.array([-1 if new_id is None else new_id for new_id in mapping], dtype=np.int32)
+        origin, destination = lookup[self.origin[slots]], lookup[self.destination[slots]]
+        self.origin[slots], self.destination[slots] = origin, destination
+        self.active[slots[(origin < 0) | (destination < 0)]] = False
+
+    def positions(self, now, lats, lons, scale):
+        """
+        (short ids, lat, lon) of every train with a known position at unix
+        time `now`, interpolated along its segment and quantized to integer
+        multiples of 1/scale degree.
+        """
+        slots = np.flatnonzero(self.active)
+        origin, destination = self.origin[slots], self.destination[slots]
+        span = np.maximum(self.arrive[slots] - self.depart[slots], 1e-9)
+        frac = np.clip((now - self.depart[slots]) / span, 0.0, 1.0)
+        lat = lats[origin] + frac * (lats[destination] - lats[origin])
+        lon = lons[origin] + frac * (lons[destination] - lons[origin])
+        known = ~(np.isnan(lat) | np.isnan(lon))
+        return (self.short_ids[slots][known], np.rint(lat[known] * scale).astype(np.int64),
+                np.rint(lon[known] * scale).astype(np.int64))
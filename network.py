@@ -0,0 +1,389 @@
+# network.py
+"""
+The in-memory model of the metro network, indexed by integer station id.
+
+A NetworkData object holds everything the API needs to answer requests:
+station names and coordinates, CSR adjacency, fare/time matrices and the
+precomputed all-pairs route table. It can be built in two ways:
+
+- load_from_sqlite(): the original loader (pandas read_sql + pivot + graph),
+  followed by compile_network(). Used by database.py and as a fallback.
+- load_artifact(): memory-maps the compiled artifact that database.py writes
+  next to the SQLite file. No pandas import, no pivoting, no BFS: pages are
+  read on demand and shared between worker processes by the OS.
+
+Artifact layout (a directory holding one subdirectory per written version,
+and a CURRENT file naming the one to read; see write_array_dir()). Each
+version has one .npy file per array plus meta.json:
+    lats, lons          float64  station coordinates (NaN if unknown)
+    fares               float32  N x N segment fares (NaN if missing)
+    times               int16    N x N segment minutes (-1 if missing)
+    indptr, indices     int32    CSR adjacency
+    route_pred          int32    all-pairs BFS predecessors (-1 if none)
+    route_fare          float64  cumulative fare along each table route
+    route_time          int32    cumulative minutes along each table route
+    route_incomplete    bool     a segment on the table route had no data
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from collections import deque
+import numpy as np
+from config import DATABASE_NAME, INTERCHANGE_STATIONS
+from spatial import StationIndex
+
+ARTIFACT_FORMAT_VERSION = 1
+CURRENT_POINTER = 'CURRENT'   # file naming the artifact's current version subdirectory
+MISSING_MINUTES = -1
+
+_ARRAYS = ('lats', 'lons', 'fares', 'times', 'indptr', 'indices',
+           'route_pred', 'route_fare', 'route_time', 'route_incomplete')
+
+
+class NetworkData:
+    """One immutable version of the network. See the module docstring for the arrays."""
+
+    def __init__(self, names, arrays, version, source, source_version=None):
+        self.station_names = list(names)
+        self.station_ids = {name: i for i, name in enumerate(self.station_names)}
+        self.version = version                  # hash of the compiled arrays
+        self.source = source                    # 'sqlite' or 'artifact'
+        self.source_version = source_version    # dataset_meta.dataset_version it was built from
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+
+        transfer_edges = set()
+        for stn1, stn2 in INTERCHANGE_STATIONS.items():
+            if stn1 in self.station_ids and stn2 in self.station_ids:
+                transfer_edges.add((self.station_ids[stn1], self.station_ids[stn2]))
+                transfer_edges.add((self.station_ids[stn2], self.station_ids[stn1]))
+        self.transfer_edges = frozenset(transfer_edges)
+        # Nearest-station / bounding-box lookups and the viewport grid cell of each station.
+        self.spatial = StationIndex(self.lats, self.lons)
+
+    def __len__(self):
+        return len(self.station_names)
+
+    def segment_fares(self, src, dst):
+        """Fares of the segments src[i] -> dst[i] as float64 (NaN where missing)."""
+        return self.fares[src, dst].astype(float)
+
+    def segment_minutes(self, src, dst):
+        """Minutes of the segments src[i] -> dst[i] as float64 (NaN where missing)."""
+        minutes = self.times[src, dst].astype(float)
+        minutes[minutes == MISSING_MINUTES] = np.nan
+        return minutes
+
+    def neighbours(self, u):
+        return self.indices[self.indptr[u]:self.indptr[u + 1]]
+
+    # --- All-pairs route table ---
+
+    def lookup_route(self, origin, destination):
+        """
+        Reads a route out of the precomputed table.
+        Returns (path, total_fare, total_time, incomplete) or None if there is no route.
+        """
+        o, d = self.station_ids.get(origin), self.station_ids.get(destination)
+        if o is None or d is None or self.route_pred[o, d] < 0:
+            return None
+        return (self.table_path(o, d), float(self.route_fare[o, d]),
+                float(self.route_time[o, d]), bool(self.route_incomplete[o, d]))
+
+    def table_path_ids(self, o, d):
+        """Rebuilds the station ids on the table route o -> d by walking the predecessors."""
+        pred_row = self.route_pred[o]
+        path_ids = [d]
+        while path_ids[-1] != o:
+            path_ids.append(int(pred_row[path_ids[-1]]))
+        return path_ids[::-1]
+
+    def table_path(self, o, d):
+        """The station names on the table route o -> d."""
+        return [self.station_names[i] for i in self.table_path_ids(o, d)]
+
+    def station_records(self, station_ids=None):
+        """The /api/stations payload: name, coordinates and id of every station (or of station_ids)."""
+        if station_ids is None:
+            station_ids = range(len(self))
+        records = []
+        for i in station_ids:
+            lat, lon = float(self.lats[i]), float(self.lons[i])
+            records.append({
+                "name": self.station_names[i],
+                "latitude": None if lat != lat else lat,
+                "longitude": None if lon != lon else lon,
+                "id": int(i),
+            })
+        return records
+
+
+# --- Building ---
+
+def build_route_table(n, indptr, indices, fares, times):
+    """
+    Runs one BFS per origin over the station graph and stores the resulting
+    shortest-path tree as a predecessor matrix, together with cumulative fare
+    and time arrays. A route request then only has to walk the predecessors
+    back from the destination instead of searching the graph.
+    `fares` and `times` are float64 matrices with NaN for missing segments.
+    """
+    adjacency = [indices[indptr[u]:indptr[u + 1]].tolist() for u in range(n)]
+    pred = np.full((n, n), -1, dtype=np.int32)
+    cum_fare = np.zeros((n, n), dtype=float)
+    cum_time = np.zeros((n, n), dtype=np.int32)
+    incomplete = np.zeros((n, n), dtype=bool)
+
+    for origin in range(n):
+        p_row, f_row, t_row, inc_row = pred[origin], cum_fare[origin], cum_time[origin], incomplete[origin]
+        visited = [False] * n
+        visited[origin] = True
+        queue = deque([origin])
+        while queue:
+            current = queue.popleft()
+            for neighbor in adjacency[current]:
+                if visited[neighbor]:
+                    continue
+                visited[neighbor] = True
+                p_row[neighbor] = current
+                seg_fare, seg_time = fares[current, neighbor], times[current, neighbor]
+                if inc_row[current] or np.isnan(seg_fare) or np.isnan(seg_time):
+                    # Once a segment is missing, stop accumulating for the rest of the path.
+                    inc_row[neighbor] = True
+                    f_row[neighbor] = f_row[current]
+                    t_row[neighbor] = t_row[current]
+                else:
+                    f_row[neighbor] = f_row[current] + seg_fare
+                    t_row[neighbor] = t_row[current] + int(seg_time)
+                queue.append(neighbor)
+
+    return pred, cum_fare, cum_time, incomplete
+
+def compile_network(names, lats, lons, fares, times, connections, source, source_version=None):
+    """
+    Turns raw inputs into a NetworkData.
+
+    Args:
+        names (list): Station names; the position is the station id.
+        lats, lons (np.ndarray): Coordinates (NaN if unknown).
+        fares, times (np.ndarray): N x N float64 matrices, NaN where missing.
+        connections (list): (station id, station id) pairs in database order.
+            The adjacency lists keep this order, so tie-breaking between
+            equal-length routes matches the original BFS.
+    """
+    n = len(names)
+    adjacency = [[] for _ in range(n)]
+    for a, b in connections:
+        adjacency[a].append(b)
+        adjacency[b].append(a)
+    indptr = np.zeros(n + 1, dtype=np.int32)
+    indptr[1:] = np.cumsum([len(neighbours) for neighbours in adjacency])
+    indices = np.array([v for neighbours in adjacency for v in neighbours], dtype=np.int32)
+
+    start = time.perf_counter()
+    route_pred, route_fare, route_time, route_incomplete = build_route_table(n, indptr, indices, fares, times)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"[SUCCESS] Built all-pairs route table for {n} stations in {elapsed_ms:.1f} ms.")
+
+    arrays = {
+        'lats': np.asarray(lats, dtype=float),
+        'lons': np.asarray(lons, dtype=float),
+        'fares': fares.astype(np.float32),
+        'times': np.where(np.isnan(times), MISSING_MINUTES, times).astype(np.int16),
+        'indptr': indptr,
+        'indices': indices,
+        'route_pred': route_pred,
+        'route_fare': route_fare,
+        'route_time': route_time,
+        'route_incomplete': route_incomplete,
+    }
+    digest = hashlib.sha256('\n'.join(names).encode())
+    for name in ('fares', 'times', 'indptr', 'indices'):
+        digest.update(arrays[name].tobytes())
+    return NetworkData(names, arrays, digest.hexdigest()[:16], source, source_version)
+
+def load_from_sqlite(db_file=DATABASE_NAME):
+    """
+    Loads data from the clean SQLite database with Pandas and compiles it.
+    This is the original startup path; servers normally use load_artifact().
+    """
+    import pandas as pd
+
+    print("--- Loading clean data from SQLite into memory ---")
+    conn = sqlite3.connect(db_file)
+
+    # Load stations, fares, and times into Pandas
+    stations_df = pd.read_sql_query("SELECT * FROM stations ORDER BY name", conn, index_col='name')
+    fares_raw = pd.read_sql_query("SELECT * FROM fares", conn)
+    times_raw = pd.read_sql_query("SELECT * FROM times", conn)
+
+    # Load connections to build the graph
+    connections_raw = pd.read_sql_query("SELECT * FROM connections", conn)
+    source_version = read_dataset_version(conn)
+    conn.close()
+
+    # Pivot fares and times into matrix format
+    fare_df = fares_raw.pivot(index='origin', columns='destination', values='price')
+    time_df = times_raw.pivot(index='origin', columns='destination', values='minutes')
+
+    names = sorted(set(stations_df.index)
+                   | set(connections_raw['origin_name']) | set(connections_raw['destination_name']))
+    ids = {name: i for i, name in enumerate(names)}
+    coords = stations_df.reindex(names)
+    connections = [(ids[a], ids[b]) for a, b in zip(connections_raw['origin_name'], connections_raw['destination_name'])]
+
+    print(f"[SUCCESS] Loaded data and built graph for {len(stations_df)} stations.")
+    return compile_network(
+        names,
+        coords['latitude'].to_numpy(dtype=float), coords['longitude'].to_numpy(dtype=float),
+        fare_df.reindex(index=names, columns=names).to_numpy(dtype=float),
+        time_df.reindex(index=names, columns=names).to_numpy(dtype=float),
+        connections, source='sqlite', source_version=source_version,
+    )
+
+def read_dataset_version(conn):
+    """The dataset version database.py recorded, or None for an older database."""
+    try:
+        row = conn.execute("SELECT value FROM dataset_meta WHERE key = 'dataset_version'").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+# --- Compiled artifact ---
+
+def artifact_dir(db_file=DATABASE_NAME):
+    """The artifact lives next to the database: db.sqlite -> db.network/"""
+    return os.path.splitext(db_file)[0] + '.network'
+
+def current_array_dir(directory):
+    """
+    The version subdirectory that directory/CURRENT names, or directory
+    itself for an artifact written before versions existed.
+    """
+    try:
+        with open(os.path.join(directory, CURRENT_POINTER)) as f:
+            name = f.read().strip()
+    except OSError:
+        return directory
+    return os.path.join(directory, name) if name else directory
+
+def write_array_dir(directory, arrays, meta):
+    """
+    Writes {name: array} as .npy files plus meta.json into a new version
+    subdirectory, then points directory/CURRENT at it with os.replace(). The
+    switch is atomic, so a server that loads at any moment sees either the
+    old or the new version, never a half-written or missing one. The previous
+    version is kept for readers that resolved CURRENT just before the switch;
+    older ones are removed. Also used by gtfs.py.
+    """
+    os.makedirs(directory, exist_ok=True)
+    previous = current_array_dir(directory)
+    name = f"v{time.time_ns()}"
+    tmp_dir = os.path.join(directory, name + '.tmp')
+    os.makedirs(tmp_dir)
+    for array_name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{array_name}.npy"), array)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    os.rename(tmp_dir, os.path.join(directory, name))
+    pointer_tmp = os.path.join(directory, CURRENT_POINTER + '.tmp')
+    with open(pointer_tmp, 'w') as f:
+        f.write(name)
+    os.replace(pointer_tmp, os.path.join(directory, CURRENT_POINTER))
+
+    keep = {name, CURRENT_POINTER, os.path.basename(previous)}
+    for entry in os.listdir(directory):
+        path = os.path.join(directory, entry)
+        if entry in keep:
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif previous != directory:   # the files of an unversioned artifact, once nothing reads them
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def read_array_dir(directory, names):
+    """Memory-maps the named .npy files of an artifact directory."""
+    return {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r') for name in names}
+
+def save_artifact(network, directory):
+    """Writes a NetworkData as an artifact directory."""
+    write_array_dir(directory, {name: getattr(network, name) for name in _ARRAYS}, {
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'dataset_version': network.version,
+        'source_version': network.source_version,
+        'stations': network.station_names,
+    })
+
+def load_current_version(directory, load, attempts=5):
+    """
+    Calls load(version_dir) on the version CURRENT names. A writer can switch
+    CURRENT and prune that version while it is being read; the read is then
+    retried on the new version instead of failing or reporting no artifact.
+    Also used by gtfs.py.
+    """
+    for _ in range(attempts - 1):
+        version_dir = current_array_dir(directory)
+        try:
+            result = load(version_dir)
+        except FileNotFoundError:
+            if current_array_dir(directory) == version_dir:
+                raise
+            continue
+        if result is None and current_array_dir(directory) != version_dir:
+            continue
+        return result
+    return load(current_array_dir(directory))
+
+def load_artifact(directory):
+    """
+    Memory-maps an artifact directory. Returns None if it is missing or was
+    written by an incompatible version of this module.
+    """
+    return load_current_version(directory, _load_artifact_version)
+
+def _load_artifact_version(version_dir):
+    meta = read_artifact_meta(version_dir)
+    if meta.get('format_version') != ARTIFACT_FORMAT_VERSION:
+        return None
+    arrays = read_array_dir(version_dir, _ARRAYS)
+    return NetworkData(meta['stations'], arrays, meta['dataset_version'], 'artifact', meta.get('source_version'))
+
+def read_artifact_meta(directory):
+    """The artifact's meta.json as a dict ({} if there is no readable artifact)."""
+    try:
+        with open(os.path.join(directory, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def load_network(db_file=DATABASE_NAME):
+    """
+    Loads the compiled artifact if there is a usable one, otherwise falls back
+    to SQLite. An artifact built from an older dataset than the database holds
+    (see database.py) counts as unusable.
+    """
+    start = time.perf_counter()
+    network = load_artifact(artifact_dir(db_file))
+    if network is None:
+        print("[WARNING] No compiled network artifact found; loading from SQLite. Rerun database.py to create it.")
+        network = load_from_sqlite(db_file)
+    else:
+        try:
+            conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+            db_version = read_dataset_version(conn)
+            conn.close()
+        except sqlite3.Error:  # no database next to the artifact: nothing to compare against
+            db_version = None
+        if db_version is not None and db_version != network.source_version:
+            print("[WARNING] Network artifact is older than the database; loading from SQLite. Rerun database.py to update it.")
+            network = load_from_sqlite(db_file)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"[SUCCESS] Network {network.version} ({len(network)} stations) loaded from {network.source} in {elapsed_ms:.1f} ms.")
+    return network
@@ -0,0 +1,199 @@
+# raptor.py
+"""
+Timetable journey planning with RAPTOR (Round-bAsed Public Transit Optimized Router).
+
+Works on a gtfs.Timetable. Round k finds the earliest arrival at every stop
+using at most k trips: it scans each pattern (see gtfs.py) once, boarding the
+earliest trip that can still be caught, then relaxes walking transfers.
+Because every round adds one trip, the rounds that improve the arrival at the
+destination form the Pareto set of (arrival time, number of transfers).
+
+The departure/arrival arrays are read through memoryviews over the
+memory-mapped .npy files, so the engine holds no copy of the stop_times.
+"""
+from bisect import bisect_left
+import numpy as np
+from telemetry import Counter
+
+INFINITY = 2 ** 31 - 1
+
+PATTERNS_SCANNED = Counter('metro_raptor_patterns_scanned_total', "Timetable patterns scanned by RAPTOR rounds.")
+
+
+def _int32_view(array):
+    """Zero-copy memoryview of an int32 array, indexable as Python ints."""
+    return memoryview(np.ascontiguousarray(array, dtype=np.int32)).cast('B').cast('i')
+
+def format_time(seconds):
+    """29100 -> '08:05:00'. Hours continue past 24 for trips after midnight."""
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def parse_clock(text):
+    """'08:05' or '08:05:30' -> seconds after midnight, or None if it is not a valid time."""
+    parts = text.split(':')
+    # isdigit() alone also accepts digits int() cannot read, such as '²'.
+    if len(parts) not in (2, 3) or not all(part.isascii() and part.isdigit() for part in parts):
+        return None
+    hours, minutes, seconds = (int(part) for part in parts + ['0'] * (3 - len(parts)))
+    if minutes >= 60 or seconds >= 60 or hours >= 48:
+        return None
+    return hours * 3600 + minutes * 60 + seconds
+
+
+class RaptorEngine:
+    """
+    Query structures for one imported timetable.
+
+    Args:
+        timetable (gtfs.Timetable): The compiled feed.
+    """
+
+    def __init__(self, timetable):
+        self.timetable = timetable
+        self.n = len(timetable)
+        self.stop_names = timetable.stop_names.tolist()
+        self.pattern_stop_ptr = timetable.pattern_stop_ptr.tolist()
+        self.pattern_stops = timetable.pattern_stops.tolist()
+        self.pattern_trip_ptr = timetable.pattern_trip_ptr.tolist()
+        self.pattern_time_ptr = timetable.pattern_time_ptr.tolist()
+        self.pattern_route = timetable.pattern_route.tolist()
+        self.stop_pattern_ptr = timetable.stop_pattern_ptr.tolist()
+        self.stop_patterns = timetable.stop_patterns.tolist()
+        self.stop_pattern_pos = timetable.stop_pattern_pos.tolist()
+        self.foot_ptr = timetable.foot_ptr.tolist()
+        self.foot_to = timetable.foot_to.tolist()
+        self.foot_seconds = timetable.foot_seconds.tolist()
+        self.change_seconds = timetable.change_seconds.tolist()
+        self.arrivals = _int32_view(timetable.arrivals)
+        self.departures = _int32_view(timetable.departures)
+
+    def journeys(self, sources, targets, depart_at, max_transfers):
+        """
+        Pareto-optimal journeys from any of the source stops, leaving no
+        earlier than depart_at (seconds), to any of the target stops.
+
+        Returns a list of journeys ordered by number of transfers (ascending)
+        and so by arrival time (descending); each is a dict with "arrival",
+        "transfers" and "legs". The last one arrives earliest.
+        """
+        n = self.n
+        targets = set(targets)
+        # With local pruning a round only keeps arrivals that beat every earlier
+        # round, so one list of earliest arrivals serves all rounds.
+        best = [INFINITY] * n          # earliest arrival at each stop so far
+        ready = [INFINITY] * n         # earliest time a trip can be boarded there
+        round_parents = [{}]           # per round: stop -> how it was reached
+        marked = set()
+        for s in sources:
+            ready[s] = best[s] = depart_at
+            round_parents[0][s] = ('source',)
+            marked.add(s)
+        marked |= self._relax_footpaths(set(marked), ready, best, round_parents[0], INFINITY)
+
+        journeys = []
+        best_target = min((best[t] for t in targets), default=INFINITY)
+        if best_target < INFINITY:
+            journeys.append(self._journey(round_parents, 0, min(targets, key=best.__getitem__), best))
+
+        for k in range(1, max_transfers + 2):
+            if not marked:
+                break
+            # Each pattern is scanned from the earliest stop that improved in the last round.
+            queue = {}
+            ptr, patterns, positions = self.stop_pattern_ptr, self.stop_patterns, self.stop_pattern_pos
+            for s in marked:
+                for i in range(ptr[s], ptr[s + 1]):
+                    p, pos = patterns[i], positions[i]
+                    if queue.get(p, INFINITY) > pos:
+                        queue[p] = pos
+
+            prev_ready = ready
+            ready = list(ready)
+            parents = {}
+            round_parents.append(parents)
+            marked = set()
+            PATTERNS_SCANNED.inc(len(queue))
+            for p, start in queue.items():
+                self._scan_pattern(p, start, prev_ready, ready, best, parents, marked, best_target)
+            marked |= self._relax_footpaths(set(marked), ready, best, parents, best_target)
+
+            target = min(targets, key=best.__getitem__)
+            if best[target] < best_target:
+                best_target = best[target]
+                journeys.append(self._journey(round_parents, k, target, best))
+        return journeys
+
+    def _scan_pattern(self, p, start, prev_ready, ready, best, parents, marked, best_target):
+        """Rides the pattern's trips from position `start`, hopping onto earlier trips where possible."""
+        stops = self.pattern_stops[self.pattern_stop_ptr[p]:self.pattern_stop_ptr[p + 1]]
+        ntrips = self.pattern_trip_ptr[p + 1] - self.pattern_trip_ptr[p]
+        base = self.pattern_time_ptr[p]
+        arrivals, departures, change = self.arrivals, self.departures, self.change_seconds
+        trip = -1
+        board_pos = -1
+        for pos in range(start, len(stops)):
+            s = stops[pos]
+            column = base + pos * ntrips
+            if trip >= 0:
+                a = arrivals[column + trip]
+                if a < best[s] and a < best_target:
+                    best[s] = a
+                    ready[s] = a + change[s]
+                    parents[s] = ('trip', p, trip, board_pos, pos)
+                    marked.add(s)
+            t = prev_ready[s]
+            if t < INFINITY and (trip < 0 or t <= departures[column + trip]):
+                hi = column + (trip if trip >= 0 else ntrips)
+                j = bisect_left(departures, t, column, hi)
+                if j < hi:
+                    trip, board_pos = j - column, pos
+
+    def _relax_footpaths(self, improved, ready, best, parents, best_target):
+        """Walks from every stop improved this round. Returns the stops reached on foot."""
+        walked = set()
+        for s in improved:
+            for i in range(self.foot_ptr[s], self.foot_ptr[s + 1]):
+                to = self.foot_to[i]
+                a = best[s] + self.foot_seconds[i]
+                if a < best[to] and a < best_target:
+                    ready[to] = best[to] = a
+                    parents[to] = ('walk', s, self.foot_seconds[i])
+                    walked.add(to)
+        return walked
+
+    def _journey(self, round_parents, k, target, best):
+        """Follows the parent pointers back from `target` in round k and builds the legs."""
+        names = self.stop_names
+        legs = []
+        stop, r = target, k
+        while True:
+            # A label kept from an earlier round was set in the latest round that recorded it.
+            while stop not in round_parents[r]:
+                r -= 1
+            parent = round_parents[r][stop]
+            if parent[0] == 'source':
+                break
+            if parent[0] == 'walk':
+                _, origin, seconds = parent
+                legs.append({"mode": "walk", "from": names[origin], "to": names[stop], "seconds": seconds})
+                stop = origin
+                continue
+            _, p, trip, board_pos, alight_pos = parent
+            stops = self.pattern_stops[self.pattern_stop_ptr[p]:self.pattern_stop_ptr[p + 1]]
+            ntrips = self.pattern_trip_ptr[p + 1] - self.pattern_trip_ptr[p]
+            base = self.pattern_time_ptr[p]
+            route = self.pattern_route[p]
+            legs.append({
+                "mode": "trip",
+                "route": self.timetable.route_names[route] if route >= 0 else None,
+                "trip_id": str(self.timetable.trip_ids[self.pattern_trip_ptr[p] + trip]),
+                "from": names[stops[board_pos]],
+                "to": names[stops[alight_pos]],
+                "depart": format_time(self.departures[base + board_pos * ntrips + trip]),
+                "arrive": format_time(self.arrivals[base + alight_pos * ntrips + trip]),
+                "stops": [names[s] for s in stops[board_pos:alight_pos + 1]],
+            })
+            stop, r = stops[board_pos], r - 1
+        legs.reverse()
+        trips = sum(1 for leg in legs if leg["mode"] == "trip")
+        return {"arrival": best[target], "transfers": max(trips - 1, 0), "legs": legs}
@@ -5,25 +5,754 @@ Manages all real-time WebSocket communication using Flask-SocketIO.
 This module initializes the SocketIO server and defines the event handlers
 for client connections, disconnections, and custom application events like
 receiving and broadcasting train position updates.
+
+Train updates are not forwarded one by one. They are buffered and, once per
+BROADCAST_INTERVAL_SECONDS, each subscription room with viewers receives a
+single 'train_frame' holding only the trains that changed in that room:
+
+    {"room": "line:Kajang Line",     # subscription the frame belongs to
+     "seq": 42,                      # per-room frame sequence number
+     "t": [[3, 17], [8, 40]],        # [short train id, station id] pairs
+     "gone": [5],                    # trains that left the room or finished
+     "names": {"8": "Train-1008"},   # short ids that entered the room in this frame
+     "m": [[3, 17, 18, 1792287001.5, 1792287013.0]],
+     "now": 1792287002.1}
+
+"m" holds the segments trains in the room started since the last frame:
+[short id, from station id, to station id, unix departure, unix arrival].
+Clients move the train along it on their own until its next "t" arrival, and
+"now" (sent with "m") is the server's clock to correct theirs by. Snapshots
+carry the segments of the room's travelling trains the same way.
+
+Rooms are "all" (the default), "line:<line name>", "station:<station id>" and
+"cell:<row>:<col>" grid cells (see spatial.py). Clients choose theirs with the
+'subscribe' event. Station ids are the "id" field of /api/stations.
+
+A client that subscribes, or that sees a gap in a room's "seq", gets a full
+'train_snapshot' of that room with the same layout. When the dataset is
+reloaded, clients receive 'network_reloaded' {"version"}: station ids may have
+changed, so they should re-fetch /api/network and re-subscribe. Clients that connect with
+auth {"format": "msgpack"} receive msgpack bytes ('train_frame_bin' /
+'train_snapshot_bin') instead of JSON.
+
+Clients that cannot interpolate send 'subscribe_positions' and then receive
+every train's position POSITION_STREAM_HZ times a second ('train_positions').
+
+Every update is also appended to a fixed-size history ring buffer (see
+history.py), served as GET /api/trains/history and replayed to a client with
+the 'replay' event. Its rows are [unix time, train id, station name], with a
+null station once the train finished its journey.
+
+'start_simulation' requests from kiosks go to a job scheduler (see
+scheduler.py), which sends each route as 'new_route_to_simulate' to exactly one
+data generator, never to viewers.
 """
 
-from flask_socketio import SocketIO, emit
+import json
+import os
+import socket
+import threading
+import time
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from flask import jsonify, request
+from flask_socketio import SocketIO, emit, join_room, leave_room
+from config import (BROADCAST_INTERVAL_SECONDS, LINES, MAX_SUBSCRIPTION_CELLS, TRAIN_HISTORY_MAX_EVENTS,
+                    MAX_HISTORY_RESPONSE_EVENTS, MAX_REPLAY_SPEED, SIMULATION_REQUESTS_PER_MINUTE,
+                    SIMULATION_REQUEST_BURST, MAX_SIMULATION_JOBS, SIMULATION_JOB_TIMEOUT_SECONDS,
+                    POSITION_STREAM_HZ, POSITION_STREAM_SCALE)
+from history import FINISHED, REMOVED, PositionHistory
+from message_queue import create_client_manager
+from motion import MotionTable
+from scheduler import SimulationScheduler
+from spatial import cell_key, cells_in_bbox, valid_coordinate
+import telemetry
+from telemetry import log_event
+import routes
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; JSON frames work without it.
+    msgpack = None
 
 # Create the SocketIO server instance.
-# 'async_mode' is set for compatibility with the Flask development server.
+# 'async_mode' is set for compatibility with the Flask development server;
+# server.py workers override it (and add a message queue) via server_options().
 socketio = SocketIO(async_mode='threading')
 
+def server_options():
+    """
+    Extra SocketIO.init_app() options for this process. server.py passes the
+    async worker type and message queue URL to its workers through the
+    METRO_ASYNC_MODE and METRO_MESSAGE_QUEUE environment variables.
+    """
+    options = {}
+    async_mode = os.environ.get('METRO_ASYNC_MODE')
+    if async_mode:
+        options['async_mode'] = async_mode
+        # Workers share one port (SO_REUSEPORT) without sticky sessions, so a
+        # client must stay on a single TCP connection: WebSocket only.
+        options['transports'] = ['websocket']
+    manager = create_client_manager(os.environ.get('METRO_MESSAGE_QUEUE'))
+    if manager is not None:
+        manager.fleet_listener = apply_train_updates
+        manager.jobs_listener = receive_job_events
+        options['client_manager'] = manager
+    return options
+
+ALL_ROOM = 'all'
+
+# --- Fleet State (guarded by _state_lock) ---
+_state_lock = threading.Lock()
+train_short_ids = {}   # "Train-1008" -> 8 (short id used on the wire)
+train_names = {}       # 8 -> "Train-1008"
+train_positions = {}   # short id -> current station id
+_changed = {}          # short id -> station id, changed since the last frame
+_moved_from = {}       # short id -> station id it was at in the last frame (None if new)
+_gone = {}             # short id -> (last station id, name), for trains that finished since the last frame
+_segments = {}         # short id -> [from, to, depart, arrive] of the segment it started since the last frame
+_next_short_id = 0
+_broadcaster_started = False
+_state_network = None  # the routes network whose station ids the state above uses
+_buffered_since = None # monotonic time of the oldest update not yet sent in a frame
+train_history = PositionHistory(TRAIN_HISTORY_MAX_EVENTS)  # every update, in the same station ids
+train_motion = MotionTable()  # latest segment (or station) of every train, by short id
+
+# --- Subscriptions (guarded by _state_lock) ---
+_subscriptions = {}              # sid -> (format, set of room keys)
+_room_viewers = Counter()        # (format, room key) -> number of subscribed clients
+_room_seq = defaultdict(int)     # room key -> last frame sequence number
+_room_index = (None, [])         # (network it was built for, station id -> room keys)
+
+# --- Position Stream (guarded by _state_lock) ---
+_position_subscribers = {}       # sid -> format, for clients receiving 'train_positions'
+_position_viewers = Counter()    # format -> number of those clients
+_position_names_from = 0         # short ids from here on have not been named in the stream yet
+_position_stream_started = False
+
+# --- History Replays ---
+REPLAY_FRAME_SECONDS = 0.1       # a replay sends at most one 'replay_frame' per this many seconds
+_replays = {}                    # sid -> token of the replay running for that client
+
+# --- Simulation Jobs ---
+# Named after the worker slot (server.py sets METRO_WORKER_INDEX), so a restarted worker keeps its name.
+simulations = SimulationScheduler(f"{socket.gethostname()}/{os.environ.get('METRO_WORKER_INDEX', os.getpid())}",
+                                  SIMULATION_REQUESTS_PER_MINUTE, SIMULATION_REQUEST_BURST, MAX_SIMULATION_JOBS,
+                                  SIMULATION_JOB_TIMEOUT_SECONDS)
+
+# --- Metrics (rendered by GET /metrics, see telemetry.py) ---
+CONNECTED = telemetry.Gauge('metro_socketio_connected_clients',
+                            "Open Socket.IO connections on this process, by role.", ['role'])
+MESSAGES_OUT = telemetry.Counter('metro_socketio_messages_sent_total',
+                                 "Socket.IO messages delivered to clients, by event.", ['event'])
+BYTES_OUT = telemetry.Counter('metro_socketio_bytes_sent_total', "Payload bytes delivered to clients, by event.",
+                              ['event'])
+TRAIN_UPDATES = telemetry.Counter('metro_train_updates_received_total',
+                                  "Train position updates received from data generators.")
+BROADCAST_DURATION = telemetry.Histogram('metro_broadcast_duration_seconds',
+                                         "Time to build and emit one round of train frames.")
+SIMULATION_REQUESTS = telemetry.Counter('metro_simulation_requests_total',
+                                        "'start_simulation' requests, by outcome.", ['outcome'])
+POSITION_STREAM_DURATION = telemetry.Histogram('metro_position_stream_duration_seconds',
+                                               "Time to compute and emit one round of 'train_positions'.")
+BROADCAST_DELAY = telemetry.Histogram('metro_broadcast_delay_seconds',
+                                      "Age of the oldest buffered train update when its frame is sent.",
+                                      buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0))
+
+def watched_rooms_by_format():
+    counts = defaultdict(int)
+    for (fmt, _), viewers in list(_room_viewers.items()):
+        if viewers:
+            counts[(fmt,)] += 1
+    return counts
+
+telemetry.Callback('metro_socketio_watched_rooms', "Rooms with at least one viewer, by encoding.",
+                   watched_rooms_by_format, labelnames=('format',))
+telemetry.Callback('metro_simulation_jobs', "Simulation jobs, running on a generator or queued.",
+                   lambda: {(state,): count for state, count in simulations.counts().items()},
+                   labelnames=('state',))
+telemetry.Callback('metro_simulation_generators', "Data generators registered with the job scheduler.",
+                   lambda: len(simulations.generators))
+telemetry.Callback('metro_trains_tracked', "Trains currently in the fleet state.", lambda: len(train_positions))
+telemetry.Callback('metro_train_history_events', "Position events held in the history ring buffer.",
+                   lambda: len(train_history))
+telemetry.Callback('metro_train_history_recorded_total', "Position events appended to the history ring buffer.",
+                   lambda: train_history.written, kind='counter')
+
+def history_span_seconds():
+    oldest = train_history.oldest_time()
+    return None if oldest is None else time.time() - oldest
+
+telemetry.Callback('metro_train_history_span_seconds', "Age of the oldest event in the history ring buffer.",
+                   history_span_seconds)
+
+# --- Station -> Room Index ---
+
+def state_network():
+    """
+    The network the fleet state's station ids refer to. It only changes in
+    remap_fleet_state(), together with the ids, so the two always match.
+    """
+    global _state_network
+    if _state_network is None:
+        net = routes.get_network()
+        with _state_lock:
+            if _state_network is None:
+                _state_network = net
+    return _state_network
+
+def station_rooms(net):
+    """
+    Returns, for each station id, the room keys an update at that station is
+    routed to. Built once per version of the station table.
+    """
+    global _room_index
+    if _room_index[0] is net:
+        return _room_index[1]
+
+    lines_by_station = defaultdict(list)
+    for line_name, stations in LINES.items():
+        for name in stations:
+            lines_by_station[name].append(f"line:{line_name}")
+
+    index = []
+    for station_id, name in enumerate(net.station_names):
+        keys = [ALL_ROOM, f"station:{station_id}"] + lines_by_station[name]
+        cell = net.spatial.cell_of_station(station_id)
+        if cell is not None:  # stations without coordinates have no cell
+            keys.append(cell_key(cell))
+        index.append(frozenset(keys))
+    _room_index = (net, index)
+    return index
+
+# --- Frame Building ---
+
+def record_update(train_id, station_name):
+    """Buffers one train update. Returns False if the station is unknown."""
+    global _next_short_id, _buffered_since
+    if not isinstance(train_id, str):
+        return False
+    state_network()
+    with _state_lock:
+        station_id = _state_network.station_ids.get(station_name)
+        if station_id is None:
+            return False
+        short_id = train_short_ids.get(train_id)
+        if short_id is None:
+            # Short ids are never reused, so a late frame can't be mistaken for a new train.
+            short_id = _next_short_id
+            _next_short_id += 1
+            train_short_ids[train_id] = short_id
+            train_names[short_id] = train_id
+        if short_id not in _changed:
+            _moved_from[short_id] = train_positions.get(short_id)
+        train_positions[short_id] = station_id
+        _changed[short_id] = station_id
+        # An arrival ends the segment, even one that has not been sent yet.
+        _segments.pop(short_id, None)
+        train_motion.stop(short_id, station_id)
+        train_history.append(short_id, train_id, station_id)
+        if _buffered_since is None:
+            _buffered_since = time.monotonic()
+    return True
+
+def record_finished(train_id):
+    """Removes a train that completed its journey from the fleet state."""
+    global _buffered_since
+    with _state_lock:
+        short_id = train_short_ids.pop(train_id, None)
+        if short_id is None:
+            return
+        train_history.append(short_id, train_id, FINISHED)
+        _segments.pop(short_id, None)
+        train_motion.remove(short_id)
+        # Viewers only know where the train was in the last frame they received.
+        last_seen = _moved_from.pop(short_id) if short_id in _changed else train_positions[short_id]
+        _changed.pop(short_id, None)
+        train_positions.pop(short_id, None)
+        if last_seen is not None:
+            _gone[short_id] = (last_seen, train_names[short_id])
+            if _buffered_since is None:
+                _buffered_since = time.monotonic()
+        else:
+            train_names.pop(short_id, None)
+
+def record_segment(train_id, origin, destination, depart, arrive):
+    """
+    Buffers the segment a train started. Returns False if the train or a
+    station is unknown, or the train is not at the segment's first station
+    (an arrival reported in the same batch already ended it).
+    """
+    global _buffered_since
+    state_network()
+    with _state_lock:
+        short_id = train_short_ids.get(train_id)
+        origin_id = _state_network.station_ids.get(origin)
+        destination_id = _state_network.station_ids.get(destination)
+        if short_id is None or destination_id is None or train_positions.get(short_id) != origin_id:
+            return False
+        try:
+            depart, arrive = float(depart), float(arrive)
+        except (TypeError, ValueError):
+            return False
+        train_motion.travel(short_id, origin_id, destination_id, depart, arrive)
+        _segments[short_id] = [origin_id, destination_id, round(depart, 2), round(arrive, 2)]
+        if _buffered_since is None:
+            _buffered_since = time.monotonic()
+    return True
+
+def take_frames():
+    """
+    Returns {room key: frame} for every room that has viewers and something new,
+    and resets the buffer. Each changed train is routed only to the rooms of
+    its old and new station.
+    """
+    global _changed, _moved_from, _gone, _segments, _buffered_since
+    state_network()
+    with _state_lock:
+        index = station_rooms(_state_network)
+        watched = {key for (_, key), count in _room_viewers.items() if count}
+        frames = {}
+
+        def frame_for(key):
+            if key not in frames:
+                frames[key] = {"room": key, "t": [], "gone": [], "names": {}}
+            return frames[key]
+
+        for short_id, station_id in _changed.items():
+            old_station = _moved_from.get(short_id)
+            new_rooms = index[station_id]
+            old_rooms = index[old_station] if old_station is not None else frozenset()
+            for key in new_rooms & watched:
+                frame = frame_for(key)
+                frame["t"].append([short_id, station_id])
+                if key not in old_rooms:
+                    frame["names"][str(short_id)] = train_names[short_id]
+            for key in (old_rooms - new_rooms) & watched:
+                frame_for(key)["gone"].append(short_id)
+        for short_id, (station_id, _) in _gone.items():
+            for key in index[station_id] & watched:
+                frame_for(key)["gone"].append(short_id)
+            train_names.pop(short_id, None)
+        for short_id, segment in _segments.items():
+            for key in index[train_positions[short_id]] & watched:
+                frame = frame_for(key)
+                frame.setdefault("m", []).append([short_id] + segment)
+                frame["now"] = round(time.time(), 2)
+
+        for key, frame in frames.items():
+            _room_seq[key] += 1
+            frame["seq"] = _room_seq[key]
+            for field in ("gone", "names"):
+                if not frame[field]:
+                    del frame[field]
+        _changed, _moved_from, _gone, _segments = {}, {}, {}, {}
+        if _buffered_since is not None and frames:
+            BROADCAST_DELAY.observe(time.monotonic() - _buffered_since)
+        _buffered_since = None
+    return frames
+
+def build_snapshot(key):
+    """Returns every train currently in a room, tagged with the room's latest sequence number."""
+    state_network()
+    with _state_lock:
+        index = station_rooms(_state_network)
+        trains = [[tid, sid] for tid, sid in train_positions.items() if key in index[sid]]
+        segments = [[tid] + segment for tid, _ in trains for segment in [train_motion.segment(tid)] if segment]
+        snapshot = {
+            "room": key,
+            "seq": _room_seq[key],
+            "t": trains,
+            "names": {str(tid): train_names[tid] for tid, _ in trains},
+        }
+        if segments:
+            snapshot["m"] = segments
+            snapshot["now"] = round(time.time(), 2)
+        return snapshot
+
+def count_sent(event, payload, recipients=1):
+    """Counts messages and payload bytes sent (JSON payloads are measured compactly encoded)."""
+    size = len(payload) if isinstance(payload, bytes) else len(json.dumps(payload, separators=(',', ':')))
+    MESSAGES_OUT.labels(event).inc(recipients)
+    BYTES_OUT.labels(event).inc(size * recipients)
+
+def broadcast_frames(frames):
+    """Serializes each room's frame once per encoding that has viewers in the room."""
+    with _state_lock:
+        viewers = {room: count for room, count in _room_viewers.items() if count}
+    for key, frame in frames.items():
+        # Every worker builds frames for its own viewers, so these never go through the queue.
+        if ('json', key) in viewers:
+            socketio.emit('train_frame', frame, to=f"json|{key}", ignore_queue=True)
+            count_sent('train_frame', frame, viewers[('json', key)])
+        if ('msgpack', key) in viewers:
+            packed = msgpack.packb(frame)
+            socketio.emit('train_frame_bin', packed, to=f"msgpack|{key}", ignore_queue=True)
+            count_sent('train_frame_bin', packed, viewers[('msgpack', key)])
+
+def send_snapshot(sid, key):
+    """Sends a full snapshot of one room to one client, in the encoding it asked for."""
+    snapshot = build_snapshot(key)
+    fmt = _subscriptions.get(sid, ('json',))[0]
+    if fmt == 'msgpack':
+        packed = msgpack.packb(snapshot)
+        socketio.emit('train_snapshot_bin', packed, to=sid, ignore_queue=True)
+        count_sent('train_snapshot_bin', packed)
+    else:
+        socketio.emit('train_snapshot', snapshot, to=sid, ignore_queue=True)
+        count_sent('train_snapshot', snapshot)
+
+def broadcast_loop():
+    """
+    Background task: flushes buffered updates as one frame per room and
+    interval, and expires timed-out simulation jobs and refilled rate limits.
+    """
+    while True:
+        socketio.sleep(BROADCAST_INTERVAL_SECONDS)
+        simulations.expire()
+        started = time.perf_counter()
+        frames = take_frames()
+        if frames:
+            broadcast_frames(frames)
+            BROADCAST_DURATION.observe(time.perf_counter() - started)
+
+def ensure_broadcaster():
+    """
+    Starts the broadcast background task once, on first use, and asks the
+    other workers for the simulation jobs they know.
+    """
+    global _broadcaster_started
+    with _state_lock:
+        if _broadcaster_started:
+            return
+        _broadcaster_started = True
+    socketio.start_background_task(broadcast_loop)
+    publish_jobs([('hello', simulations.owner)])
+
+# --- Position Stream ---
+
+def position_frame(now):
+    """
+    One 'train_positions' payload: every train's position at unix time `now`,
+    in integer 1/POSITION_STREAM_SCALE degrees, computed for all trains at once
+    (see MotionTable.positions). Names of trains new to the stream are included.
+    """
+    global _position_names_from
+    state_network()
+    with _state_lock:
+        ids, lat, lon = train_motion.positions(now, _state_network.lats, _state_network.lons, POSITION_STREAM_SCALE)
+        frame = {"t": round(now, 2), "ids": ids.tolist(), "lat": lat.tolist(), "lon": lon.tolist()}
+        new = ids[ids >= _position_names_from].tolist()
+        if new:
+            frame["names"] = {str(tid): train_names[tid] for tid in new if tid in train_names}
+            _position_names_from = max(new) + 1
+        return frame
+
+def position_loop():
+    """Background task: sends every train's position to stream subscribers POSITION_STREAM_HZ times a second."""
+    interval = 1.0 / POSITION_STREAM_HZ
+    next_send = time.monotonic()
+    while True:
+        next_send = max(next_send + interval, time.monotonic())
+        socketio.sleep(next_send - time.monotonic())
+        with _state_lock:
+            viewers = {fmt: count for fmt, count in _position_viewers.items() if count}
+        if not viewers:
+            continue
+        started = time.perf_counter()
+        frame = position_frame(time.time())
+        if 'json' in viewers:
+            socketio.emit('train_positions', frame, to="json|positions", ignore_queue=True)
+            count_sent('train_positions', frame, viewers['json'])
+        if 'msgpack' in viewers:
+            packed = msgpack.packb(frame)
+            socketio.emit('train_positions_bin', packed, to="msgpack|positions", ignore_queue=True)
+            count_sent('train_positions_bin', packed, viewers['msgpack'])
+        POSITION_STREAM_DURATION.observe(time.perf_counter() - started)
+
+def set_position_stream(sid, fmt, enabled):
+    """Adds a client to or removes it from the position stream, starting the stream task on first use."""
+    global _position_stream_started
+    with _state_lock:
+        was_enabled = sid in _position_subscribers
+        if enabled and not was_enabled:
+            _position_subscribers[sid] = fmt
+            _position_viewers[fmt] += 1
+        elif was_enabled and not enabled:
+            _position_viewers[_position_subscribers.pop(sid)] -= 1
+        start = enabled and not _position_stream_started
+        _position_stream_started = _position_stream_started or enabled
+    if start:
+        socketio.start_background_task(position_loop)
+
+def remap_fleet_state(old, new):
+    """
+    Reload listener (see routes.add_reload_listener): moves the fleet state to
+    the new network's station ids, matching stations by name. Trains at
+    stations that no longer exist are dropped. Clients are then told to resync.
+    """
+    global _state_network, _changed, _moved_from, _gone, _segments
+    with _state_lock:
+        current = _state_network
+        if current is not None and current.station_names != new.station_names:
+            def move(station_id):
+                if station_id is None:
+                    return None
+                return new.station_ids.get(current.station_names[station_id])
+
+            for short_id, station_id in list(train_positions.items()):
+                new_id = move(station_id)
+                if new_id is None:
+                    del train_positions[short_id]
+                    train_short_ids.pop(train_names.pop(short_id), None)
+                    train_motion.remove(short_id)
+                else:
+                    train_positions[short_id] = new_id
+            _changed = {tid: train_positions[tid] for tid in _changed if tid in train_positions}
+            _moved_from = {tid: move(sid) for tid, sid in _moved_from.items() if tid in train_positions}
+            # A finished train whose last station is gone has no room left to leave; forget it now.
+            for tid, (sid, _) in list(_gone.items()):
+                if move(sid) is None:
+                    del _gone[tid]
+                    train_names.pop(tid, None)
+            _gone = {tid: (move(sid), name) for tid, (sid, name) in _gone.items()}
+            mapping = [move(sid) for sid in range(len(current.station_names))]
+            train_history.remap_stations([REMOVED if sid is None else sid for sid in mapping])
+            train_motion.remap_stations(mapping)
+            # Clients resync from snapshots, which carry the segments.
+            _segments = {}
+        _state_network = new
+    # Every worker reloads and notifies its own clients.
+    socketio.emit('network_reloaded', {'version': new.version}, ignore_queue=True)
+
+routes.add_reload_listener(remap_fleet_state)
+
+# --- Position History ---
+
+def read_history(train_id=None, since=None, until=None, limit=MAX_HISTORY_RESPONSE_EVENTS):
+    """
+    Buffered events from `since` to `until` (unix times, both optional), oldest
+    first, as (rows, truncated): rows are [time, train id, station name or None
+    once finished], and truncated says there were more than `limit`.
+    Raises KeyError if train_id has no events in the buffer.
+    """
+    short_id = None
+    if train_id is not None:
+        short_id = train_history.short_id_of(train_id)
+        if short_id is None:
+            raise KeyError(train_id)
+    station_names = state_network().station_names
+    times, trains, stations, truncated = train_history.query(since, until, short_id, limit)
+    names = train_history.names
+    rows = [[round(t, 3), names.get(tid), station_names[sid] if sid != FINISHED else None]
+            for t, tid, sid in zip(times.tolist(), trains.tolist(), stations.tolist())]
+    return rows, truncated
+
+def history_args(args):
+    """
+    Reads since/until/train_id from query parameters or a 'replay' request.
+    Returns (train_id, since, until); raises ValueError on bad input.
+    """
+    train_id = args.get('train_id') or None
+    bounds = []
+    for name in ('since', 'until'):
+        value = args.get(name)
+        if value is None or value == '':
+            bounds.append(None)
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be a unix time in seconds")
+        if value != value:
+            raise ValueError(f"{name} must be a unix time in seconds")
+        bounds.append(value)
+    return train_id, bounds[0], bounds[1]
+
+@routes.api.route('/trains/history', methods=['GET'])
+def get_train_history():
+    """
+    Recent train movements from this server's history ring buffer.
+
+    Query parameters:
+        train_id: Only this train's events, e.g. Train-1008.
+        since:    Unix time (seconds) of the first event; default the oldest buffered.
+        until:    Unix time of the last event; default now.
+        limit:    Most events returned (1 to MAX_HISTORY_RESPONSE_EVENTS, the default).
+
+    Events are [time, train id, station name], oldest first, with a null
+    station when the train finished its journey. If "truncated" is true, ask
+    again with since set to the last time returned (events at exactly that
+    time are then repeated). "oldest" is the earliest time still buffered.
+    """
+    try:
+        train_id, since, until = history_args(request.args)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    limit = request.args.get('limit', MAX_HISTORY_RESPONSE_EVENTS, type=int)
+    if limit is None or not 1 <= limit <= MAX_HISTORY_RESPONSE_EVENTS:
+        return jsonify({"error": f"limit must be between 1 and {MAX_HISTORY_RESPONSE_EVENTS}"}), 400
+    try:
+        rows, truncated = read_history(train_id, since, until, limit)
+    except KeyError:
+        return jsonify({"error": "No history for this train."}), 404
+    return jsonify({"events": rows, "truncated": truncated, "oldest": train_history.oldest_time()})
+
+def run_replay(sid, token, rows, speed):
+    """
+    Background task: sends one client's replay, keeping the gaps between events
+    divided by `speed`. Events that fall due together share one 'replay_frame'.
+    """
+    times = [row[0] for row in rows]
+    started = time.monotonic()
+    sent = 0
+    while sent < len(rows) and _replays.get(sid) is token:
+        reached = times[0] + (time.monotonic() - started) * speed   # history time replayed so far
+        due = bisect_right(times, reached, sent)
+        if due > sent:
+            frame = {"events": rows[sent:due]}
+            socketio.emit('replay_frame', frame, to=sid, ignore_queue=True)
+            count_sent('replay_frame', frame)
+            sent = due
+        if sent < len(rows):
+            socketio.sleep(min(REPLAY_FRAME_SECONDS, (times[sent] - reached) / speed))
+    if _replays.get(sid) is token:
+        del _replays[sid]
+        socketio.emit('replay_done', {"events": sent}, to=sid, ignore_queue=True)
+        count_sent('replay_done', {"events": sent})
+
+# --- Simulation Jobs ---
+
+def publish_jobs(events):
+    """Sends scheduler events to the other workers (a no-op in a single process)."""
+    publish = getattr(socketio.server.manager, 'publish_jobs', None)
+    if events and publish is not None:
+        publish(events)
+
+def dispatch_jobs(events):
+    """
+    Publishes the events of this process's scheduling decisions, and sends
+    each job placed on a generator to that generator alone (through the
+    message queue if it is connected to another worker).
+    """
+    for event in events:
+        if event[0] == 'job' and event[4] is not None:
+            payload = {'job_id': event[1], 'path': event[2]}
+            socketio.emit('new_route_to_simulate', payload, to=event[4])
+            count_sent('new_route_to_simulate', payload)
+            log_event('simulation_placed', job=event[1], generator=event[4], stations=len(event[2]))
+    publish_jobs(events)
+
+def receive_job_events(events):
+    """jobs_listener: applies another worker's scheduler events, and answers its 'hello'."""
+    for event in events:
+        if event[0] == 'hello':
+            publish_jobs(simulations.state_events(event[1]))
+    dispatch_jobs(simulations.receive(events))
+
+def simulation_path(data):
+    """The station names of a 'start_simulation' request. Raises ValueError if it is not a route."""
+    path = data.get('path') if isinstance(data, dict) else None
+    if not isinstance(path, list) or len(path) < 2:
+        raise ValueError("path must be a list of at least two station names")
+    station_ids = routes.get_network().station_ids
+    if not all(isinstance(name, str) and name in station_ids for name in path):
+        raise ValueError("path contains an unknown station")
+    return path
+
+# --- Subscriptions ---
+
+def resolve_subscription(data):
+    """
+    Turns a 'subscribe' request into a set of room keys. Any combination of:
+        {"line": "Kajang Line"} or {"lines": [...]}
+        {"stations": ["KLCC", "Bangsar"]}
+        {"bbox": [south, west, north, east]}
+    An empty request subscribes to the whole network. Raises ValueError on bad input.
+    """
+    if not isinstance(data, dict):
+        data = {}
+    keys = set()
+
+    lines = data.get('lines') or ([data['line']] if data.get('line') else [])
+    for line_name in lines:
+        if line_name not in LINES:
+            raise ValueError(f"Unknown line: {line_name}")
+        keys.add(f"line:{line_name}")
+
+    station_ids = state_network().station_ids
+    for name in data.get('stations') or []:
+        if name not in station_ids:
+            raise ValueError(f"Unknown station: {name}")
+        keys.add(f"station:{station_ids[name]}")
+
+    bbox = data.get('bbox')
+    if bbox is not None:
+        try:
+            south, west, north, east = (float(value) for value in bbox)
+        except (TypeError, ValueError):
+            raise ValueError("bbox must be [south, west, north, east]")
+        if not (valid_coordinate(south, west) and valid_coordinate(north, east)):
+            raise ValueError("bbox latitudes must be within [-90, 90] and longitudes within [-180, 180]")
+        cells = cells_in_bbox(south, west, north, east)
+        if len(cells) > MAX_SUBSCRIPTION_CELLS:
+            raise ValueError("bbox is too large; subscribe to the whole network instead")
+        keys.update(cell_key(cell) for cell in cells)
+
+    return keys or {ALL_ROOM}
+
+def set_subscription(sid, fmt, keys):
+    """
+    Records which rooms a client watches and returns (joined, left) room keys.
+    Kept separate from the Socket.IO room calls so the bookkeeping is reusable.
+    """
+    with _state_lock:
+        _, old_keys = _subscriptions.get(sid, (fmt, set()))
+        for key in old_keys - keys:
+            _room_viewers[(fmt, key)] -= 1
+        for key in keys - old_keys:
+            _room_viewers[(fmt, key)] += 1
+        _subscriptions[sid] = (fmt, set(keys))
+    return keys - old_keys, old_keys - keys
+
+def drop_subscription(sid):
+    """Forgets a disconnected client's subscriptions."""
+    with _state_lock:
+        fmt, keys = _subscriptions.pop(sid, (None, set()))
+        for key in keys:
+            _room_viewers[(fmt, key)] -= 1
+
+def subscribe(sid, fmt, keys):
+    """Moves a client into the Socket.IO rooms for its subscription and sends snapshots."""
+    joined, left = set_subscription(sid, fmt, keys)
+    for key in left:
+        leave_room(f"{fmt}|{key}", sid=sid)
+    for key in joined:
+        join_room(f"{fmt}|{key}", sid=sid)
+        send_snapshot(sid, key)
+
 # --- Default Socket.IO Event Handlers ---
 
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     """
-    Handles new client connections. This is triggered automatically when a
-    client establishes a connection with the server.
+    Handles new client connections. Viewers start subscribed to the whole
+    network and immediately receive a snapshot of it.
+    Data generators connect with auth {"role": "generator"}, get no frames and
+    are registered with the simulation job scheduler.
     """
-    print('Client connected successfully!')
+    ensure_broadcaster()
+    auth = auth if isinstance(auth, dict) else {}
+    role = 'generator' if auth.get('role') == 'generator' else 'viewer'
+    CONNECTED.labels(role).inc()
+    log_event('client_connected', sid=request.sid, role=role)
     # 'emit' sends a message back only to the client that just connected.
     emit('welcome_message', {'data': 'Welcome to the real-time server!'})
+    if role == 'generator':
+        dispatch_jobs(simulations.register(request.sid))
+        return
+    wants_msgpack = (auth.get('format') or request.args.get('format')) == 'msgpack'
+    subscribe(request.sid, 'msgpack' if wants_msgpack and msgpack is not None else 'json', {ALL_ROOM})
 
 @socketio.on('disconnect')
 def handle_disconnect():
@@ -31,32 +760,174 @@ def handle_disconnect():
     Handles client disconnections. This is triggered automatically when a
     client closes their connection.
     """
-    print('Client disconnected.')
+    role = 'viewer' if request.sid in _subscriptions else 'generator'
+    drop_subscription(request.sid)
+    _replays.pop(request.sid, None)
+    set_position_stream(request.sid, None, False)
+    dispatch_jobs(simulations.unregister(request.sid))
+    CONNECTED.labels(role).dec()
+    log_event('client_disconnected', sid=request.sid, role=role)
 
 # --- Custom Application Event Handlers ---
 
+@socketio.on('subscribe')
+def handle_subscribe(data=None):
+    """
+    Replaces the client's subscription (see resolve_subscription for the format).
+    The acknowledgement lists the rooms now watched, or carries an error.
+    """
+    if request.sid not in _subscriptions:
+        return {"error": "Only viewers can subscribe."}
+    try:
+        keys = resolve_subscription(data)
+    except ValueError as exc:
+        return {"error": str(exc)}
+    subscribe(request.sid, _subscriptions[request.sid][0], keys)
+    return {"rooms": sorted(keys)}
+
+@socketio.on('request_snapshot')
+def handle_request_snapshot(data=None):
+    """
+    Sent by a viewer that noticed a gap in a room's frame sequence numbers.
+    {"room": key} re-sends that room; no argument re-sends every subscribed room.
+    """
+    _, keys = _subscriptions.get(request.sid, (None, set()))
+    room = data.get('room') if isinstance(data, dict) else None
+    for key in ([room] if room in keys else keys):
+        send_snapshot(request.sid, key)
+
+@socketio.on('subscribe_positions')
+def handle_subscribe_positions(data=None):
+    """
+    Turns this viewer's position stream on ({"enabled": true}, the default) or
+    off. While it is on, the client receives POSITION_STREAM_HZ times a second
+    (as 'train_positions', or 'train_positions_bin' for msgpack clients):
+        {"t": unix time, "ids": [short id, ...], "lat": [...], "lon": [...],
+         "names": {"8": "Train-1008"}}   # trains new to the stream
+    with every train on the network, lat/lon in 1/scale degrees. The
+    acknowledgement is {"enabled", "rate_hz", "scale", "names"} (the names of
+    the trains running now), or carries an error.
+    """
+    if request.sid not in _subscriptions:
+        return {"error": "Only viewers can subscribe."}
+    enabled = bool(data.get('enabled', True)) if isinstance(data, dict) else True
+    fmt = _subscriptions[request.sid][0]
+    with _state_lock:
+        names = {str(tid): name for tid, name in train_names.items()} if enabled else {}
+    if enabled:
+        join_room(f"{fmt}|positions")
+    else:
+        leave_room(f"{fmt}|positions")
+    set_position_stream(request.sid, fmt, enabled)
+    return {"enabled": enabled, "rate_hz": POSITION_STREAM_HZ, "scale": POSITION_STREAM_SCALE, "names": names}
+
+@socketio.on('replay')
+def handle_replay(data=None):
+    """
+    Replays buffered history to this client, `speed` times faster than it happened:
+        {"train_id": "Train-1008", "since": unix time, "until": unix time, "speed": 10}
+    Every field is optional: by default every buffered event, at real time.
+    Events arrive as 'replay_frame' {"events": [[time, train id, station], ...]}
+    (the /api/trains/history layout), then 'replay_done' {"events": count}.
+    A new 'replay' or a 'stop_replay' ends the running one. The acknowledgement
+    is {"events": count, "truncated": bool}, or carries an error.
+    """
+    if request.sid not in _subscriptions:
+        return {"error": "Only viewers can replay."}
+    data = data if isinstance(data, dict) else {}
+    try:
+        train_id, since, until = history_args(data)
+    except ValueError as exc:
+        return {"error": str(exc)}
+    try:
+        speed = float(data.get('speed', 1))
+    except (TypeError, ValueError):
+        return {"error": "speed must be a number"}
+    if not 0 < speed <= MAX_REPLAY_SPEED:
+        return {"error": f"speed must be above 0 and at most {MAX_REPLAY_SPEED}"}
+    try:
+        rows, truncated = read_history(train_id, since, until)
+    except KeyError:
+        return {"error": "No history for this train."}
+    token = object()
+    _replays[request.sid] = token
+    if rows:
+        socketio.start_background_task(run_replay, request.sid, token, rows, speed)
+    else:
+        run_replay(request.sid, token, rows, speed)
+    return {"events": len(rows), "truncated": truncated}
+
+@socketio.on('stop_replay')
+def handle_stop_replay():
+    """Ends this client's running replay, if any."""
+    _replays.pop(request.sid, None)
+
 @socketio.on('train_update')
 def handle_train_update(data):
     """
-    Receives updates from the data generator and broadcasts to all clients.
+    Receives a single update from a data generator and buffers it for the next frame.
     """
-    print(f"Received train update: {data}")
-    # For some library versions, broadcast=True is implicit when emitting
-    # from the main socketio object. Removing the argument fixes the TypeError.
-    socketio.emit('new_train_position', data)
+    if isinstance(data, dict):
+        handle_train_updates({'updates': [[data.get('train_id'), data.get('current_station')]]})
+
+def apply_train_updates(data):
+    """
+    Buffers one tick's worth of updates from a data generator:
+        {'updates': [[train_id, station_name], ...], 'finished': [train_id, ...],
+         'segments': [[train_id, from_station, to_station, depart, arrive], ...],
+         'jobs_done': [job_id, ...]}
+    'segments' are the segments trains started (unix times); 'jobs_done' lists
+    the simulation jobs whose trains finished.
+    """
+    if not isinstance(data, dict):
+        return
+    if data.get('jobs_done'):
+        simulations.finish(data['jobs_done'])
+    TRAIN_UPDATES.inc(len(data.get('updates') or []))
+    for update in data.get('updates') or []:
+        if isinstance(update, (list, tuple)) and len(update) == 2:
+            record_update(update[0], update[1])
+    for segment in data.get('segments') or []:
+        if isinstance(segment, (list, tuple)) and len(segment) == 5:
+            record_segment(*segment)
+    for train_id in data.get('finished') or []:
+        record_finished(train_id)
+
+@socketio.on('train_updates')
+def handle_train_updates(data):
+    """
+    Receives one tick's worth of updates from a data generator. With several
+    workers, the batch is also published so every worker's fleet state matches.
+    """
+    apply_train_updates(data)
+    publish_fleet = getattr(socketio.server.manager, 'publish_fleet', None)
+    if publish_fleet is not None:
+        publish_fleet(data)
 
 @socketio.on('start_simulation')
 def handle_start_simulation(data):
     """
     Triggered by the frontend when a user calculates a route.
-    This event tells the data_generator which route to start simulating.
-    
+    The route is submitted to the simulation job scheduler, which sends it to
+    one data generator ('new_route_to_simulate'), or queues it until one connects.
+
     Args:
-        data (dict): Contains the calculated path. 
+        data (dict): Contains the calculated path.
                      Example: {'path': ['Kajang', 'Stadium Kajang', ...]}
+
+    Returns:
+        The acknowledgement {"job_id", "status"}, where status is 'running',
+        'queued' or 'duplicate' (the same route is already simulated), or {"error"}.
     """
-    path = data.get('path')
-    if path:
-        print(f"[SERVER] Received request to simulate route: {path}")
-        # Broadcast this specific route to any connected data_generator clients
-        socketio.emit('new_route_to_simulate', {'path': path})
\ No newline at end of file
+    try:
+        # Rate-limited per address: a kiosk that reconnects gets a new sid but not a new budget.
+        job, created, events = simulations.submit(request.remote_addr or request.sid, simulation_path(data))
+    except ValueError as exc:
+        SIMULATION_REQUESTS.labels('refused').inc()
+        return {"error": str(exc)}
+    status = 'duplicate' if not created else 'running' if job["generator"] else 'queued'
+    SIMULATION_REQUESTS.labels(status).inc()
+    log_event('simulation_requested', job=job["id"], status=status, origin=job["path"][0],
+              destination=job["path"][-1], stations=len(job["path"]))
+    dispatch_jobs(events)
+    return {"job_id": job["id"], "status": status}
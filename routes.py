@@ -1,79 +1,169 @@
-# routes.py (FINAL - HYBRID BFS + PANDAS ARCHITECTURE)
-from flask import Blueprint, jsonify, request
-import pandas as pd
-import sqlite3
+# routes.py (precomputed route table + routing engine)
+from flask import Blueprint, Response, current_app, g, jsonify, request, stream_with_context
+import csv
+import io
+import json
+import hmac
+import math
+import signal
+import threading
+import time
+import numpy as np
 from collections import deque
-from config import DATABASE_NAME, KAJANG_LINE, KELANA_JAYA_LINE, INTERCHANGE_STATIONS
+from config import (DATABASE_NAME, LINES, INTERCHANGE_STATIONS,
+                    DEFAULT_ROUTE_OPTIMIZE, MAX_ROUTE_ALTERNATIVES, TRANSFER_PENALTIES,
+                    BATCH_ROUTE_CHUNK_SIZE, ROUTE_CACHE_MAX_ENTRIES, ROUTE_CACHE_TTL_SECONDS,
+                    ADMIN_TOKEN, MAX_TIMETABLE_TRANSFERS, DEFAULT_NEAREST_STATIONS, MAX_NEAREST_STATIONS)
+from network import load_network, load_from_sqlite
+from gtfs import load_timetable, timetable_dir
+from raptor import RaptorEngine, format_time, parse_clock
+from http_cache import PreparedResponse, ResponseCache
+from telemetry import Callback, Counter, Histogram, log_event
+from routing import RoutingEngine, OPTIMIZE_MODES, ALGORITHMS
+from spatial import valid_coordinate
 
 api = Blueprint('api', __name__)
 
-# --- In-Memory Data Storage ---
-stations_df = None
-fare_df, time_df = None, None
-network_graph = {} # For the BFS algorithm
+# --- In-Memory Network (loaded lazily on first use, swapped atomically on reload) ---
+# (network.NetworkData, RoutingEngine over it, RaptorEngine or None when no
+# GTFS timetable was imported). Replaced as one tuple, so a request that
+# reads several always gets a matching set.
+_loaded = None
+_load_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_reload_listeners = []    # callbacks(old_network, new_network), run after each swap
+reload_status = {"reloading": False, "last_reload": None, "last_error": None}
 
-def load_all_data():
+# --- Route Response Cache ---
+route_cache = ResponseCache(ROUTE_CACHE_MAX_ENTRIES, ROUTE_CACHE_TTL_SECONDS)
+
+# --- Metrics (rendered by GET /metrics, see telemetry.py) ---
+HTTP_LATENCY = Histogram('metro_http_request_duration_seconds', "Time to build each /api response, by endpoint.",
+                         ['endpoint'])
+HTTP_RESPONSES = Counter('metro_http_responses_total', "/api responses, by endpoint and status code.",
+                         ['endpoint', 'status'])
+ROUTE_COMPUTE = Histogram('metro_route_compute_seconds', "Route computations on route cache misses, by kind.",
+                          ['kind'])
+Callback('metro_route_cache_entries', "Responses held in the route cache.", lambda: len(route_cache))
+Callback('metro_route_cache_lookups_total', "Route cache lookups, by result.",
+         lambda: {('hit',): route_cache.hits, ('miss',): route_cache.misses}, kind='counter', labelnames=('result',))
+Callback('metro_route_cache_removals_total', "Route cache entries dropped, by reason.",
+         lambda: {('evicted',): route_cache.evictions, ('expired',): route_cache.expirations},
+         kind='counter', labelnames=('reason',))
+
+@api.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@api.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint.rpartition('.')[2] if request.endpoint else 'unknown'
+    started = g.get('request_started')
+    if started is not None:
+        HTTP_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+    HTTP_RESPONSES.labels(endpoint, response.status_code).inc()
+    return response
+
+def load_raptor():
+    """RaptorEngine over the imported GTFS timetable, or None if there is none."""
+    timetable = load_timetable(timetable_dir(DATABASE_NAME))
+    return RaptorEngine(timetable) if timetable is not None else None
+
+def get_loaded():
     """
-    Loads data from the clean SQLite database. It loads fares/times into
-    Pandas DataFrames for fast lookups and builds an in-memory graph for BFS routing.
+    Returns (network, routing_engine, raptor_engine), loading them on first use. The compiled
+    artifact written by database.py is memory-mapped, so importing this module
+    stays cheap and forked workers share the same pages.
     """
-    global stations_df, fare_df, time_df, network_graph
-    
-    print("--- Loading clean data from SQLite into memory ---")
-    conn = sqlite3.connect(DATABASE_NAME)
-    
-    # Load stations, fares, and times into Pandas
-    stations_df = pd.read_sql_query("SELECT * FROM stations ORDER BY name", conn, index_col='name')
-    fares_raw = pd.read_sql_query("SELECT * FROM fares", conn)
-    times_raw = pd.read_sql_query("SELECT * FROM times", conn)
-    
-    # Load connections to build the graph
-    connections_raw = pd.read_sql_query("SELECT * FROM connections", conn)
-    conn.close()
-    
-    # Pivot fares and times into matrix format for O(1) lookup
-    fare_df = fares_raw.pivot(index='origin', columns='destination', values='price')
-    time_df = times_raw.pivot(index='origin', columns='destination', values='minutes')
-    
-    # Build the network graph for BFS pathfinding
-    graph = {}
-    for index, row in connections_raw.iterrows():
-        origin, dest = row['origin_name'], row['destination_name']
-        graph.setdefault(origin, []).append(dest)
-        graph.setdefault(dest, []).append(origin)
-    network_graph = graph
-    
-    print(f"[SUCCESS] Loaded data and built graph for {len(stations_df)} stations.")
+    global _loaded
+    if _loaded is None:
+        with _load_lock:
+            if _loaded is None:
+                network = load_network(DATABASE_NAME)
+                _loaded = (network, RoutingEngine(network, TRANSFER_PENALTIES), load_raptor())
+    return _loaded
 
-# --- API Endpoints ---
+def get_network():
+    return get_loaded()[0]
 
-@api.route('/lines', methods=['GET'])
-def get_lines():
-    """Returns the line sequences and interchange data for map drawing."""
-    return jsonify({
-        "lines": {"Kelana Jaya Line": KELANA_JAYA_LINE, "Kajang Line": KAJANG_LINE},
-        "interchanges": [[stn1, stn2] for stn1, stn2 in INTERCHANGE_STATIONS.items()]
-    })
+def get_routing_engine():
+    return get_loaded()[1]
 
-@api.route('/stations', methods=['GET'])
-def get_stations():
-    """Returns a list of all stations with their names and coordinates."""
-    # Convert the DataFrame to the JSON format the frontend expects
-    stations_for_api = stations_df.reset_index().to_dict(orient='records')
-    return jsonify(stations_for_api)
+def get_raptor_engine():
+    return get_loaded()[2]
 
-@api.route('/route', methods=['GET'])
-def get_route():
+def add_reload_listener(callback):
+    """Registers callback(old_network, new_network), called after a reload swaps the data in."""
+    _reload_listeners.append(callback)
+
+def reload_network(source='auto'):
     """
-    Calculates the true shortest path with BFS, then looks up fare/time with Pandas.
+    Rebuilds the network and swaps it in without stopping the server.
+    source='auto' loads the compiled artifact (falling back to SQLite), as at
+    startup; source='sqlite' rebuilds from the database tables. The GTFS
+    timetable is reloaded too. Requests keep
+    using the old data until the new data is complete. Returns False if a
+    reload was already in progress.
     """
-    origin, destination = request.args.get('from'), request.args.get('to')
-    if not origin or not destination: return jsonify({"error": "Missing parameters"}), 400
-    if origin == destination:
-        return jsonify({ "path": [origin], "total_fare": 0.0, "total_time_minutes": 0 })
+    global _loaded
+    if not _reload_lock.acquire(blocking=False):
+        return False
+    reload_status["reloading"] = True
+    try:
+        start = time.perf_counter()
+        network = load_from_sqlite(DATABASE_NAME) if source == 'sqlite' else load_network(DATABASE_NAME)
+        engine = RoutingEngine(network, TRANSFER_PENALTIES)
+        raptor = load_raptor()
+        with _load_lock:
+            old = _loaded[0] if _loaded else None
+            _loaded = (network, engine, raptor)
+        route_cache.clear()
+        for callback in _reload_listeners:
+            callback(old, network)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        reload_status.update(last_reload=time.time(), last_error=None)
+        print(f"[SUCCESS] Reloaded network {network.version} from {network.source} in {elapsed_ms:.1f} ms.")
+    except Exception as exc:
+        reload_status["last_error"] = str(exc)
+        print(f"[ERROR] Network reload failed, keeping the current data: {exc}")
+    finally:
+        reload_status["reloading"] = False
+        _reload_lock.release()
+    return True
+
+def start_reload(source='auto'):
+    """Runs reload_network() in a background thread. Returns False if one is already running."""
+    if _reload_lock.locked():
+        return False
+    threading.Thread(target=reload_network, args=(source,), daemon=True).start()
+    return True
+
+def install_reload_signal():
+    """
+    Makes SIGHUP trigger a background reload (call from the main thread).
+    The handler only sets a flag: under eventlet/gevent a signal handler runs
+    on the hub and must not block, so a watcher thread picks the flag up.
+    """
+    if not hasattr(signal, 'SIGHUP'):
+        return
+    requested = []
 
-    # --- Step 1: Find the true shortest path with BFS ---
-    # This uses the accurate graph we built from the hardcoded line data
+    def watch():
+        while True:
+            time.sleep(1)
+            if requested:
+                requested.clear()
+                reload_network()
+
+    threading.Thread(target=watch, daemon=True).start()
+    signal.signal(signal.SIGHUP, lambda signum, frame: requested.append(signum))
+
+def bfs_route(network_graph, fare_lookup, time_lookup, origin, destination):
+    """
+    The original per-request BFS and fare/time lookup. No longer used by the API;
+    kept as the reference implementation the route table is checked against
+    (verify_route_table() and tests/test_route_table.py).
+    """
     queue = deque([(origin, [origin])])
     visited = {origin}
     path = None
@@ -88,31 +178,622 @@ def get_route():
                 new_path = list(p)
                 new_path.append(neighbor)
                 queue.append((neighbor, new_path))
-    
     if not path:
-        return jsonify({"error": "No route could be calculated between these stations."}), 404
+        return None
 
-    # --- Step 2: Calculate Fare and Time for the true path using fast Pandas lookups ---
     total_fare = 0.0
     total_time = 0
     try:
         for i in range(len(path) - 1):
-            # Use .loc for fast, direct lookup in the DataFrames
-            total_fare += fare_df.loc[path[i], path[i+1]]
-            total_time += time_df.loc[path[i], path[i+1]]
+            total_fare += fare_lookup[path[i], path[i+1]]
+            total_time += time_lookup[path[i], path[i+1]]
     except KeyError:
-        # This can happen if a fare/time is missing for a specific segment
-        print(f"[WARNING] Missing fare/time data for a segment in path: {path}")
-        # We can either return an error or proceed with the data we have.
-        # For a better user experience, we'll proceed.
         pass
-            
-    return jsonify({
+    return path, total_fare, total_time
+
+def verify_route_table():
+    """
+    Compares the route table of the loaded network (normally the compiled
+    artifact) against the reference BFS run over the SQLite tables, for every
+    origin/destination pair. Returns a list of mismatching (origin, destination) pairs.
+    """
+    import sqlite3
+
+    conn = sqlite3.connect(DATABASE_NAME)
+    network_graph = {}
+    for origin, dest in conn.execute("SELECT origin_name, destination_name FROM connections"):
+        network_graph.setdefault(origin, []).append(dest)
+        network_graph.setdefault(dest, []).append(origin)
+    fare_lookup = {(o, d): price for o, d, price in conn.execute("SELECT origin, destination, price FROM fares")
+                   if price is not None}
+    time_lookup = {(o, d): minutes for o, d, minutes in conn.execute("SELECT origin, destination, minutes FROM times")
+                   if minutes is not None}
+    conn.close()
+
+    net = get_network()
+    mismatches = []
+    for origin in net.station_names:
+        for destination in net.station_names:
+            if origin == destination:
+                continue
+            expected = bfs_route(network_graph, fare_lookup, time_lookup, origin, destination)
+            actual = net.lookup_route(origin, destination)
+            if expected is None or actual is None:
+                if expected is not actual:
+                    mismatches.append((origin, destination))
+                continue
+            path, fare, minutes, _ = actual
+            if (path != expected[0]
+                    or round(fare, 2) != round(float(expected[1]), 2)
+                    or int(minutes) != int(expected[2])):
+                mismatches.append((origin, destination))
+    return mismatches
+
+# --- API Endpoints ---
+
+# --- Static Network Endpoints (pre-serialized once per dataset version) ---
+
+_static_responses = (None, {})   # (network they were built for, name -> PreparedResponse)
+
+def static_response(name, build_payload):
+    """
+    Serves the payload build_payload(network) from a cache of pre-serialized
+    responses. The cache is keyed on the loaded network, so it is rebuilt
+    automatically when a new dataset is loaded.
+    """
+    global _static_responses
+    net = get_network()
+    if _static_responses[0] is not net:
+        _static_responses = (net, {})
+    cache = _static_responses[1]
+    prepared = cache.get(name)
+    if prepared is None:
+        prepared = cache[name] = PreparedResponse(build_payload(net))
+    return prepared.respond()
+
+def lines_payload(net):
+    return {
+        "lines": LINES,
+        "interchanges": [[stn1, stn2] for stn1, stn2 in INTERCHANGE_STATIONS.items()]
+    }
+
+@api.route('/lines', methods=['GET'])
+def get_lines():
+    """Returns the line sequences and interchange data for map drawing."""
+    return static_response('lines', lines_payload)
+
+@api.route('/stations', methods=['GET'])
+def get_stations():
+    """
+    Returns a list of all stations with their names, coordinates and the
+    integer station id used in the compact real-time frames.
+    """
+    return static_response('stations', lambda net: net.station_records())
+
+@api.route('/network', methods=['GET'])
+def get_network_bundle():
+    """
+    Stations, lines and interchanges in one response, so the map can load
+    with a single round trip. "version" identifies the dataset build.
+    """
+    return static_response('network', lambda net: {
+        "version": net.version,
+        "stations": net.station_records(),
+        **lines_payload(net),
+    })
+
+# --- Station Geo Lookup ---
+
+def coordinate_args(*names):
+    """
+    Reads coordinate query parameters, named in (latitude, longitude) pairs.
+    Returns the values, or None if any is missing, not a finite number, or
+    out of range (latitudes within [-90, 90], longitudes within [-180, 180]).
+    """
+    values = [request.args.get(name, type=float) for name in names]
+    if any(value is None for value in values):
+        return None
+    if not all(valid_coordinate(lat, lon) for lat, lon in zip(values[0::2], values[1::2])):
+        return None
+    return values
+
+@api.route('/nearest', methods=['GET'])
+def get_nearest():
+    """
+    The stations closest to a location, nearest first.
+
+    Query parameters:
+        lat, lon: The location (required).
+        k:        Number of stations (1 to MAX_NEAREST_STATIONS, default DEFAULT_NEAREST_STATIONS).
+
+    Each station has the /api/stations fields plus "distance_km" (great-circle).
+    """
+    point = coordinate_args('lat', 'lon')
+    if point is None:
+        return jsonify({"error": "lat and lon are required, with lat within [-90, 90] and lon within [-180, 180]"}), 400
+    lat, lon = point
+    k = request.args.get('k', DEFAULT_NEAREST_STATIONS, type=int)
+    if k is None or not 1 <= k <= MAX_NEAREST_STATIONS:
+        return jsonify({"error": f"k must be between 1 and {MAX_NEAREST_STATIONS}"}), 400
+
+    net = get_network()
+    ids, km = net.spatial.nearest(lat, lon, k)
+    stations = net.station_records(ids.tolist())
+    for record, distance in zip(stations, km.tolist()):
+        record["distance_km"] = round(distance, 3)
+    return jsonify({"stations": stations})
+
+@api.route('/stations/within', methods=['GET'])
+def get_stations_within():
+    """
+    The stations inside a bounding box, e.g. the visible map area.
+
+    Query parameters:
+        south, west, north, east: The box edges in degrees (required).
+    """
+    bbox = coordinate_args('south', 'west', 'north', 'east')
+    if bbox is None:
+        return jsonify({"error": "south, west, north and east are required, with latitudes within [-90, 90] "
+                                 "and longitudes within [-180, 180]"}), 400
+    net = get_network()
+    return jsonify({"stations": net.station_records(net.spatial.within(*bbox).tolist())})
+
+def describe_route(path, total_fare, total_time, transfers=None):
+    """Builds the JSON body for one route."""
+    result = {
         "path": path,
         "path_description": " > ".join(path),
         "total_fare": round(total_fare, 2),
         "total_time_minutes": int(total_time)
+    }
+    if transfers is not None:
+        result["transfers"] = transfers
+    return result
+
+@api.route('/route', methods=['GET'])
+def get_route():
+    """
+    Returns the best route between two stations.
+
+    Query parameters:
+        from, to:  Station names (required).
+        optimize:  'hops' (default), 'time' or 'fare'.
+        k:         Number of routes to return (1 to MAX_ROUTE_ALTERNATIVES).
+                   Extra routes are listed under "alternatives".
+        algorithm: 'astar' (default) or 'dijkstra'.
+        depart_at: 'HH:MM' or 'HH:MM:SS'. Plans on the imported GTFS timetable
+                   instead (see timetable_route()); optimize, k and algorithm are ignored.
+        max_transfers: With depart_at, at most this many transfers
+                   (0 to MAX_TIMETABLE_TRANSFERS, default MAX_TIMETABLE_TRANSFERS).
+
+    The default hop-count query is answered from the all-pairs table compiled
+    by database.py, so no graph search happens per request. Weighted queries
+    and alternatives use the Dijkstra/A* engine in routing.py. Response bodies
+    are kept in route_cache, keyed by dataset version and parameters.
+    """
+    origin, destination = request.args.get('from'), request.args.get('to')
+    if not origin or not destination: return jsonify({"error": "Missing parameters"}), 400
+    if 'depart_at' in request.args:
+        return timetable_route(origin, destination)
+
+    optimize = request.args.get('optimize', DEFAULT_ROUTE_OPTIMIZE)
+    algorithm = request.args.get('algorithm', 'astar')
+    k = request.args.get('k', 1, type=int)
+    if optimize not in OPTIMIZE_MODES:
+        return jsonify({"error": f"optimize must be one of {', '.join(OPTIMIZE_MODES)}"}), 400
+    if algorithm not in ALGORITHMS:
+        return jsonify({"error": f"algorithm must be one of {', '.join(ALGORITHMS)}"}), 400
+    if k is None or not 1 <= k <= MAX_ROUTE_ALTERNATIVES:
+        return jsonify({"error": f"k must be between 1 and {MAX_ROUTE_ALTERNATIVES}"}), 400
+
+    if origin == destination:
+        return jsonify({ "path": [origin], "total_fare": 0.0, "total_time_minutes": 0 })
+
+    # Popular pairs are served from the cache of ready-to-send response bodies.
+    # Only real station names get cache entries, so junk requests cannot evict them.
+    net, routing_engine, _ = get_loaded()
+    if origin not in net.station_ids or destination not in net.station_ids:
+        return jsonify({"error": "No route could be calculated between these stations."}), 404
+    cache_key = (net.version, origin, destination, optimize, k, algorithm)
+    cached = route_cache.get(cache_key)
+    if cached is None:
+        started = time.perf_counter()
+        result, status = find_routes(net, routing_engine, origin, destination, optimize, k, algorithm)
+        ROUTE_COMPUTE.labels('table' if uses_route_table(optimize) and k == 1 else 'search').observe(time.perf_counter() - started)
+        cached = (status, json.dumps(result, separators=(',', ':')).encode('utf-8'))
+        route_cache.put(cache_key, *cached)
+    status, body = cached
+    return Response(body, status=status, mimetype='application/json')
+
+def uses_route_table(optimize):
+    """
+    Whether hop-count routes come from the precomputed table. The table counts
+    every hop as 1, so a 'hops' transfer penalty sends them to the routing
+    engine instead, for k = 1 as well as for alternatives.
+    """
+    return optimize == 'hops' and not TRANSFER_PENALTIES.get('hops')
+
+def find_routes(net, routing_engine, origin, destination, optimize, k, algorithm):
+    """Computes the /api/route body for validated parameters. Returns (body, status code)."""
+    table = uses_route_table(optimize)
+    # --- Fast path: hop-count route read from the precomputed table ---
+    if table and k == 1:
+        route = net.lookup_route(origin, destination)
+        if route is None:
+            return {"error": "No route could be calculated between these stations."}, 404
+        path, total_fare, total_time, incomplete = route
+
+        if incomplete:
+            # The totals stop at the first segment that has no fare/time data.
+            # For a better user experience, we still return the route.
+            log_event('route_incomplete', level='WARNING', origin=origin, destination=destination, stations=len(path))
+
+        return describe_route(path, total_fare, total_time), 200
+
+    # --- Weighted search (and k alternatives) with the routing engine ---
+    o, d = net.station_ids.get(origin), net.station_ids.get(destination)
+    if o is None or d is None:
+        routes = []
+    else:
+        # Alternatives to a table route start from it, so k = 1 and k > 1 agree on the best route.
+        first = net.table_path_ids(o, d) if table and net.route_pred[o, d] >= 0 else None
+        routes = routing_engine.k_shortest_paths(o, d, k, optimize, algorithm, first)
+    if not routes:
+        return {"error": "No route could be calculated between these stations."}, 404
+
+    described = []
+    for _, path_ids in routes:
+        total_fare, total_time, transfers, incomplete = routing_engine.path_totals(path_ids)
+        path = [net.station_names[i] for i in path_ids]
+        if incomplete:
+            log_event('route_incomplete', level='WARNING', origin=origin, destination=destination, stations=len(path))
+        described.append(describe_route(path, total_fare, total_time, transfers))
+
+    result = described[0]
+    result["optimize"] = optimize
+    if k > 1:
+        result["alternatives"] = described[1:]
+    return result, 200
+
+# --- Reachability ---
+
+@api.route('/reachable', methods=['GET'])
+def get_reachable():
+    """
+    Every station reachable from one origin, from a single shortest-path pass.
+
+    Query parameters:
+        from:        Origin station name (required).
+        max_minutes: Only stations within this travel time.
+        max_fare:    Only stations within this fare.
+        optimize:    Which cheapest route each station is reached by:
+                     'time' (default), 'fare' or 'hops'. Times and fares are the
+                     totals along that route, as /api/route reports them.
+        table:       '1' returns the whole one-to-all table instead, as columns
+                     indexed by the station ids of /api/network (for heatmaps);
+                     max_minutes and max_fare are ignored.
+
+    Stations are listed by travel time, each with its predecessor on the route
+    so a client can draw the tree. Thresholds are bucketed to whole minutes
+    and whole sen, the resolution of the data, so the cached responses can be
+    shared by every query in the same bucket.
+    """
+    origin = request.args.get('from')
+    if not origin: return jsonify({"error": "Missing parameters"}), 400
+    optimize = request.args.get('optimize', 'time')
+    if optimize not in OPTIMIZE_MODES:
+        return jsonify({"error": f"optimize must be one of {', '.join(OPTIMIZE_MODES)}"}), 400
+    table = request.args.get('table', '0') not in ('0', 'false')
+    max_minutes = request.args.get('max_minutes', type=float)
+    max_fare = request.args.get('max_fare', type=float)
+    for name, value in (('max_minutes', max_minutes), ('max_fare', max_fare)):
+        if name in request.args and (value is None or not math.isfinite(value) or value < 0):
+            return jsonify({"error": f"{name} must be a finite, non-negative number"}), 400
+
+    net, routing_engine, _ = get_loaded()
+    if origin not in net.station_ids:
+        return jsonify({"error": "Station not found."}), 404
+    if table:
+        cache_key = (net.version, 'reachable-table', origin, optimize)
+    else:
+        minutes_bucket = None if max_minutes is None else int(max_minutes)
+        fare_bucket = None if max_fare is None else int(max_fare * 100 + 1e-6)
+        cache_key = (net.version, 'reachable', origin, optimize, minutes_bucket, fare_bucket)
+    cached = route_cache.get(cache_key)
+    if cached is None:
+        started = time.perf_counter()
+        tree = routing_engine.shortest_path_tree(net.station_ids[origin], optimize)
+        if table:
+            result = reachable_table(net, origin, optimize, tree)
+        else:
+            result = reachable_stations(net, origin, optimize, tree, minutes_bucket, fare_bucket)
+        ROUTE_COMPUTE.labels('reachable').observe(time.perf_counter() - started)
+        cached = (200, json.dumps(result, separators=(',', ':')).encode('utf-8'))
+        route_cache.put(cache_key, *cached)
+    status, body = cached
+    return Response(body, status=status, mimetype='application/json')
+
+def reachable_stations(net, origin, optimize, tree, max_minutes, max_fare_sen):
+    """The /api/reachable body: stations within the (bucketed) limits, by travel time."""
+    pred, minutes, fares, transfers, incomplete = tree
+    stations = []
+    for i, name in enumerate(net.station_names):
+        if minutes[i] is None or name == origin:
+            continue
+        fare = round(fares[i], 2)
+        if max_minutes is not None and minutes[i] > max_minutes:
+            continue
+        if max_fare_sen is not None and round(fare * 100) > max_fare_sen:
+            continue
+        stations.append({
+            "name": name,
+            "id": i,
+            "total_time_minutes": int(minutes[i]),
+            "total_fare": fare,
+            "transfers": transfers[i],
+            "predecessor": net.station_names[pred[i]],
+            **({"incomplete": True} if incomplete[i] else {}),
+        })
+    stations.sort(key=lambda record: (record["total_time_minutes"], record["total_fare"], record["name"]))
+    return {
+        "from": origin,
+        "optimize": optimize,
+        "max_minutes": max_minutes,
+        "max_fare": None if max_fare_sen is None else max_fare_sen / 100,
+        "count": len(stations),
+        "stations": stations,
+    }
+
+def reachable_table(net, origin, optimize, tree):
+    """The /api/reachable?table=1 body: one entry per station id (null where unreachable)."""
+    pred, minutes, fares, transfers, _ = tree
+    return {
+        "from": origin,
+        "optimize": optimize,
+        "version": net.version,
+        "total_time_minutes": [None if m is None else int(m) for m in minutes],
+        "total_fare": [None if f is None else round(f, 2) for f in fares],
+        "transfers": transfers,
+        "predecessor": pred,
+    }
+
+# --- Timetable Journey Planning ---
+
+def timetable_route(origin, destination):
+    """
+    /api/route?depart_at=...: earliest arrival on the GTFS timetable with RAPTOR.
+    The response describes the earliest-arriving journey; "options" lists every
+    Pareto-optimal journey (each with fewer transfers but a later arrival than
+    the next), so a client can offer "fewer changes" alternatives.
+    """
+    depart_at = parse_clock(request.args.get('depart_at', ''))
+    if depart_at is None:
+        return jsonify({"error": "depart_at must be a time like 08:30 or 08:30:00"}), 400
+    max_transfers = request.args.get('max_transfers', MAX_TIMETABLE_TRANSFERS, type=int)
+    if max_transfers is None or not 0 <= max_transfers <= MAX_TIMETABLE_TRANSFERS:
+        return jsonify({"error": f"max_transfers must be between 0 and {MAX_TIMETABLE_TRANSFERS}"}), 400
+    raptor = get_raptor_engine()
+    if raptor is None:
+        return jsonify({"error": "No timetable loaded. Import one with: python database.py --gtfs <feed>"}), 400
+    if not raptor.timetable.stops_for(origin) or not raptor.timetable.stops_for(destination):
+        return jsonify({"error": "Station not found in the timetable."}), 404
+
+    cache_key = (raptor.timetable.version, origin, destination, depart_at, max_transfers)
+    cached = route_cache.get(cache_key)
+    if cached is None:
+        started = time.perf_counter()
+        result, status = find_timetable_routes(raptor, origin, destination, depart_at, max_transfers)
+        ROUTE_COMPUTE.labels('timetable').observe(time.perf_counter() - started)
+        cached = (status, json.dumps(result, separators=(',', ':')).encode('utf-8'))
+        route_cache.put(cache_key, *cached)
+    status, body = cached
+    return Response(body, status=status, mimetype='application/json')
+
+def describe_journey(journey, depart_at, origin):
+    """Builds the JSON body for one RAPTOR journey (no legs: already at the destination)."""
+    path = [] if journey["legs"] else [origin]
+    for leg in journey["legs"]:
+        for station in leg["stops"] if leg["mode"] == "trip" else (leg["from"], leg["to"]):
+            if not path or path[-1] != station:
+                path.append(station)
+    return {
+        "path": path,
+        "path_description": " > ".join(path),
+        "depart_at": format_time(depart_at),
+        "arrival": format_time(journey["arrival"]),
+        "total_time_minutes": (journey["arrival"] - depart_at) // 60,
+        "transfers": journey["transfers"],
+        "legs": journey["legs"],
+    }
+
+def find_timetable_routes(raptor, origin, destination, depart_at, max_transfers):
+    """Computes the timetable /api/route body for validated parameters. Returns (body, status code)."""
+    sources, targets = raptor.timetable.stops_for(origin), raptor.timetable.stops_for(destination)
+    if not sources or not targets:
+        return {"error": "Station not found in the timetable."}, 404
+    journeys = raptor.journeys(sources, targets, depart_at, max_transfers)
+    if not journeys:
+        return {"error": "No journey found after this departure time."}, 404
+    result = describe_journey(journeys[-1], depart_at, origin)
+    result["options"] = [describe_journey(journey, depart_at, origin) for journey in journeys]
+    return result, 200
+
+# --- Batch Routing ---
+
+STREAMED_BATCH_TYPES = ('text/csv', 'application/x-ndjson', 'application/jsonl')
+
+def as_pair(item):
+    """(origin, destination) from ["A", "B"] or {"from": "A", "to": "B"}; None for anything that is not a string."""
+    if isinstance(item, dict):
+        item = item.get('from'), item.get('to')
+    if isinstance(item, (list, tuple)) and len(item) == 2:
+        return tuple(value if isinstance(value, str) else None for value in item)
+    return None, None
+
+def json_batch_pairs():
+    """
+    Reads an application/json batch body: [["A", "B"], ...],
+    [{"from": "A", "to": "B"}, ...] or {"pairs": [...]} with either form.
+    Returns the list of pairs. Raises ValueError if the body is not one of
+    these, so the request can be refused before the response starts streaming.
+    """
+    body = request.get_json(silent=True)
+    items = body.get('pairs') if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        raise ValueError('The body must be a JSON list of pairs, or an object with a "pairs" list.')
+    pairs = []
+    for i, item in enumerate(items):
+        pair = as_pair(item)
+        if None in pair:
+            raise ValueError(f'Pair {i} must be ["from", "to"] or {{"from": ..., "to": ...}} with station names.')
+        pairs.append(pair)
+    return pairs
+
+def iter_batch_pairs(mimetype):
+    """
+    Yields (origin, destination) pairs from a CSV or NDJSON batch body, line
+    by line, so it is never held in memory whole. A line that is not a pair
+    yields (None, None) and gets a "Missing parameters" error line in the
+    response; an NDJSON line that is not JSON at all yields
+    (None, None, error message) instead.
+        application/x-ndjson: One ["A", "B"] or {"from": "A", "to": "B"} per line.
+        text/csv:             One "A,B" per line, with an optional "from,to" header.
+    """
+    if mimetype == 'text/csv':
+        reader = csv.reader(io.TextIOWrapper(request.stream, encoding='utf-8', errors='replace'))
+        for i, row in enumerate(reader):
+            if not row:
+                continue
+            if i == 0 and [cell.strip().lower() for cell in row] == ['from', 'to']:
+                continue
+            yield as_pair([cell.strip() for cell in row])
+    else:
+        for number, line in enumerate(io.TextIOWrapper(request.stream, encoding='utf-8', errors='replace'), 1):
+            if line.strip():
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    yield None, None, f"invalid JSON on line {number}"
+                    continue
+                yield as_pair(item)
+
+def batch_route_lines(pairs, include_paths):
+    """
+    Resolves pairs to station ids and gathers fare/time totals for a whole chunk
+    at once from the route table, then yields the NDJSON text for each chunk.
+    """
+    net = get_network()
+    chunk = []
+    for pair in pairs:
+        chunk.append(pair)
+        if len(chunk) >= BATCH_ROUTE_CHUNK_SIZE:
+            yield _batch_route_chunk(net, chunk, include_paths)
+            chunk = []
+    if chunk:
+        yield _batch_route_chunk(net, chunk, include_paths)
+
+def _batch_route_chunk(net, chunk, include_paths):
+    o = np.array([net.station_ids.get(pair[0], -1) for pair in chunk], dtype=np.int64)
+    d = np.array([net.station_ids.get(pair[1], -1) for pair in chunk], dtype=np.int64)
+    known = (o >= 0) & (d >= 0)
+    o_safe, d_safe = np.where(known, o, 0), np.where(known, d, 0)
+    # Same-station pairs have no predecessor but a valid zero-cost route.
+    found = known & ((net.route_pred[o_safe, d_safe] >= 0) | (o_safe == d_safe))
+    fares = np.round(net.route_fare[o_safe, d_safe], 2).tolist()
+    minutes = net.route_time[o_safe, d_safe].astype(np.int64).tolist()
+
+    lines = []
+    for i, pair in enumerate(chunk):
+        origin, destination = pair[0], pair[1]
+        if not found[i]:
+            if len(pair) > 2:
+                error = pair[2]
+            elif not origin or not destination:
+                error = "Missing parameters"
+            else:
+                error = "No route could be calculated between these stations."
+            result = {"from": origin, "to": destination, "error": error}
+        else:
+            result = {"from": origin, "to": destination, "total_fare": fares[i], "total_time_minutes": minutes[i]}
+            if include_paths:
+                result["path"] = net.table_path(int(o[i]), int(d[i]))
+        lines.append(json.dumps(result, separators=(',', ':')))
+    lines.append('')
+    return '\n'.join(lines)
+
+@api.route('/routes/batch', methods=['POST'])
+def get_routes_batch():
+    """
+    Hop-count routes for many origin/destination pairs in one request.
+    The body is JSON (see json_batch_pairs()), or CSV or NDJSON selected by
+    the Content-Type (see iter_batch_pairs()). Add ?paths=0 to return only
+    the totals.
+
+    The response is streamed back as NDJSON, one result per input pair and in
+    the same order, so large batches are never fully held in memory. A JSON
+    body that is not a list of pairs gets a 400 before anything is streamed.
+    """
+    include_paths = request.args.get('paths', '1') not in ('0', 'false')
+    if request.mimetype in STREAMED_BATCH_TYPES:
+        pairs = iter_batch_pairs(request.mimetype)
+    else:
+        try:
+            pairs = json_batch_pairs()
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+    lines = batch_route_lines(pairs, include_paths)
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+# --- Admin Endpoints ---
+
+def admin_allowed():
+    """
+    Admin calls need the X-Admin-Token header. Without a configured token they
+    are refused, except from localhost on the development server (debug mode):
+    behind a local reverse proxy every request would come from localhost.
+    """
+    if ADMIN_TOKEN:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+    return current_app.debug and request.remote_addr in ('127.0.0.1', '::1')
+
+@api.route('/admin/status', methods=['GET'])
+def get_admin_status():
+    """Loaded dataset version, reload state and route cache statistics."""
+    if not admin_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    net, _, raptor = get_loaded()
+    return jsonify({
+        "version": net.version,
+        "dataset_version": net.source_version,
+        "source": net.source,
+        "stations": len(net),
+        "timetable_version": raptor.timetable.version if raptor is not None else None,
+        **reload_status,
+        "route_cache": route_cache.stats(),
     })
 
-# Load all data from SQLite once when the application starts
-load_all_data()
\ No newline at end of file
+@api.route('/admin/reload', methods=['POST'])
+def post_admin_reload():
+    """
+    Rebuilds the network in the background and swaps it in; Socket.IO
+    connections stay open. ?source=sqlite rebuilds from the database tables
+    instead of the compiled artifact. In production mode this reloads only the
+    worker that serves the request; send SIGHUP to server.py to reload all of them.
+    """
+    if not admin_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    source = request.args.get('source', 'auto')
+    if source not in ('auto', 'sqlite'):
+        return jsonify({"error": "source must be 'auto' or 'sqlite'"}), 400
+    if not start_reload(source):
+        return jsonify({"error": "A reload is already in progress."}), 409
+    return jsonify({"status": "reloading", "version": get_network().version}), 202
+
+if __name__ == '__main__':
+    # Run `python routes.py` to check the route table against the reference BFS.
+    bad_pairs = verify_route_table()
+    if bad_pairs:
+        print(f"[ERROR] Route table disagrees with BFS for {len(bad_pairs)} pairs, e.g. {bad_pairs[:5]}")
+    else:
+        n = len(get_network())
+        print(f"[SUCCESS] Route table matches BFS for all {n * (n - 1)} pairs.")
@@ -0,0 +1,226 @@
+# routing.py
+"""
+Weighted journey planning over integer station ids.
+
+The RoutingEngine works on a network.NetworkData: its CSR adjacency and
+fare/time matrices are converted once into edge weight arrays per cost mode.
+It supports:
+- Dijkstra and A* (with a haversine lower-bound heuristic from station coordinates).
+- Optimizing for travel time, fare or number of hops.
+- The k best loopless alternatives using Yen's algorithm.
+- Shortest-path trees from one station to all others (/api/reachable).
+- A configurable penalty on interchange (transfer) edges.
+"""
+import heapq
+import math
+import numpy as np
+from spatial import haversine_km
+from telemetry import Counter
+
+OPTIMIZE_MODES = ('time', 'fare', 'hops')
+ALGORITHMS = ('astar', 'dijkstra')
+
+NODES_EXPANDED = Counter('metro_route_search_nodes_expanded_total',
+                         "Stations expanded by route searches, by search type.", ['search'])
+_expanded = {search: NODES_EXPANDED.labels(search) for search in ('astar', 'dijkstra', 'tree')}
+
+
+class RoutingEngine:
+    """
+    Immutable routing structures for one version of the network.
+
+    Args:
+        network (NetworkData): Station ids, coordinates, CSR adjacency, fares and times.
+        transfer_penalties (dict): Extra cost per transfer for each optimize mode.
+    """
+
+    def __init__(self, network, transfer_penalties):
+        self.network = network
+        self.names = network.station_names
+        self.n = len(network)
+        self.lats = np.asarray(network.lats)
+        self.lons = np.asarray(network.lons)
+        self.transfer_edges = network.transfer_edges
+
+        # --- CSR edge arrays (plain lists: fastest to index from the Python search loop) ---
+        self.indptr = network.indptr.tolist()
+        self.indices = network.indices.tolist()
+        src = np.repeat(np.arange(self.n), np.diff(self.indptr)).astype(np.int64)
+        dst = np.asarray(self.indices, dtype=np.int64)
+        is_transfer = np.array([(u, v) in self.transfer_edges for u, v in zip(src.tolist(), dst.tolist())], dtype=bool)
+
+        base = {
+            'time': network.segment_minutes(src, dst),
+            'fare': network.segment_fares(src, dst),
+            'hops': np.ones(len(dst)),
+        }
+        # Unpenalized per-edge totals (NaN where the matrices have no data), for shortest_path_tree().
+        self.edge_minutes = base['time'].tolist()
+        self.edge_fares = base['fare'].tolist()
+        self.edge_is_transfer = is_transfer.tolist()
+        edge_km = haversine_km(self.lats[src], self.lons[src], self.lats[dst], self.lons[dst]) if len(dst) else np.zeros(0)
+
+        self.edge_weights = {}
+        self.heuristic_scale = {}
+        for mode, weights in base.items():
+            weights = weights.astype(float)
+            finite = np.isfinite(weights)
+            # A segment with no data is costed like the most expensive known one,
+            # so it stays usable without looking artificially cheap.
+            fallback = weights[finite].max() if finite.any() else 1.0
+            weights = np.where(finite, weights, fallback)
+
+            # Scale for an admissible A* heuristic: no edge may cost less than
+            # scale * its straight-line length. Edges without a length are ignored.
+            usable = np.isfinite(edge_km) & (edge_km > 0)
+            scale = float(np.min(weights[usable] / edge_km[usable])) if usable.any() else 0.0
+            self.heuristic_scale[mode] = max(scale, 0.0)
+
+            weights = weights + is_transfer * float(transfer_penalties.get(mode, 0))
+            self.edge_weights[mode] = weights.tolist()
+
+    # --- Search ---
+
+    def _heuristic(self, destination, optimize, algorithm):
+        if algorithm != 'astar' or self.heuristic_scale[optimize] == 0.0 or np.isnan(self.lats[destination]):
+            return None
+        km = haversine_km(self.lats, self.lons, self.lats[destination], self.lons[destination])
+        return np.nan_to_num(km * self.heuristic_scale[optimize], nan=0.0).tolist()
+
+    def _search(self, origin, destination, weights, h, blocked_nodes=(), blocked_edges=()):
+        """Dijkstra, or A* when h is given. Returns (cost, path_ids) or None."""
+        indptr, indices = self.indptr, self.indices
+        dist = {origin: 0.0}
+        prev = {origin: -1}
+        heap = [((h[origin] if h else 0.0), 0.0, origin)]
+        expanded = 0
+        while heap:
+            _, g, u = heapq.heappop(heap)
+            if u == destination:
+                _expanded['astar' if h else 'dijkstra'].inc(expanded)
+                path = [u]
+                while prev[path[-1]] != -1:
+                    path.append(prev[path[-1]])
+                return g, path[::-1]
+            if g > dist[u]:
+                continue
+            expanded += 1
+            for idx in range(indptr[u], indptr[u + 1]):
+                v = indices[idx]
+                if v in blocked_nodes or (u, v) in blocked_edges:
+                    continue
+                ng = g + weights[idx]
+                if ng < dist.get(v, math.inf):
+                    dist[v] = ng
+                    prev[v] = u
+                    heapq.heappush(heap, ((ng + h[v]) if h else ng, ng, v))
+        _expanded['astar' if h else 'dijkstra'].inc(expanded)
+        return None
+
+    def shortest_path(self, origin, destination, optimize='time', algorithm='astar'):
+        """Returns (cost, path_ids) for the cheapest route, or None."""
+        h = self._heuristic(destination, optimize, algorithm)
+        return self._search(origin, destination, self.edge_weights[optimize], h)
+
+    def k_shortest_paths(self, origin, destination, k=1, optimize='time', algorithm='astar', first=None):
+        """
+        Yen's algorithm: the k cheapest loopless routes, best first.
+        Returns a list of (cost, path_ids). first, if given, is a known
+        cheapest route (path_ids) to start from instead of searching for one.
+        """
+        weights = self.edge_weights[optimize]
+        h = self._heuristic(destination, optimize, algorithm)
+        if first is not None:
+            first = (self.path_cost(first, weights), list(first))
+        else:
+            first = self._search(origin, destination, weights, h)
+        if first is None:
+            return []
+
+        accepted = [first]
+        seen = {tuple(first[1])}
+        candidates = []
+        while len(accepted) < k:
+            last_path = accepted[-1][1]
+            for i in range(len(last_path) - 1):
+                spur_node = last_path[i]
+                root = last_path[:i + 1]
+                blocked_edges = {(p[i], p[i + 1]) for _, p in accepted if p[:i + 1] == root}
+                spur = self._search(spur_node, destination, weights, h, set(root[:-1]), blocked_edges)
+                if spur is None:
+                    continue
+                path = root[:-1] + spur[1]
+                if tuple(path) in seen:
+                    continue
+                seen.add(tuple(path))
+                heapq.heappush(candidates, (self.path_cost(path, weights), path))
+            if not candidates:
+                break
+            accepted.append(heapq.heappop(candidates))
+        return accepted
+
+    def shortest_path_tree(self, origin, optimize='time'):
+        """
+        One Dijkstra pass from origin to every station. Returns (pred, minutes,
+        fares, transfers, incomplete), lists indexed by station id with the
+        totals along each station's cheapest route (as path_totals() would
+        report them). Unreached stations have pred -1 and totals None; so
+        does the origin's pred.
+        """
+        indptr, indices, weights = self.indptr, self.indices, self.edge_weights[optimize]
+        edge_minutes, edge_fares, edge_is_transfer = self.edge_minutes, self.edge_fares, self.edge_is_transfer
+        n = self.n
+        dist = [math.inf] * n
+        pred = [-1] * n
+        minutes, fares, transfers, incomplete = [None] * n, [None] * n, [None] * n, [None] * n
+        dist[origin] = 0.0
+        minutes[origin], fares[origin], transfers[origin], incomplete[origin] = 0.0, 0.0, 0, False
+        heap = [(0.0, origin)]
+        expanded = 0
+        while heap:
+            g, u = heapq.heappop(heap)
+            if g > dist[u]:
+                continue
+            expanded += 1
+            for idx in range(indptr[u], indptr[u + 1]):
+                v = indices[idx]
+                ng = g + weights[idx]
+                if ng < dist[v]:
+                    dist[v] = ng
+                    pred[v] = u
+                    # The totals stop at the first segment without data, as in path_totals().
+                    m, f = edge_minutes[idx], edge_fares[idx]
+                    incomplete[v] = incomplete[u] or m != m or f != f
+                    minutes[v] = minutes[u] if incomplete[v] else minutes[u] + m
+                    fares[v] = fares[u] if incomplete[v] else fares[u] + f
+                    transfers[v] = transfers[u] + edge_is_transfer[idx]
+                    heapq.heappush(heap, (ng, v))
+        _expanded['tree'].inc(expanded)
+        return pred, minutes, fares, transfers, incomplete
+
+    def path_cost(self, path, weights):
+        """Sums edge weights along a path of station ids."""
+        indptr, indices = self.indptr, self.indices
+        total = 0.0
+        for u, v in zip(path, path[1:]):
+            start, end = indptr[u], indptr[u + 1]
+            total += weights[start + indices[start:end].index(v)]
+        return total
+
+    # --- Reporting ---
+
+    def path_totals(self, path):
+        """
+        Returns (total_fare, total_minutes, transfers, incomplete) for a path,
+        read from the fare/time matrices in one vectorized gather. Like the
+        route table (network.build_route_table), the totals stop at the first
+        segment that has no fare or time data.
+        """
+        if len(path) < 2:
+            return 0.0, 0.0, 0, False
+        src, dst = np.asarray(path[:-1]), np.asarray(path[1:])
+        seg_fares, seg_times = self.network.segment_fares(src, dst), self.network.segment_minutes(src, dst)
+        missing = np.isnan(seg_fares) | np.isnan(seg_times)
+        end = int(np.argmax(missing)) if missing.any() else len(missing)
+        transfers = sum((u, v) in self.transfer_edges for u, v in zip(path, path[1:]))
+        return float(seg_fares[:end].sum()), float(seg_times[:end].sum()), transfers, bool(missing.any())
@@ -0,0 +1,236 @@
+# scheduler.py
+"""
+Simulation job scheduler.
+
+A kiosk that plans a route asks for a train on it ('start_simulation', see
+realtime.py). Instead of broadcasting every request to every client, the
+server submits it here as a job. SimulationScheduler:
+- refuses requests from a client over its rate limit (a token bucket, kept
+  per client address rather than per connection, so reconnecting does not
+  reset it),
+- answers with the existing job when the same path is already queued or running,
+- places each new job on exactly one registered data generator, the one
+  running the fewest jobs (the earliest registered on a tie),
+- queues jobs while no generator is connected, and
+- moves a generator's jobs to the others when it disconnects.
+A job ends when its generator reports the train finished, or after a timeout.
+realtime.py calls expire() periodically, so timed-out jobs and refilled
+buckets are dropped even while nobody submits.
+
+The state only changes through events, applied in order:
+
+    ('generator_up', sid, owner)     ('generator_down', sid)     ('hello', owner)
+    ('job', job id, path, owner, generator sid or None)   # a job created, placed or moved
+    ('job_done', job id)
+
+With several server workers (server.py) every worker keeps a replica of the
+state: the events of its decisions are published on the message queue and
+applied by the others, so each worker sees every generator and job for
+deduplication and placement. Only the worker a job was submitted to (its
+owner) ever places or moves it, so a job is never sent to two generators.
+
+A worker publishes 'hello' when it starts. The others answer with the
+generators connected to them and the jobs they own (state_events). Owners
+are named after the worker slot, so a restarted worker also gets back the
+jobs it owned before, and the generators that were connected to its previous
+life count as gone.
+"""
+import threading
+import time
+import uuid
+
+
+class SimulationScheduler:
+    """
+    Jobs and generators of the simulation (the replica of one process).
+    Every method is thread-safe. The methods that make decisions return the
+    events to publish to the other workers; their 'job' events with a
+    generator are the jobs to send to that generator.
+
+    Args:
+        owner (str): Name of this process, stable across restarts of the same worker.
+        requests_per_minute (float): Rate at which a client's request budget refills.
+        burst (int): Requests a client may send at once.
+        max_jobs (int): Most jobs queued or running at the same time.
+        job_timeout (float): Seconds after which a job is dropped even if no
+            generator reported it finished.
+    """
+
+    def __init__(self, owner, requests_per_minute, burst, max_jobs, job_timeout):
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst
+        self.max_jobs = max_jobs
+        self.job_timeout = job_timeout
+        self.owner = owner
+        self.generators = {}    # generator sid -> ids of the jobs placed on it, in registration order
+        self._hosts = {}        # generator sid -> owner of the process it is connected to
+        self.jobs = {}          # job id -> {"id", "path", "owner", "generator", "since"}, oldest first
+        self._by_path = {}      # tuple(path) -> id of the active job for that path
+        self._local = set()     # generator sids connected to this process
+        self._buckets = {}      # client address -> (tokens left, monotonic time they were counted)
+        self._lock = threading.Lock()
+
+    # --- Events ---
+
+    def _apply(self, event):
+        kind = event[0]
+        if kind == 'generator_up':
+            self.generators.setdefault(event[1], set())
+            self._hosts[event[1]] = event[2]
+        elif kind == 'generator_down':
+            self._hosts.pop(event[1], None)
+            for job_id in self.generators.pop(event[1], ()):
+                if job_id in self.jobs:
+                    self.jobs[job_id]["generator"] = None
+        elif kind == 'hello':
+            for sid, host in list(self._hosts.items()):
+                if host == event[1]:
+                    self._apply(('generator_down', sid))
+        elif kind == 'job':
+            _, job_id, path, owner, generator = event
+            job = self.jobs.get(job_id)
+            if job is None:
+                job = self.jobs[job_id] = {"id": job_id, "path": list(path), "owner": owner,
+                                           "generator": None, "since": time.monotonic()}
+                self._by_path.setdefault(tuple(path), job_id)
+            elif job["generator"] in self.generators:
+                self.generators[job["generator"]].discard(job_id)
+            job["generator"] = generator
+            # A generator that is already gone stays gone; the job's owner moves the job.
+            if generator in self.generators:
+                self.generators[generator].add(job_id)
+        elif kind == 'job_done':
+            self._drop(event[1])
+
+    def _drop(self, job_id):
+        job = self.jobs.pop(job_id, None)
+        if job is None:
+            return
+        if self._by_path.get(tuple(job["path"])) == job_id:
+            del self._by_path[tuple(job["path"])]
+        if job["generator"] in self.generators:
+            self.generators[job["generator"]].discard(job_id)
+
+    def _expire(self, now):
+        while self.jobs:
+            job = next(iter(self.jobs.values()))
+            if now - job["since"] < self.job_timeout:
+                return
+            self._drop(job["id"])
+
+    def _refilled(self, client, now):
+        tokens, counted = self._buckets[client]
+        return min(self.burst, tokens + (now - counted) * self.requests_per_minute / 60)
+
+    def _least_loaded(self):
+        return min(self.generators, key=lambda sid: len(self.generators[sid]), default=None)
+
+    def _place_pending(self):
+        """Places this process's jobs that have no (live) generator. Returns their events."""
+        events = []
+        for job in self.jobs.values():
+            if job["owner"] != self.owner or job["generator"] in self.generators:
+                continue
+            generator = self._least_loaded()
+            if generator is None:
+                break
+            event = ('job', job["id"], job["path"], job["owner"], generator)
+            self._apply(event)
+            events.append(event)
+        return events
+
+    def receive(self, events):
+        """
+        Applies events published by another worker. Returns the events of this
+        process's jobs placed as a result (on a generator that came up, or
+        moved off one that went down).
+        """
+        with self._lock:
+            for event in events:
+                # This process decides where its own jobs run; others only hand back the ones it forgot.
+                if event[0] == 'job' and event[3] == self.owner and event[1] in self.jobs:
+                    continue
+                self._apply(event)
+            if any(event[0] in ('generator_up', 'generator_down', 'hello') for event in events):
+                return self._place_pending()
+            return []
+
+    def finish(self, job_ids):
+        """Ends jobs whose trains completed (reported by their generator, seen by every worker)."""
+        with self._lock:
+            for job_id in job_ids:
+                self._drop(job_id)
+
+    def state_events(self, owner):
+        """
+        Answer to ('hello', owner): the generators connected to this process,
+        and the jobs owned by this process or by owner.
+        """
+        with self._lock:
+            return ([('generator_up', sid, self.owner) for sid in self._local] +
+                    [('job', job["id"], job["path"], job["owner"], job["generator"])
+                     for job in self.jobs.values() if job["owner"] in (self.owner, owner)])
+
+    # --- Decisions ---
+
+    def register(self, sid):
+        """A data generator connected to this process. Queued jobs are placed on it."""
+        with self._lock:
+            self._local.add(sid)
+            event = ('generator_up', sid, self.owner)
+            self._apply(event)
+            return [event] + self._place_pending()
+
+    def unregister(self, sid):
+        """A client disconnected from this process. A generator's jobs move to the others."""
+        with self._lock:
+            if sid not in self._local:
+                return []
+            self._local.discard(sid)
+            event = ('generator_down', sid)
+            self._apply(event)
+            return [event] + self._place_pending()
+
+    def submit(self, client, path, now=None):
+        """
+        Asks for a train on path (station names) on behalf of client (its
+        address, see realtime.py).
+        Returns (job, created, events): a copy of the job that runs the path,
+        False if that job was already active, and the events to publish.
+        Raises ValueError if the client is over its rate limit or max_jobs
+        jobs are active.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens = self._refilled(client, now) if client in self._buckets else self.burst
+            if tokens < 1:
+                self._buckets[client] = (tokens, now)
+                raise ValueError("Too many simulation requests; try again shortly.")
+            self._buckets[client] = (tokens - 1, now)
+
+            self._expire(now)
+            job_id = self._by_path.get(tuple(path))
+            if job_id is not None:
+                return dict(self.jobs[job_id]), False, []
+            if len(self.jobs) >= self.max_jobs:
+                raise ValueError("Too many simulations are running; try again later.")
+            event = ('job', uuid.uuid4().hex[:12], list(path), self.owner, self._least_loaded())
+            self._apply(event)
+            return dict(self.jobs[event[1]]), True, [event]
+
+    def expire(self, now=None):
+        """
+        Drops jobs older than job_timeout, and the rate limits of clients whose
+        budget has refilled (they would start over with a full one anyway).
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            for client in [client for client in self._buckets if self._refilled(client, now) >= self.burst]:
+                del self._buckets[client]
+
+    def counts(self):
+        """{'running': jobs on a generator, 'queued': jobs waiting for one}."""
+        with self._lock:
+            running = sum(len(job_ids) for job_ids in self.generators.values())
+            return {'running': running, 'queued': len(self.jobs) - running}
@@ -0,0 +1,120 @@
+# server.py
+"""
+Production run mode: several async worker processes behind one port.
+
+    python app.py --mode prod --workers 4 [--async-mode eventlet|gevent] [--message-queue URL]
+
+The supervisor (this module's run()) starts the message queue broker when the
+queue is "local", then launches each worker as `python server.py --worker`.
+Every worker:
+1. Monkey-patches the standard library for eventlet/gevent *before* importing
+   the app, so locks and sockets cooperate with the async hub.
+2. Opens the shared port with SO_REUSEPORT; the kernel spreads new
+   connections across workers.
+3. Joins the message queue, so a broadcast from any worker reaches clients on
+   every worker (see message_queue.py).
+4. Serves its own Prometheus metrics on METRICS_PORT_BASE + its index, since
+   /metrics on the shared port reaches a random worker.
+
+Because the workers share a port without sticky sessions, Socket.IO runs
+WebSocket-only in this mode. See the README for load balancer guidance.
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from config import SERVER_PORT, METRICS_PORT_BASE
+
+
+def run(workers, async_mode='eventlet', message_queue='local', host='0.0.0.0', port=SERVER_PORT):
+    """Starts the broker (if local) and supervises the worker processes until interrupted."""
+    if message_queue == 'local':
+        from message_queue import LocalBroker
+        path = os.path.join(tempfile.mkdtemp(prefix='metro-'), 'broker.sock')
+        LocalBroker(path).start()
+        message_queue = f"unix://{path}"
+        print(f"[INFO] Local message broker listening on {path}")
+
+    env = dict(os.environ, METRO_ASYNC_MODE=async_mode, METRO_MESSAGE_QUEUE=message_queue)
+    command = [sys.executable, os.path.abspath(__file__), '--worker', '--host', host, '--port', str(port)]
+
+    def start_worker(index):
+        return subprocess.Popen(command, env=dict(env, METRO_WORKER_INDEX=str(index)))
+
+    processes = [start_worker(i) for i in range(workers)]
+    print(f"--- Started {workers} {async_mode} workers on http://{host}:{port} ---")
+    print(f"[INFO] Worker metrics on ports {METRICS_PORT_BASE}-{METRICS_PORT_BASE + workers - 1} (/metrics)")
+
+    # SIGHUP to the supervisor reloads the dataset in every worker.
+    def forward_reload(signum, frame):
+        print("[INFO] Reloading the network in all workers...")
+        for process in processes:
+            process.send_signal(signal.SIGHUP)
+    signal.signal(signal.SIGHUP, forward_reload)
+
+    try:
+        while True:
+            for i, process in enumerate(processes):
+                if process.poll() is not None:
+                    print(f"[WARNING] Worker {process.pid} exited with code {process.returncode}; restarting it.")
+                    processes[i] = start_worker(i)
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\nStopping workers...")
+    finally:
+        for process in processes:
+            process.send_signal(signal.SIGTERM)
+        for process in processes:
+            process.wait()
+
+
+def reuse_port_socket(host, port):
+    """A listening socket that several processes can bind at the same time."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    return sock
+
+
+def worker_main(host, port):
+    """Entry point of one worker process (async mode and queue come from the environment)."""
+    async_mode = os.environ['METRO_ASYNC_MODE']
+    if async_mode == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+    elif async_mode == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+
+    from app import app  # noqa: E402 -- must come after monkey-patching
+    from routes import install_reload_signal  # noqa: E402
+    from telemetry import serve_metrics  # noqa: E402
+
+    install_reload_signal()
+    serve_metrics(METRICS_PORT_BASE + int(os.environ.get('METRO_WORKER_INDEX', 0)), async_mode)
+
+    listener = reuse_port_socket(host, port)
+    print(f"[INFO] Worker {os.getpid()} serving on port {port}")
+    if async_mode == 'eventlet':
+        import eventlet.wsgi
+        eventlet.wsgi.server(eventlet.greenio.GreenSocket(listener), app, log_output=False)
+    else:
+        from gevent import pywsgi
+        from geventwebsocket.handler import WebSocketHandler
+        pywsgi.WSGIServer(listener, app, handler_class=WebSocketHandler, log=None).serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs one realtime worker process (started by run()).")
+    parser.add_argument('--worker', action='store_true', required=True)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    args = parser.parse_args()
+    worker_main(args.host, args.port)
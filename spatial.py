@@ -0,0 +1,164 @@
+# spatial.py
+"""
+Fixed lat/lon grid used to group stations (and the trains at them) into
+cells, so that real-time clients can subscribe to a map viewport.
+
+StationIndex buckets the stations into the same grid cells, so that
+nearest-station and bounding-box lookups only look at the stations in the
+cells around the query instead of scanning every station.
+"""
+import math
+import numpy as np
+from config import GRID_CELL_DEGREES
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km. Works element-wise on NumPy arrays."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def valid_coordinate(lat, lon):
+    """True if lat is within [-90, 90] and lon within [-180, 180] (so neither is NaN or infinite)."""
+    return -90 <= lat <= 90 and -180 <= lon <= 180
+
+
+def cell_of(lat, lon, cell_degrees=GRID_CELL_DEGREES):
+    """Returns the (row, col) grid cell containing a coordinate."""
+    return math.floor(lat / cell_degrees), math.floor(lon / cell_degrees)
+
+
+def cell_key(cell):
+    """Room/key name of a grid cell, e.g. 'cell:156:5083'."""
+    return f"cell:{cell[0]}:{cell[1]}"
+
+
+def cells_in_bbox(south, west, north, east, cell_degrees=GRID_CELL_DEGREES):
+    """Lists every grid cell that overlaps a bounding box."""
+    row_min, col_min = cell_of(min(south, north), min(west, east), cell_degrees)
+    row_max, col_max = cell_of(max(south, north), max(west, east), cell_degrees)
+    return [(row, col) for row in range(row_min, row_max + 1) for col in range(col_min, col_max + 1)]
+
+
+class StationIndex:
+    """
+    Grid index over station coordinates. Stations without coordinates (NaN)
+    are left out of every lookup.
+
+    Args:
+        lats, lons (array): Station coordinates, indexed by station id.
+        cell_degrees (float): Grid cell size; defaults to the viewport grid.
+    """
+
+    def __init__(self, lats, lons, cell_degrees=GRID_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.located = np.flatnonzero(~(np.isnan(self.lats) | np.isnan(self.lons)))
+        rows = np.floor(self.lats[self.located] / cell_degrees).astype(np.int64)
+        cols = np.floor(self.lons[self.located] / cell_degrees).astype(np.int64)
+
+        # Grid cell of every station id (None without coordinates).
+        self.station_cells = [None] * len(self.lats)
+        for station_id, row, col in zip(self.located.tolist(), rows.tolist(), cols.tolist()):
+            self.station_cells[station_id] = (row, col)
+
+        # (row, col) -> station ids in that cell, from one sort by cell.
+        self.cells = {}
+        order = np.lexsort((cols, rows))
+        if len(order):
+            ids, rows, cols = self.located[order], rows[order], cols[order]
+            starts = np.flatnonzero(np.r_[True, (np.diff(rows) != 0) | (np.diff(cols) != 0)])
+            for start, end in zip(starts.tolist(), np.r_[starts[1:], len(ids)].tolist()):
+                self.cells[(int(rows[start]), int(cols[start]))] = ids[start:end]
+            self.row_range = (int(rows.min()), int(rows.max()))
+            self.col_range = (int(cols.min()), int(cols.max()))
+
+    def __len__(self):
+        return len(self.located)
+
+    def cell_of_station(self, station_id):
+        return self.station_cells[station_id]
+
+    def nearest(self, lat, lon, k=1):
+        """
+        The k stations closest to a point as (station ids, distances in km),
+        nearest first. Searches outwards ring by ring of grid cells until no
+        unsearched cell can hold a station closer than the k-th one found.
+        """
+        if not len(self.located) or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        k = min(k, len(self.located))
+        row, col = cell_of(lat, lon, self.cell_degrees)
+        # Rings needed to cover every cell; a query far outside the network scans everything instead.
+        max_ring = max(abs(row - self.row_range[0]), abs(row - self.row_range[1]),
+                       abs(col - self.col_range[0]), abs(col - self.col_range[1]))
+        found, distances = [], []
+        count, ring = 0, 0
+        while True:
+            if (2 * ring + 1) ** 2 > 4 * len(self.cells):
+                return self._closest(self.located, lat, lon, k)
+            parts = [self.cells[cell] for cell in self._ring(row, col, ring) if cell in self.cells]
+            if parts:
+                ids = np.concatenate(parts)
+                found.append(ids)
+                distances.append(haversine_km(lat, lon, self.lats[ids], self.lons[ids]))
+                count += len(ids)
+            if ring >= max_ring:
+                break
+            if count >= k:
+                kth = np.partition(np.concatenate(distances), k - 1)[k - 1]
+                if kth <= self._searched_radius_km(lat, lon, row, col, ring, kth):
+                    break
+            ring += 1
+        ids, km = np.concatenate(found), np.concatenate(distances)
+        best = np.argsort(km, kind='stable')[:k]
+        return ids[best], km[best]
+
+    def within(self, south, west, north, east):
+        """Ids (ascending) of the stations inside a bounding box, edges included."""
+        south, north = min(south, north), max(south, north)
+        west, east = min(west, east), max(west, east)
+        row_min, col_min = cell_of(south, west, self.cell_degrees)
+        row_max, col_max = cell_of(north, east, self.cell_degrees)
+        if (row_max - row_min + 1) * (col_max - col_min + 1) > len(self.cells):
+            candidates = self.located
+        else:
+            parts = [self.cells[(r, c)] for r in range(row_min, row_max + 1)
+                     for c in range(col_min, col_max + 1) if (r, c) in self.cells]
+            candidates = np.sort(np.concatenate(parts)) if parts else self.located[:0]
+        lats, lons = self.lats[candidates], self.lons[candidates]
+        return candidates[(lats >= south) & (lats <= north) & (lons >= west) & (lons <= east)]
+
+    def _ring(self, row, col, ring):
+        """The cells exactly `ring` steps (Chebyshev distance) from (row, col)."""
+        if ring == 0:
+            return [(row, col)]
+        top, bottom = row - ring, row + ring
+        cells = [(top, c) for c in range(col - ring, col + ring + 1)]
+        cells += [(bottom, c) for c in range(col - ring, col + ring + 1)]
+        cells += [(r, col - ring) for r in range(top + 1, bottom)]
+        cells += [(r, col + ring) for r in range(top + 1, bottom)]
+        return cells
+
+    def _searched_radius_km(self, lat, lon, row, col, ring, reach_km):
+        """
+        A lower bound on the distance from the point to any cell outside the
+        searched square of rings. Longitude degrees are converted at the
+        highest latitude within reach_km, where they are shortest.
+        """
+        cd = self.cell_degrees
+        lat_deg = min(lat - (row - ring) * cd, (row + ring + 1) * cd - lat)
+        lon_deg = min(lon - (col - ring) * cd, (col + ring + 1) * cd - lon)
+        widest_lat = min(abs(lat) + reach_km / KM_PER_DEGREE, 90.0)
+        return min(lat_deg * KM_PER_DEGREE, lon_deg * KM_PER_DEGREE * math.cos(math.radians(widest_lat)))
+
+    def _closest(self, candidates, lat, lon, k):
+        km = haversine_km(lat, lon, self.lats[candidates], self.lons[candidates])
+        best = np.argpartition(km, k - 1)[:k] if k < len(km) else np.arange(len(km))
+        best = best[np.argsort(km[best], kind='stable')]
+        return candidates[best], km[best]
@@ -0,0 +1,270 @@
+# telemetry.py
+"""
+In-process metrics and structured, sampled logging for the hot paths.
+
+Metrics are counters, gauges and histograms that render in the Prometheus
+text format (GET /metrics on the app; see metrics_response()). A labelled
+metric hands out one child per label combination; hot paths keep the child
+and update it with plain attribute/list arithmetic, without taking a lock.
+Under the GIL a simultaneous update from two threads can very rarely be lost,
+which is fine for monitoring and keeps each update well under a microsecond.
+Values that already exist elsewhere (cache statistics, viewer counts) are
+read at scrape time through callback metrics instead of being duplicated.
+
+log_event() writes one line per event in the usual "[LEVEL] ..." form,
+followed by the event name and key=value fields. Each event name prints at
+most LOG_EVENTS_PER_SECOND lines per second; the rest are dropped and their
+number is reported as suppressed=N on the next line that gets through.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from config import LOG_EVENTS_PER_SECOND
+
+# Seconds; from sub-millisecond cache hits to multi-second stalls.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_registry = []
+_registry_lock = threading.Lock()   # only taken when a metric or label child is created
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _label_text(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# --- Metric Types ---
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        with _registry_lock:
+            _registry.append(self)
+        if not self.labelnames and hasattr(self, '_new_child'):
+            # Unlabelled metrics update this child directly, and render as 0 before their first update.
+            self._default = self.labels()
+
+    def labels(self, *values):
+        """The child for one combination of label values (created on first use)."""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with _registry_lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self):
+        """Yields (suffix, label text, value) for every child."""
+        for values, child in list(self._children.items()):
+            yield '', _label_text(self.labelnames, values), child.value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{self.name}{suffix}{labels} {_number(value)}" for suffix, labels, value in self._samples()]
+        return lines
+
+
+class _Value:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    """A value that only goes up. Unlabelled counters are updated directly: counter.inc()."""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(Counter):
+    """A value that goes up and down."""
+    kind = 'gauge'
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+
+class _Buckets:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    """Observations counted into fixed buckets, e.g. request latencies in seconds."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            counts, cumulative = list(child.counts), 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '_bucket', _label_text(self.labelnames, values, f'le="{_number(bound)}"'), cumulative
+            yield '_sum', _label_text(self.labelnames, values), child.sum
+            yield '_count', _label_text(self.labelnames, values), cumulative
+
+
+class Callback(_Metric):
+    """
+    A metric read at scrape time. function() returns a number, or a dict of
+    {label value tuple: number} for a labelled metric.
+    """
+
+    def __init__(self, name, documentation, function, kind='gauge', labelnames=()):
+        self.function = function
+        self.kind = kind
+        super().__init__(name, documentation, labelnames)
+
+    def _samples(self):
+        try:
+            result = self.function()
+        except Exception as exc:  # a broken callback must not break the whole scrape
+            log_event('metric_callback_failed', level='WARNING', metric=self.name, error=exc)
+            return
+        items = result.items() if isinstance(result, dict) else [((), result)]
+        for values, value in items:
+            if value is not None:
+                yield '', _label_text(self.labelnames, values), value
+
+
+# --- Exposition ---
+
+PROCESS_START = time.time()
+Callback('metro_process_start_time_seconds', "Unix time the process started (labelled with its pid).",
+         lambda: {(os.getpid(),): PROCESS_START}, labelnames=('pid',))
+
+def render_metrics():
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def metrics_response():
+    """Flask view for GET /metrics."""
+    from flask import Response
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+def _metrics_app(environ, start_response):
+    """Minimal WSGI app for the standalone metrics listener."""
+    if environ.get('PATH_INFO') != '/metrics':
+        start_response('404 Not Found', [('Content-Type', 'text/plain')])
+        return [b'Not found\n']
+    body = render_metrics().encode('utf-8')
+    start_response('200 OK', [('Content-Type', CONTENT_TYPE), ('Content-Length', str(len(body)))])
+    return [body]
+
+def serve_metrics(port, async_mode=None, host='0.0.0.0'):
+    """
+    Serves /metrics on its own port in the background: used by each production
+    worker (whose main port is shared) and by data_generator.py.
+    """
+    if async_mode == 'eventlet':
+        import eventlet
+        import eventlet.wsgi
+        eventlet.spawn(eventlet.wsgi.server, eventlet.listen((host, port)), _metrics_app, log_output=False)
+    elif async_mode == 'gevent':
+        import gevent
+        from gevent import pywsgi
+        gevent.spawn(pywsgi.WSGIServer((host, port), _metrics_app, log=None).serve_forever)
+    else:
+        from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        server = make_server(host, port, _metrics_app, handler_class=QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    log_event('metrics_listening', port=port)
+
+
+# --- Structured, Sampled Logging ---
+
+LOG_LINES = Counter('metro_log_lines_total', "Log lines printed, by level.", ['level'])
+LOG_SUPPRESSED = Counter('metro_log_suppressed_total', "Log lines dropped by the per-event rate limit.", ['event'])
+
+_log_windows = {}   # event -> [window start, lines printed in it, suppressed since the last printed line]
+
+def _field(value):
+    text = value if isinstance(value, str) else json.dumps(value, default=str) \
+        if isinstance(value, (list, tuple, dict)) else str(value)
+    return json.dumps(text) if not text or any(c in text for c in ' ="') else text
+
+def log_event(event, level='INFO', **fields):
+    """
+    Prints '[LEVEL] event key=value ...' unless the event already printed
+    LOG_EVENTS_PER_SECOND lines in the current second. Returns True if printed.
+    """
+    now = time.monotonic()
+    window = _log_windows.get(event)
+    if window is None or now - window[0] >= 1.0:
+        suppressed = window[2] if window else 0
+        window = _log_windows[event] = [now, 0, suppressed]
+    if window[1] >= LOG_EVENTS_PER_SECOND:
+        window[2] += 1
+        LOG_SUPPRESSED.labels(event).inc()
+        return False
+    window[1] += 1
+    if window[2]:
+        fields['suppressed'] = window[2]
+        window[2] = 0
+    text = ' '.join(f"{key}={_field(value)}" for key, value in fields.items())
+    sys.stdout.write(f"[{level}] {event} {text}\n" if text else f"[{level}] {event}\n")
+    LOG_LINES.labels(level).inc()
+    return True
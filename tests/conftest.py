@@ -0,0 +1,32 @@
+# tests/conftest.py
+"""
+Shared fixtures. The tests run against the real db.sqlite (and its compiled
+artifact) at the project root; run them from anywhere with:
+    python -m pytest
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('METRO_DATABASE', os.path.join(ROOT, 'db.sqlite'))
+
+from flask import Flask  # noqa: E402
+
+import routes  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def net():
+    return routes.get_network()
+
+
+@pytest.fixture
+def client():
+    """A test client for the /api blueprint alone (no Socket.IO)."""
+    app = Flask(__name__)
+    app.register_blueprint(routes.api, url_prefix='/api')
+    routes.route_cache.clear()
+    return app.test_client()
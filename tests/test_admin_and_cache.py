@@ -0,0 +1,40 @@
+# tests/test_admin_and_cache.py
+"""Admin endpoint access and what the route cache stores."""
+import routes
+
+
+def test_admin_needs_token_outside_debug(client, monkeypatch):
+    monkeypatch.setattr(routes, 'ADMIN_TOKEN', None)
+    assert client.get('/api/admin/status').status_code == 403
+
+    monkeypatch.setattr(routes, 'ADMIN_TOKEN', 'secret')
+    assert client.get('/api/admin/status').status_code == 403
+    assert client.get('/api/admin/status', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    response = client.get('/api/admin/status', headers={'X-Admin-Token': 'secret'})
+    assert response.status_code == 200
+    assert response.get_json()["route_cache"]["entries"] == len(routes.route_cache)
+
+
+def test_admin_localhost_fallback_only_in_debug(client, monkeypatch):
+    monkeypatch.setattr(routes, 'ADMIN_TOKEN', None)
+    client.application.debug = True
+    assert client.get('/api/admin/status').status_code == 200
+    assert client.get('/api/admin/status', environ_base={'REMOTE_ADDR': '10.0.0.5'}).status_code == 403
+
+
+def test_unknown_stations_are_not_cached(client):
+    for i in range(20):
+        assert client.get(f'/api/route?from=junk{i}&to=KLCC').status_code == 404
+    assert len(routes.route_cache) == 0
+
+    assert client.get('/api/route?from=Bangsar&to=KLCC').status_code == 200
+    assert client.get('/api/route?from=Bangsar&to=KLCC').status_code == 200
+    assert len(routes.route_cache) == 1
+    assert routes.route_cache.stats()["hits"] >= 1
+
+
+def test_network_revalidates_with_etag(client):
+    response = client.get('/api/network')
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert client.get('/api/network', headers={'If-None-Match': etag}).status_code == 304
@@ -0,0 +1,66 @@
+# tests/test_artifact.py
+"""Versioned artifact directories: a reader always finds a complete artifact."""
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from network import compile_network, current_array_dir, load_artifact, save_artifact
+
+
+def small_network(fare):
+    names = ['A', 'B', 'C']
+    fares = np.array([[np.nan, fare, np.nan], [fare, np.nan, 1.0], [np.nan, 1.0, np.nan]])
+    times = np.where(np.isnan(fares), np.nan, 2.0)
+    return compile_network(names, np.zeros(3), np.zeros(3), fares, times, [(0, 1), (1, 2)], source='test')
+
+
+def test_versions_switch_and_old_ones_are_removed(tmp_path):
+    directory = str(tmp_path / 'db.network')
+    save_artifact(small_network(1.0), directory)
+    first = current_array_dir(directory)
+    save_artifact(small_network(2.0), directory)
+    second = current_array_dir(directory)
+    assert first != second and os.path.isdir(first)   # kept for readers that resolved it just before
+    assert load_artifact(directory).lookup_route('A', 'B')[1] == 2.0
+
+    save_artifact(small_network(3.0), directory)
+    assert not os.path.exists(first) and os.path.isdir(second)
+    assert sorted(os.listdir(directory)) == sorted(['CURRENT', os.path.basename(second),
+                                                     os.path.basename(current_array_dir(directory))])
+
+
+def test_unversioned_artifact_is_read_then_replaced(tmp_path):
+    directory = str(tmp_path / 'db.network')
+    save_artifact(small_network(1.0), directory)
+    # The layout before versions: the files directly in the directory.
+    legacy = str(tmp_path / 'legacy')
+    shutil.copytree(current_array_dir(directory), legacy)
+    assert load_artifact(legacy).lookup_route('A', 'B')[1] == 1.0
+
+    save_artifact(small_network(2.0), legacy)
+    assert load_artifact(legacy).lookup_route('A', 'B')[1] == 2.0
+    assert os.path.exists(os.path.join(legacy, 'meta.json'))   # still there for readers of the old layout
+    save_artifact(small_network(3.0), legacy)
+    assert not os.path.exists(os.path.join(legacy, 'meta.json'))
+
+
+def test_loading_during_writes_never_misses(tmp_path):
+    directory = str(tmp_path / 'db.network')
+    save_artifact(small_network(1.0), directory)
+    done = threading.Event()
+
+    def write():
+        for i in range(30):
+            save_artifact(small_network(1.0 + i), directory)
+        done.set()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    loads = 0
+    while not done.is_set():
+        assert load_artifact(directory) is not None
+        loads += 1
+    writer.join()
+    assert loads > 0
@@ -0,0 +1,45 @@
+# tests/test_batch.py
+"""/api/routes/batch: body formats, and malformed bodies refused before streaming."""
+import json
+
+import pytest
+
+
+def result_lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+@pytest.mark.parametrize('body', [
+    [["KLCC", "Kajang"], {"from": "Bangsar", "to": "KLCC"}],
+    {"pairs": [["KLCC", "Kajang"], {"from": "Bangsar", "to": "KLCC"}]},
+])
+def test_json_bodies(client, body):
+    response = client.post('/api/routes/batch?paths=0', json=body)
+    assert response.status_code == 200
+    lines = result_lines(response)
+    assert [(line["from"], line["to"]) for line in lines] == [("KLCC", "Kajang"), ("Bangsar", "KLCC")]
+    assert all("total_fare" in line and "path" not in line for line in lines)
+
+
+@pytest.mark.parametrize('data', [
+    '5', '"KLCC"', '{"pairs": 5}', '{"pairs": "KLCC"}', '{"other": []}', 'not json', '',
+    '[["KLCC"]]', '[["KLCC", 5]]', '[5]', '["KL"]', '{"pairs": [{"from": "KLCC"}]}',
+])
+def test_malformed_json_bodies_get_400(client, data):
+    response = client.post('/api/routes/batch', data=data, content_type='application/json')
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_csv_and_ndjson_bodies(client):
+    csv_body = "from,to\nKLCC,Kajang\nKLCC,Nowhere\n"
+    response = client.post('/api/routes/batch', data=csv_body, content_type='text/csv')
+    lines = result_lines(response)
+    assert lines[0]["path"][0] == "KLCC" and lines[0]["path"][-1] == "Kajang"
+    assert "error" in lines[1]
+
+    ndjson_body = '["KLCC", "Kajang"]\n5\n\nnot json\n["KLCC"]\n'
+    lines = result_lines(client.post('/api/routes/batch', data=ndjson_body, content_type='application/x-ndjson'))
+    assert len(lines) == 4 and "total_fare" in lines[0]
+    assert lines[1]["error"] == lines[3]["error"] == "Missing parameters"
+    assert lines[2]["error"] == "invalid JSON on line 4"
@@ -0,0 +1,44 @@
+# tests/test_geo.py
+"""/api/nearest, /api/stations/within and viewport subscriptions with bad coordinates."""
+import pytest
+
+from realtime import resolve_subscription
+
+
+def test_nearest(client):
+    response = client.get('/api/nearest?lat=3.1579&lon=101.7116&k=3')
+    assert response.status_code == 200
+    stations = response.get_json()["stations"]
+    assert len(stations) == 3 and stations[0]["name"] == "KLCC"
+
+
+@pytest.mark.parametrize('query', [
+    'lat=inf&lon=101.7', 'lat=3.1&lon=-inf', 'lat=nan&lon=101.7', 'lat=91&lon=101.7', 'lat=3.1&lon=180.5',
+    'lat=1e400&lon=0', 'lat=3.1', 'lat=x&lon=1',
+])
+def test_nearest_rejects_bad_coordinates(client, query):
+    response = client.get(f'/api/nearest?{query}')
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_within(client):
+    response = client.get('/api/stations/within?south=3.1&west=101.6&north=3.2&east=101.8')
+    assert response.status_code == 200
+    assert any(station["name"] == "KLCC" for station in response.get_json()["stations"])
+
+
+@pytest.mark.parametrize('query', [
+    'south=-inf&west=101.6&north=3.2&east=101.8', 'south=3.1&west=101.6&north=3.2&east=inf',
+    'south=3.1&west=nan&north=3.2&east=101.8', 'south=-91&west=101.6&north=3.2&east=101.8',
+    'south=3.1&west=101.6&north=3.2',
+])
+def test_within_rejects_bad_coordinates(client, query):
+    assert client.get(f'/api/stations/within?{query}').status_code == 400
+
+
+@pytest.mark.parametrize('bbox', [[float('-inf'), 101.6, 3.2, 101.8], [3.1, 101.6, 3.2, float('nan')],
+                                  [3.1, 101.6, 95, 101.8], ['x', 1, 2, 3], [1, 2, 3]])
+def test_subscription_rejects_bad_bbox(bbox):
+    with pytest.raises(ValueError):
+        resolve_subscription({"bbox": bbox})
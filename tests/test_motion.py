@@ -0,0 +1,60 @@
+# tests/test_motion.py
+"""MotionTable slots are freed and reused as trains come and go, and reloads forget removed trains."""
+import numpy as np
+
+import realtime
+from motion import MotionTable
+from network import compile_network
+
+
+def test_slots_are_reused():
+    table = MotionTable(capacity=4)
+    for short_id in range(1000):
+        table.travel(short_id, 0, 1, 10.0, 20.0)
+        if short_id >= 2:
+            table.remove(short_id - 2)
+    assert len(table) == 2 and table.size == 3 and len(table.active) == 4
+    assert table.segment(999) == [0, 1, 10.0, 20.0]
+    assert table.segment(5) is None
+
+
+def test_positions_report_short_ids():
+    table = MotionTable(capacity=2)
+    lats, lons = np.array([3.0, 3.2]), np.array([101.0, 101.2])
+    table.travel(7, 0, 1, 0.0, 10.0)
+    table.stop(9, 1)
+    table.remove(7)
+    table.travel(12, 0, 1, 0.0, 10.0)    # takes the slot train 7 left
+    ids, lat, lon = table.positions(5.0, lats, lons, 100)
+    assert dict(zip(ids.tolist(), zip(lat.tolist(), lon.tolist()))) == {9: (320, 10120), 12: (310, 10110)}
+
+
+def test_finished_trains_leave_the_motion_table(net):
+    station = net.station_names[0]
+    before = len(realtime.train_motion)
+    for i in range(50):
+        train_id = f"Train-test-{i}"
+        assert realtime.record_update(train_id, station)
+        realtime.record_finished(train_id)
+    assert len(realtime.train_motion) == before
+    assert realtime.train_motion.size <= before + 1
+    realtime.take_frames()
+
+
+def test_reload_forgets_finished_trains_at_removed_stations(net, monkeypatch):
+    monkeypatch.setattr(realtime.socketio, 'emit', lambda *args, **kwargs: None)   # no server to notify
+    realtime.state_network()
+    n = len(net) - 1
+    smaller = compile_network(net.station_names[1:], net.lats[1:], net.lons[1:], np.full((n, n), np.nan),
+                              np.full((n, n), np.nan), [], source='test')
+    realtime.take_frames()
+    assert realtime.record_update("Train-reload", net.station_names[0])
+    realtime.take_frames()
+    realtime.record_finished("Train-reload")
+    short_ids = set(realtime._gone)
+    try:
+        realtime.remap_fleet_state(net, smaller)
+        assert not short_ids & set(realtime._gone)
+        assert not short_ids & set(realtime.train_names)
+    finally:
+        realtime.remap_fleet_state(smaller, net)
@@ -0,0 +1,27 @@
+# tests/test_reachable.py
+"""/api/reachable limits and table mode."""
+import pytest
+
+
+def test_limits(client):
+    body = client.get('/api/reachable?from=KLCC&max_minutes=10').get_json()
+    assert body["count"] > 0
+    assert all(station["total_time_minutes"] <= 10 for station in body["stations"])
+    everything = client.get('/api/reachable?from=KLCC').get_json()
+    assert everything["count"] > body["count"]
+
+
+@pytest.mark.parametrize('query', [
+    'max_minutes=inf', 'max_minutes=-inf', 'max_minutes=nan', 'max_minutes=1e400', 'max_minutes=-1',
+    'max_fare=inf', 'max_fare=nan', 'max_fare=-0.5', 'max_fare=cheap',
+])
+def test_bad_limits_get_400(client, query):
+    response = client.get(f'/api/reachable?from=KLCC&{query}')
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_table(client, net):
+    body = client.get('/api/reachable?from=KLCC&table=1').get_json()
+    assert len(body["total_time_minutes"]) == len(net)
+    assert body["total_time_minutes"][net.station_ids["KLCC"]] == 0
@@ -0,0 +1,52 @@
+# tests/test_route_table.py
+"""The compiled all-pairs route table against the reference per-request BFS (routes.bfs_route)."""
+import numpy as np
+
+import routes
+from network import compile_network
+
+
+def reference_lookups(names, fares, times, connections):
+    graph = {}
+    for a, b in connections:
+        graph.setdefault(names[a], []).append(names[b])
+        graph.setdefault(names[b], []).append(names[a])
+    fare_lookup = {(names[o], names[d]): fares[o, d] for o, d in zip(*np.nonzero(~np.isnan(fares)))}
+    time_lookup = {(names[o], names[d]): times[o, d] for o, d in zip(*np.nonzero(~np.isnan(times)))}
+    return graph, fare_lookup, time_lookup
+
+
+def test_table_matches_bfs_on_small_network():
+    # A ring of six stations plus a spur, an isolated station, and missing segment data.
+    names = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
+    connections = [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 0), (2, 6)]
+    n = len(names)
+    fares = np.full((n, n), np.nan)
+    times = np.full((n, n), np.nan)
+    for a, b in connections:
+        for u, v in ((a, b), (b, a)):
+            fares[u, v], times[u, v] = 0.5 + u + v / 10, 2 + u + v
+    fares[2, 6] = times[2, 6] = np.nan      # no data on C -> G
+    fares[3, 4] = np.nan                    # and no fare on D -> E
+    net = compile_network(names, np.zeros(n), np.zeros(n), fares, times, connections, source='test')
+
+    graph, fare_lookup, time_lookup = reference_lookups(names, fares, times, connections)
+    for origin in names:
+        for destination in names:
+            if origin == destination:
+                continue
+            expected = routes.bfs_route(graph, fare_lookup, time_lookup, origin, destination)
+            actual = net.lookup_route(origin, destination)
+            if expected is None:
+                assert actual is None, (origin, destination)
+                continue
+            path, fare, minutes, incomplete = actual
+            assert path == expected[0], (origin, destination)
+            assert round(fare, 2) == round(float(expected[1]), 2), (origin, destination)
+            assert int(minutes) == int(expected[2]), (origin, destination)
+    assert net.lookup_route('A', 'G')[3] is True
+    assert net.lookup_route('A', 'H') is None
+
+
+def test_table_matches_bfs_on_dataset(net):
+    assert routes.verify_route_table() == []
@@ -0,0 +1,45 @@
+# tests/test_routing.py
+"""The routing engine agrees with the route table on what a hop and a route's totals are."""
+import pytest
+
+import routes
+
+
+def test_best_hops_route_does_not_depend_on_k(net):
+    engine = routes.get_routing_engine()
+    for origin in net.station_names:
+        for destination in net.station_names:
+            if origin == destination:
+                continue
+            best, status = routes.find_routes(net, engine, origin, destination, 'hops', 1, 'astar')
+            with_alternatives, _ = routes.find_routes(net, engine, origin, destination, 'hops', 2, 'astar')
+            if status != 200:
+                assert "error" in with_alternatives
+                continue
+            for field in ('path', 'total_fare', 'total_time_minutes'):
+                assert with_alternatives[field] == best[field], (origin, destination, field)
+
+
+def test_path_totals_match_route_table(net):
+    engine = routes.get_routing_engine()
+    for o in range(len(net)):
+        for d in range(len(net)):
+            if o == d or net.route_pred[o, d] < 0:
+                continue
+            fare, minutes, _, incomplete = engine.path_totals(net.table_path_ids(o, d))
+            assert fare == pytest.approx(net.route_fare[o, d])
+            assert int(minutes) == int(net.route_time[o, d])
+            assert incomplete == bool(net.route_incomplete[o, d])
+
+
+def test_shortest_path_tree_matches_path_totals(net):
+    engine = routes.get_routing_engine()
+    pred, minutes, fares, _, incomplete = engine.shortest_path_tree(0, 'time')
+    for v in range(1, len(net)):
+        if pred[v] < 0:
+            continue
+        path = [v]
+        while path[-1] != 0:
+            path.append(pred[path[-1]])
+        fare, total_minutes, _, path_incomplete = engine.path_totals(path[::-1])
+        assert (fares[v], minutes[v], incomplete[v]) == pytest.approx((fare, total_minutes, path_incomplete))
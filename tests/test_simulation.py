@@ -0,0 +1,116 @@
+# tests/test_simulation.py
+"""Simulation jobs: scheduler placement and data generator reconnects."""
+import time
+
+import numpy as np
+import pytest
+import socketio
+
+import data_generator
+from fleet import FleetSimulator
+from scheduler import SimulationScheduler
+
+
+def make_scheduler():
+    return SimulationScheduler('host/0', requests_per_minute=60, burst=100, max_jobs=100, job_timeout=600)
+
+
+def placements(scheduler):
+    return {job_id: job["generator"] for job_id, job in scheduler.jobs.items()}
+
+
+def test_jobs_move_off_a_generator_that_disconnects():
+    scheduler = make_scheduler()
+    scheduler.register('gen-a')
+    scheduler.register('gen-b')
+    jobs = [scheduler.submit('kiosk', ['KLCC', f"Stop {i}"])[0]["id"] for i in range(4)]
+    assert sorted(placements(scheduler).values()) == ['gen-a', 'gen-a', 'gen-b', 'gen-b']
+
+    # gen-a drops and comes back with a new sid: its jobs now run on gen-b only.
+    events = scheduler.unregister('gen-a')
+    assert {event[4] for event in events if event[0] == 'job'} == {'gen-b'}
+    scheduler.register('gen-a2')
+    assert set(placements(scheduler).values()) == {'gen-b'}
+    assert sum(len(job_ids) for job_ids in scheduler.generators.values()) == len(jobs)
+
+
+def test_jobs_queue_while_no_generator_is_connected():
+    scheduler = make_scheduler()
+    scheduler.register('gen-a')
+    job, created, _ = scheduler.submit('kiosk', ['KLCC', 'Kajang'])
+    assert created and scheduler.submit('other kiosk', ['KLCC', 'Kajang'])[1] is False
+    scheduler.unregister('gen-a')
+    assert scheduler.counts() == {'running': 0, 'queued': 1}
+    events = scheduler.register('gen-a2')
+    assert ('job', job["id"], ['KLCC', 'Kajang'], 'host/0', 'gen-a2') in events
+    with pytest.raises(ValueError):
+        for _ in range(200):
+            scheduler.submit('kiosk', ['KLCC', 'Kajang'])
+
+
+def test_rate_limit_survives_reconnects_until_refilled():
+    scheduler = SimulationScheduler('host/0', requests_per_minute=6, burst=2, max_jobs=100, job_timeout=600)
+    scheduler.submit('10.0.0.5', ['KLCC', 'Kajang'], now=0.0)
+    scheduler.submit('10.0.0.5', ['KLCC', 'Ampang'], now=0.0)
+    scheduler.unregister('kiosk-sid')
+    with pytest.raises(ValueError):
+        scheduler.submit('10.0.0.5', ['KLCC', 'Gombak'], now=1.0)
+    scheduler.expire(now=5.0)
+    assert '10.0.0.5' in scheduler._buckets
+    scheduler.expire(now=30.0)   # 6 per minute: two tokens back after 20 s
+    assert scheduler._buckets == {}
+
+
+def test_expire_drops_timed_out_jobs_without_a_submit():
+    scheduler = make_scheduler()
+    scheduler.register('gen-a')
+    job = scheduler.submit('kiosk', ['KLCC', 'Kajang'])[0]
+    scheduler.expire(now=job["since"] + 599)
+    assert scheduler.counts() == {'running': 1, 'queued': 0}
+    scheduler.expire(now=job["since"] + 600)
+    assert scheduler.counts() == {'running': 0, 'queued': 0}
+    assert scheduler.generators == {'gen-a': set()}
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    """data_generator's handlers on a three-station fleet, with a real Socket.IO client that is not connected."""
+    names = ['A', 'B', 'C']
+    minutes = np.full((3, 3), 2.0)
+    monkeypatch.setattr(data_generator, 'fleet', FleetSimulator(names, np.zeros(3), np.zeros(3), minutes))
+    monkeypatch.setattr(data_generator, 'sio', socketio.Client())
+    for name in ('jobs', 'held_finished', 'held_jobs_done'):
+        monkeypatch.setattr(data_generator, name, {} if name == 'jobs' else [])
+    return data_generator.sio
+
+
+def test_generator_keeps_ticking_while_disconnected(generator):
+    fleet = data_generator.fleet
+    data_generator.on_new_route({'path': ['A', 'B', 'C'], 'job_id': 'job-1'})
+    data_generator.on_new_route({'path': ['C', 'B'], 'job_id': 'job-2'})
+    data_generator.emit_arrivals(*fleet.tick(1.0))
+    assert fleet.active_count() == 2
+
+    # The connection drops: the job trains stop, and nothing is sent until it is back.
+    data_generator.disconnect()
+    data_generator.emit_arrivals(*fleet.tick(2.0))
+    assert fleet.active_count() == 0
+    assert sorted(data_generator.held_finished) == ['Train-1000', 'Train-1001']
+    assert data_generator.held_jobs_done == [] and data_generator.jobs == {}
+
+
+def test_generator_holds_finished_jobs_until_reconnected(generator, monkeypatch):
+    fleet = data_generator.fleet
+    data_generator.on_new_route({'path': ['A', 'B'], 'job_id': 'job-1'})   # departs now, on the monotonic clock
+    now = time.monotonic()
+    data_generator.emit_arrivals(*fleet.tick(now + 1))
+    # connected but without the namespace joined yet: emit() raises BadNamespaceError.
+    monkeypatch.setattr(generator, 'connected', True)
+    data_generator.emit_arrivals(*fleet.tick(now + 1000))
+    assert data_generator.held_finished == ['Train-1000'] and data_generator.held_jobs_done == ['job-1']
+
+    sent = []
+    monkeypatch.setattr(generator, 'emit', lambda event, message: sent.append(message))
+    data_generator.emit_arrivals(*fleet.tick(now + 1001))
+    assert sent == [{'updates': [], 'finished': ['Train-1000'], 'jobs_done': ['job-1']}]
+    assert data_generator.held_finished == [] and data_generator.held_jobs_done == []
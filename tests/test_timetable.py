@@ -0,0 +1,73 @@
+# tests/test_timetable.py
+"""Timetable journeys (/api/route?depart_at=...) and GTFS time parsing."""
+import csv
+import os
+
+import pytest
+
+import routes
+from gtfs import import_feed, parse_time
+from raptor import RaptorEngine, parse_clock
+
+
+def write_rows(directory, filename, header, rows):
+    with open(os.path.join(directory, filename), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+@pytest.fixture
+def timetable_client(client, net, tmp_path, monkeypatch):
+    """The test client with a one-line timetable A -> B -> C, a train every 10 minutes from 08:00."""
+    feed = tmp_path / 'feed'
+    feed.mkdir()
+    write_rows(feed, 'stops.txt', ['stop_id', 'stop_name', 'stop_lat', 'stop_lon'],
+               [(s, s, 3.0, 101.0 + i * 0.01) for i, s in enumerate('ABC')])
+    write_rows(feed, 'routes.txt', ['route_id', 'route_short_name', 'route_type'], [('L1', 'L1', 1)])
+    trips = [f"T{start}" for start in range(8 * 60, 9 * 60, 10)]
+    write_rows(feed, 'trips.txt', ['route_id', 'service_id', 'trip_id'], [('L1', 'daily', trip) for trip in trips])
+    # Some feeds write times without seconds.
+    write_rows(feed, 'stop_times.txt', ['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence'],
+               [(trip, f"{(int(trip[1:]) + 3 * seq) // 60}:{(int(trip[1:]) + 3 * seq) % 60:02d}",
+                 f"{(int(trip[1:]) + 3 * seq) // 60}:{(int(trip[1:]) + 3 * seq) % 60:02d}", stop, seq + 1)
+                for trip in trips for seq, stop in enumerate('ABC')])
+    timetable = import_feed(str(feed), str(tmp_path / 'timetable'))
+    monkeypatch.setattr(routes, '_loaded', (net, routes.get_routing_engine(), RaptorEngine(timetable)))
+    return client
+
+
+def test_journey(timetable_client):
+    response = timetable_client.get('/api/route?from=A&to=C&depart_at=08:05')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["path"] == ["A", "B", "C"]
+    assert body["arrival"] == "08:16:00" and body["total_time_minutes"] == 11
+
+
+def test_same_station_is_a_zero_length_journey(timetable_client):
+    body = timetable_client.get('/api/route?from=B&to=B&depart_at=08:05:30').get_json()
+    assert body["path"] == ["B"] and body["path_description"] == "B"
+    assert body["total_time_minutes"] == 0 and body["transfers"] == 0 and body["legs"] == []
+    assert body["arrival"] == body["depart_at"] == "08:05:30"
+
+
+@pytest.mark.parametrize('depart_at', ['', '8', '08:60', '08:00:00:00', 'noon', '²:00', '08:-1', '99:00'])
+def test_malformed_departure_times_get_400(timetable_client, depart_at):
+    response = timetable_client.get('/api/route', query_string={'from': 'A', 'to': 'C', 'depart_at': depart_at})
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_unknown_timetable_station(timetable_client):
+    assert timetable_client.get('/api/route?from=A&to=Nowhere&depart_at=08:00').status_code == 404
+
+
+def test_time_parsing():
+    assert parse_clock('08:30') == parse_clock('08:30:00') == 8 * 3600 + 30 * 60
+    assert parse_time('8:05') == parse_time('8:05:00') == 29100
+    assert parse_time('25:10:00') == 25 * 3600 + 600
+    assert parse_time('') == -1
+    for text in ('8', '8:5x', '8:60:00', '8:00:00:00'):
+        with pytest.raises(ValueError):
+            parse_time(text)